@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Fleet batch mode: run the complete pipeline for many line segments in parallel.
+
+A manifest lists the segments. Each one has a name and either a workbook (ingested into
+the segment's own data/ folder) or a data_folder that already holds its r_* runs:
+
+    {"segments": [
+        {"name": "seg-001", "workbook": "workbooks/seg-001.xlsx"},
+        {"name": "seg-002", "data_folder": "exports/seg-002"}
+    ]}
+
+A CSV manifest with name, workbook and data_folder columns works too. Relative paths are
+resolved against the manifest's folder.
+
+Every segment writes to <output_root>/<name>/ (processed/, extracted/, aligned/, features/,
+its own stage cache, completion markers, run report and pipeline.log), so segments
+never share a file.
+Segments go to a process pool largest input first, so the longest ones do not start last
+and hold up the batch. A segment that fails is logged and recorded; the others carry on.
+A worker process that dies (e.g. killed for memory) takes its pool down, so the segments
+that were still pending are retried, each in a process of its own. The batch ends with
+<output_root>/batch_summary.json.
+
+With --resume every segment restarts at its first incomplete stage (see
+pre_processing/checkpoint.py), so rerunning a batch after a failure or a lost machine
+repeats at most the stage each segment was in; segments that finished skip every stage.
+
+Usage: python batch.py MANIFEST --output-root DIR [--workers N] [--resume]
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from full_pipeline import ingest_cached
+from pre_processing import instrument, parallel, storage
+from pre_processing.pipeline import run_pipeline
+
+SUMMARY_FILE = "batch_summary.json"
+LOG_FILE = "pipeline.log"
+REPORT_FILE = os.path.join("reports", "pipeline.json")
+FINAL_STEM = "merged_by_distance_corrected"
+
+
+def _resolve(path, base):
+    if not path:
+        return None
+    path = os.path.expanduser(path)
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(base, path))
+
+
+def load_manifest(path):
+    """
+    Read a JSON or CSV manifest.
+
+    Returns:
+        List of segment dicts with name, workbook and data_folder (absolute paths or None)
+
+    Raises:
+        ValueError: When a segment has neither input, or names repeat or are not plain folder names
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            entries = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries["segments"]
+
+    segments = []
+    for i, entry in enumerate(entries):
+        workbook = _resolve(entry.get("workbook"), base)
+        data_folder = _resolve(entry.get("data_folder"), base)
+        if not workbook and not data_folder:
+            raise ValueError(f"Segment {i} has neither a workbook nor a data_folder")
+        name = entry.get("name") or os.path.splitext(os.path.basename(workbook or data_folder.rstrip(os.sep)))[0]
+        if os.path.basename(name) != name or name in (".", ".."):
+            raise ValueError(f"Segment name {name!r} is not a plain folder name")
+        segments.append({"name": name, "workbook": workbook, "data_folder": data_folder})
+
+    names = [segment["name"] for segment in segments]
+    repeated = sorted({name for name in names if names.count(name) > 1})
+    if repeated:
+        raise ValueError(f"Segment names must be unique; repeated: {repeated}")
+    return segments
+
+
+def segment_size(segment):
+    """Bytes of a segment's input: its workbook, or the r_* runs in its data folder (0 if missing)."""
+    if segment["workbook"]:
+        paths = [segment["workbook"]]
+    else:
+        paths = glob.glob(os.path.join(segment["data_folder"], "r_*"))
+    return sum(os.path.getsize(p) for p in paths if os.path.isfile(p))
+
+
+def _stage_summary(report):
+    return {
+        record["name"]: {
+            "wall_seconds": record["wall_seconds"],
+            "rows_in": record["rows_in"],
+            "rows_out": record["rows_out"],
+            "rows_dropped": record["rows_dropped"],
+            "cached": record["cached"],
+        }
+        for record in report["stages"]
+    }
+
+
+def run_segment(task):
+    """
+    Worker: ingest (when given a workbook) and run every stage for one segment.
+
+    Output goes to the segment's log file. Errors are caught and recorded, never raised.
+
+    Returns:
+        The segment's summary dict (status 'ok' or 'failed')
+    """
+    segment, output_root, fmt, use_cache, compact, resume = task
+    folder = os.path.join(output_root, segment["name"])
+    os.makedirs(folder, exist_ok=True)
+    result = {
+        "name": segment["name"],
+        "status": "ok",
+        "error": None,
+        "input_bytes": segment_size(segment),
+        "folder": folder,
+        "log": os.path.join(folder, LOG_FILE),
+    }
+    start = time.perf_counter()
+    with open(result["log"], "a" if resume else "w") as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            fingerprints = {}
+            data_folder = segment["data_folder"]
+            if segment["workbook"]:
+                data_folder = os.path.join(folder, "data")
+                # Converting the workbook again would touch the raw runs and make every stage incomplete
+                fingerprints["raw"] = ingest_cached(
+                    segment["workbook"], data_folder, os.path.join(folder, ".cache"), fmt, use_cache or resume
+                )
+            state = run_pipeline(
+                write=True,
+                output_folder=folder,
+                data_folder=data_folder,
+                fmt=fmt,
+                use_cache=use_cache,
+                input_fingerprints=fingerprints,
+                compact=compact,
+                resume=resume,
+                report=os.path.join(folder, REPORT_FILE),
+            )
+            result["report"] = os.path.join(folder, REPORT_FILE)
+            result["rows_dropped"] = state["report"]["rows_dropped"]
+            result["stages"] = _stage_summary(state["report"])
+            result["resumed"] = state["report"]["resumed"]
+            result["output"] = storage.find_artifact(os.path.join(folder, "aligned"), FINAL_STEM)
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+    result["wall_seconds"] = time.perf_counter() - start
+    return result
+
+
+def _crashed(segment, output_root, error):
+    folder = os.path.join(output_root, segment["name"])
+    log = os.path.join(folder, LOG_FILE)
+    return {
+        "name": segment["name"],
+        "status": "failed",
+        "error": error,
+        "input_bytes": segment_size(segment),
+        "folder": folder,
+        # Whatever the segment logged before its process died
+        "log": log if os.path.exists(log) else None,
+        "wall_seconds": 0.0,
+    }
+
+
+def _run_pool(tasks, workers, on_result):
+    """Run tasks in one pool. Returns the tasks whose worker died before they finished."""
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_segment, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                on_result(future.result())
+            except BrokenProcessPool:
+                unfinished.append(futures[future])
+    return unfinished
+
+
+def run_batch(
+    segments, output_root, workers=0, fmt=storage.DEFAULT_FORMAT, use_cache=True, compact=False, resume=False
+):
+    """
+    Run every segment of a manifest, largest first, in a process pool.
+
+    Args:
+        segments: Segment dicts from load_manifest
+        output_root: Parent folder of the per-segment output folders
+        workers: Segments run at the same time; 0 or None means one per CPU
+        fmt, use_cache, compact: Passed to run_pipeline for every segment
+        resume: Restart every segment from its first incomplete stage; its log is appended to
+
+    Returns:
+        The batch summary (also written to <output_root>/batch_summary.json)
+    """
+    os.makedirs(output_root, exist_ok=True)
+    segments = sorted(segments, key=segment_size, reverse=True)
+    tasks = [(segment, output_root, fmt, use_cache, compact, resume) for segment in segments]
+    workers = min(parallel.resolve_workers(workers), max(1, len(tasks)))
+    results = {}
+    start = time.perf_counter()
+
+    def on_result(result):
+        results[result["name"]] = result
+        line = f"[{len(results)}/{len(tasks)}] {result['name']}: {result['status']} in {result['wall_seconds']:.1f} s"
+        if result["error"]:
+            line += f" - {result['error']}" + (f" (see {result['log']})" if result["log"] else "")
+        print(line)
+
+    print(f"Running {len(tasks)} segment(s) with {workers} worker(s), largest first")
+    unfinished = _run_pool(tasks, workers, on_result)
+    # A dead worker breaks the whole pool; rerun each unfinished segment in a pool of its own
+    # so a segment that keeps crashing is the only one that fails
+    for task in unfinished:
+        if _run_pool([task], 1, on_result):
+            on_result(_crashed(task[0], output_root, "worker process died"))
+
+    ordered = [results[segment["name"]] for segment in segments]
+    summary = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": instrument.environment(),
+        "settings": {"workers": workers, "format": fmt, "use_cache": use_cache, "compact": compact, "resume": resume},
+        "wall_seconds": time.perf_counter() - start,
+        "segments_total": len(ordered),
+        "segments_ok": sum(r["status"] == "ok" for r in ordered),
+        "segments_failed": sum(r["status"] == "failed" for r in ordered),
+        "rows_dropped": sum(r.get("rows_dropped", 0) for r in ordered),
+        "segments": ordered,
+    }
+    path = os.path.join(output_root, SUMMARY_FILE)
+    storage.write_json(summary, path)
+    print(
+        f"\n{summary['segments_ok']} of {len(ordered)} segment(s) succeeded in {summary['wall_seconds']:.1f} s; "
+        f"summary saved to {path}"
+    )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline for every segment in a manifest")
+    parser.add_argument("manifest", help="JSON or CSV manifest of segments")
+    parser.add_argument("--output-root", required=True, help="Folder for the per-segment outputs and the summary")
+    parser.add_argument("--workers", type=int, default=0, help="Segments to run at once (0 = one per CPU)")
+    parser.add_argument("--format", choices=storage.FORMATS, default=storage.DEFAULT_FORMAT)
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every stage of every segment")
+    parser.add_argument("--compact", action="store_true", help="Keep stage outputs in compact dtypes")
+    parser.add_argument("--resume", action="store_true", help="Restart every segment at its first incomplete stage")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        load_manifest(args.manifest),
+        args.output_root,
+        args.workers,
+        args.format,
+        not args.no_cache,
+        args.compact,
+        args.resume,
+    )
+    return 0 if summary["segments_failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
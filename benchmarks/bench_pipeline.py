@@ -0,0 +1,170 @@
+"""
+Scaling benchmark: time and memory of every pipeline stage on synthetic data.
+
+Each size runs in a fresh process: the runs are generated with data/synthetic.py and
+written to a temporary folder, then the pipeline stages run one after the other in
+memory, as run_pipeline does (nothing is written and the stage cache is not used).
+Every stage is measured as in the pipeline's run report (instrument.StageMeter: wall
+and CPU time, rows, peak RSS, frame sizes) plus the peak memory allocated while it ran
+(tracemalloc, which sees NumPy and pandas buffers; work done in --workers processes
+is not traced). The process also reports its peak RSS, so each size gets its own
+high-water mark.
+
+Results are written as JSON, together with the scaling exponent of every stage between
+consecutive sizes (1.0 is linear; a stage drifting towards 2 is where scaling breaks
+down).
+
+Usage: python -m benchmarks.bench_pipeline [--sizes 1000 10000 100000] [--output FILE]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from data import synthetic
+from pre_processing import instrument, memory, pipeline
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _run_stage(stage, value, ctx, trace_memory, verbose):
+    """Run one stage and return (output, its instrument.StageMeter record)."""
+    if trace_memory:
+        tracemalloc.start()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    output_stream = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output_stream, instrument.StageMeter(stage["name"]) as meter:
+        meter.input(value)
+        output = stage["run"](value, ctx)
+        meter.output(output)
+    result = meter.record
+    if trace_memory:
+        result["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1] - start_bytes
+        tracemalloc.stop()
+    return output, result
+
+
+def bench_size(n_features, seed=0, workers=1, compact=False, trace_memory=True, verbose=False):
+    """
+    Generate one synthetic line and run every pipeline stage on it.
+
+    Returns:
+        dict with the size, rows per run, generation time, one entry per stage and the
+        peak RSS of the process
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        runs = synthetic.generate_runs(n_features, seed=seed)
+        generate_seconds = time.perf_counter() - start
+        rows = {name: len(df) for name, df in runs.items()}
+        data_folder = os.path.join(tmp, "data")
+        synthetic.write_runs(runs, data_folder)
+        del runs
+
+        # Stages reset the RSS high-water mark, so the process peak is the largest of these
+        peak_rss = instrument.peak_rss_bytes()
+        ctx = pipeline.stage_context(tmp, data_folder, workers=workers, compact=compact)
+        state = {}
+        stages = []
+        for stage in pipeline.STAGES:
+            value = pipeline._stage_input(stage, state, ctx)
+            output, result = _run_stage(stage, value, ctx, trace_memory, verbose)
+            if compact:
+                output = memory.compact(output)
+            state[stage["output"]] = output
+            stages.append(result)
+            peak_rss = max(peak_rss, result["peak_rss_bytes"])
+
+    return {
+        "features": n_features,
+        "rows": rows,
+        "generate_seconds": generate_seconds,
+        "stages": stages,
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def scaling_exponents(results):
+    """
+    Per stage, log(time ratio) / log(size ratio) between consecutive sizes.
+
+    Returns:
+        dict mapping stage name to a list of {"from", "to", "exponent"}
+    """
+    results = sorted(results, key=lambda r: r["features"])
+    exponents = {}
+    for small, large in zip(results, results[1:]):
+        size_ratio = large["features"] / small["features"]
+        for a, b in zip(small["stages"], large["stages"]):
+            if a["wall_seconds"] <= 0 or size_ratio <= 1:
+                continue
+            exponent = math.log(b["wall_seconds"] / a["wall_seconds"]) / math.log(size_ratio)
+            exponents.setdefault(a["name"], []).append(
+                {"from": small["features"], "to": large["features"], "exponent": exponent}
+            )
+    return exponents
+
+
+def print_results(results):
+    print(f"\n{'features':>10}  {'stage':<12} {'wall s':>9} {'cpu s':>9} {'peak':>10} {'output':>10}")
+    for result in results:
+        for stage in result["stages"]:
+            peak = stage.get("peak_traced_bytes")
+            print(
+                f"{result['features']:>10}  {stage['name']:<12} {stage['wall_seconds']:>9.3f} "
+                f"{stage['cpu_seconds']:>9.3f} {memory.format_bytes(peak) if peak is not None else '-':>10} "
+                f"{memory.format_bytes(stage['frame_bytes_out']):>10}"
+            )
+        print(f"{result['features']:>10}  {'peak RSS':<12} {memory.format_bytes(result['peak_rss_bytes']):>41}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile every pipeline stage on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Features per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the per-run stages")
+    parser.add_argument("--compact", action="store_true", help="Benchmark compact mode (see pre_processing/memory.py)")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip per-stage peak memory (faster)")
+    parser.add_argument("--verbose", action="store_true", help="Show the stages' own output")
+    parser.add_argument("--output", default=None, help="JSON file (default benchmarks/results/pipeline_<time>.json)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_features in args.sizes:
+        print(f"Benchmarking {n_features} features per run...")
+        # A fresh process per size keeps peak RSS and allocator state independent
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(
+                executor.submit(
+                    bench_size, n_features, args.seed, args.workers, args.compact, not args.no_tracemalloc, args.verbose
+                ).result()
+            )
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": instrument.environment(),
+        "settings": {"seed": args.seed, "workers": args.workers, "compact": args.compact},
+        "results": results,
+        "scaling": scaling_exponents(results),
+    }
+    print_results(results)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f"pipeline_{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved benchmark results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Single command-line entry point for the pipeline.
+
+    python cli.py ingest WORKBOOK       Convert the workbook sheets into data/r_* artifacts
+    python cli.py preprocess            Read the schema columns and clean every run
+    python cli.py extract               Split the processed runs by feature class
+    python cli.py align                 Match welds across runs and build the drift model
+    python cli.py correct               Apply the drift correction and place every feature
+    python cli.py growth                Match metal loss across runs and compute its growth
+    python cli.py run                   All stages, preprocess to growth
+    python cli.py batch MANIFEST        Run every segment of a fleet manifest (see batch.py)
+    python cli.py report [PATH ...]     Show artifacts and the latest run report
+    python cli.py serve                 Answer lookups over the outputs via HTTP (see query_service.py)
+
+Stage commands run through pre_processing/pipeline.py, so a stage whose input is not
+in memory loads it from the previous stage's artifacts, and unchanged stages come from
+the cache. Each command imports pandas, NumPy and the pipeline modules only when it
+runs; `report` reads artifact headers with zipfile and json alone, so inspecting
+outputs starts in a fraction of a second.
+"""
+import argparse
+import ast
+import glob
+import importlib
+import json
+import os
+import sys
+import zipfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_FOLDER = os.path.join(ROOT, "pre_processing")
+DATA_FOLDER = os.path.join(ROOT, "data")
+
+# Pipeline stages behind each stage command
+COMMAND_STAGES = {
+    "preprocess": ["preprocess"],
+    "extract": ["extract"],
+    "align": ["align"],
+    "correct": ["correct", "features"],
+    "growth": ["growth"],
+    "run": None,
+}
+
+# Artifact folders listed by `report`, under the output folder
+REPORT_FOLDERS = ["processed", "extracted", "aligned", "features", "growth"]
+
+# Member holding the JSON header of an .npz artifact (storage._HEADER_KEY)
+_NPZ_HEADER = "__header__.npy"
+
+
+class _ModuleChoices:
+    """
+    Choices of an option from a constant of a pipeline module (e.g. storage.FORMATS). The
+    module is imported only when a value is checked or listed, so building the parser
+    stays free of NumPy and pandas; options using it need a metavar, which keeps
+    argparse from listing the choices while the parser is built.
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def _values(self):
+        return getattr(importlib.import_module(self.module), self.name)
+
+    def __contains__(self, value):
+        return value in self._values()
+
+    def __iter__(self):
+        return iter(self._values())
+
+
+FORMATS = _ModuleChoices("pre_processing.storage", "FORMATS")
+MATCH_METHODS = _ModuleChoices("pre_processing.align", "MATCH_METHODS")
+
+
+def _ingest(args):
+    from data import load_data
+
+    load_data.ingest_workbook(args.workbook, args.output, args.format, args.workers)
+    return 0
+
+
+def _run_stages(args):
+    from pre_processing.pipeline import run_pipeline
+
+    stages = COMMAND_STAGES[args.command]
+    run_pipeline(
+        stages=stages,
+        write=True,
+        output_folder=args.output_folder,
+        data_folder=args.data_folder,
+        fmt=args.format,
+        use_cache=not args.no_cache,
+        force=(stages or []) if args.force else (),
+        workers=args.workers,
+        chunksize=args.chunksize,
+        compact=args.compact,
+        iterative=args.iterative,
+        matching=args.matching,
+        resume=args.resume,
+        report=args.report or True,
+        profile=(stages or True) if args.profile else (),
+    )
+    return 0
+
+
+def _batch(args):
+    import batch
+
+    return batch.main([
+        args.manifest, "--output-root", args.output_root, "--workers", str(args.workers), "--format", args.format,
+        *(["--no-cache"] if args.no_cache else []), *(["--compact"] if args.compact else []),
+        *(["--resume"] if args.resume else []),
+    ])
+
+
+def _serve(args):
+    import query_service
+
+    return query_service.main([
+        "--output-folder", args.output_folder, "--host", args.host, "--port", str(args.port), "--poll", str(args.poll),
+    ])
+
+
+# memory.format_bytes, repeated so that `report` does not import NumPy and pandas
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def read_npz_header(path):
+    """
+    JSON header of an .npz artifact (row count and column names/dtypes, see storage.py),
+    read without NumPy: the header is a 0-d unicode .npy array inside the zip.
+    """
+    with zipfile.ZipFile(path) as zf, zf.open(_NPZ_HEADER) as f:
+        major = f.read(8)[6]
+        header_length = int.from_bytes(f.read(2 if major == 1 else 4), "little")
+        descr = ast.literal_eval(f.read(header_length).decode("latin1"))["descr"]
+        data = f.read()
+    text = data.decode("utf-32-be" if descr.startswith(">") else "utf-32-le").rstrip("\x00")
+    return json.loads(text)
+
+
+def _csv_columns(path):
+    import csv
+
+    with open(path, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _describe_artifact(path):
+    """(rows or None, [(column, dtype)]) of an artifact, from its header only."""
+    if path.endswith(".npz"):
+        header = read_npz_header(path)
+        return header["rows"], [(c["name"], c.get("dtype", c["kind"])) for c in header["columns"]]
+    return None, [(name, "") for name in _csv_columns(path)]
+
+
+def _list_artifacts(folder):
+    paths = glob.glob(os.path.join(folder, "*.npz")) + glob.glob(os.path.join(folder, "*.csv"))
+    return sorted(paths)
+
+
+def _print_artifact_table(paths):
+    print(f"  {'artifact':<48} {'rows':>10} {'columns':>8} {'size':>10}")
+    for path in paths:
+        try:
+            rows, columns = _describe_artifact(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            print(f"  {os.path.basename(path):<48} unreadable ({e})")
+            continue
+        print(
+            f"  {os.path.basename(path):<48} {'?' if rows is None else rows:>10} {len(columns):>8} "
+            f"{_format_bytes(os.path.getsize(path)):>10}"
+        )
+
+
+def _print_artifact(path):
+    rows, columns = _describe_artifact(path)
+    print(f"{path}: {'unknown' if rows is None else rows} rows, {len(columns)} columns, "
+          f"{_format_bytes(os.path.getsize(path))}")
+    for name, dtype in columns:
+        print(f"  {name:<40} {dtype}")
+
+
+def _print_run_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    print(f"{path} ({report['created']}, {report['wall_seconds']:.2f} s)")
+    print(f"  {'stage':<12} {'wall s':>8} {'cpu s':>8} {'rows in':>10} {'rows out':>10} {'dropped':>8} "
+          f"{'peak RSS':>10} {'read':>10} {'written':>10}")
+    for stage in report["stages"]:
+        rows_in = "cached" if stage["cached"] else stage["rows_in"]
+        print(
+            f"  {stage['name']:<12} {stage['wall_seconds']:>8.2f} {stage['cpu_seconds']:>8.2f} {rows_in!s:>10} "
+            f"{stage['rows_out']!s:>10} {stage['rows_dropped']:>8} {_format_bytes(stage['peak_rss_bytes']):>10} "
+            f"{_format_bytes(stage['bytes_read']):>10} {_format_bytes(stage['bytes_written']):>10}"
+        )
+        for reason, rows in stage["dropped"].items():
+            print(f"    dropped {rows}: {reason}")
+
+
+def _report(args):
+    if args.paths:
+        for path in args.paths:
+            if path.endswith(".json"):
+                _print_run_report(path)
+            else:
+                _print_artifact(path)
+        return 0
+
+    sections = [("data", _list_artifacts(args.data_folder))]
+    sections += [(name, _list_artifacts(os.path.join(args.output_folder, name))) for name in REPORT_FOLDERS]
+    for name, paths in sections:
+        if paths:
+            print(f"\n{name}/")
+            _print_artifact_table(paths)
+
+    reports = sorted(glob.glob(os.path.join(args.output_folder, "reports", "pipeline_*.json")))
+    if reports:
+        print("\nLatest run report:")
+        _print_run_report(reports[-1])
+    return 0
+
+
+def _add_stage_options(parser):
+    parser.add_argument(
+        "--format", default="npz", choices=FORMATS, metavar="FORMAT", help="Artifact format for outputs: npz or csv"
+    )
+    parser.add_argument("--data-folder", default=DATA_FOLDER, help="Folder with the raw r_* run files")
+    parser.add_argument(
+        "--output-folder",
+        default=PIPELINE_FOLDER,
+        help="Folder for processed/, extracted/, aligned/, features/ and growth/",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Recompute and skip the stage cache")
+    parser.add_argument("--force", action="store_true", help="Recompute this command's stages even if cached")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for per-run stages and long alignments (0 = one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream preprocessing in chunks of N rows")
+    parser.add_argument("--compact", action="store_true", help="Keep stage outputs in compact dtypes")
+    parser.add_argument(
+        "--iterative", action="store_true", help="Re-match welds with a shrinking tolerance, correct the drift once"
+    )
+    parser.add_argument(
+        "--matching",
+        default="nearest",
+        choices=MATCH_METHODS,
+        metavar="METHOD",
+        help="Pair welds by 'nearest' distance or one-to-one by 'assignment'",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Skip stages completed by an earlier run, restart at the first incomplete one"
+    )
+    parser.add_argument("--report", default=None, metavar="PATH", help="JSON run report path")
+    parser.add_argument("--profile", action="store_true", help="Run this command's stages under cProfile")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="ILI alignment pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Convert an ILI workbook into per-run artifacts")
+    ingest.add_argument("workbook", help="Path to the .xlsx workbook")
+    ingest.add_argument("--output", default=DATA_FOLDER, help="Output folder (default: data/)")
+    ingest.add_argument("--format", default="npz", choices=FORMATS, metavar="FORMAT", help="Artifact format: npz or csv")
+    ingest.add_argument("--workers", type=int, default=1, help="Convert sheets in parallel with N processes")
+    ingest.set_defaults(handler=_ingest)
+
+    descriptions = {
+        "preprocess": "Read the schema columns of every run and remove empty columns and rows",
+        "extract": "Split the processed runs by feature class",
+        "align": "Match welds across runs and build the drift model",
+        "correct": "Apply the drift correction and place every feature between its matched welds",
+        "growth": "Match metal loss across runs; growth rates, time to critical depth and joint maximums",
+        "run": "Run every stage, preprocess to growth",
+    }
+    for command, description in descriptions.items():
+        stage = commands.add_parser(command, help=description, description=description)
+        _add_stage_options(stage)
+        stage.set_defaults(handler=_run_stages)
+
+    fleet = commands.add_parser("batch", help="Run every segment of a manifest in a process pool, largest first")
+    fleet.add_argument("manifest", help="JSON or CSV manifest of segments (see batch.py)")
+    fleet.add_argument("--output-root", required=True, help="Folder for the per-segment outputs and the summary")
+    fleet.add_argument("--workers", type=int, default=0, help="Segments to run at once (0 = one per CPU)")
+    fleet.add_argument("--format", default="npz", choices=FORMATS, metavar="FORMAT", help="Artifact format: npz or csv")
+    fleet.add_argument("--no-cache", action="store_true", help="Recompute every stage of every segment")
+    fleet.add_argument("--compact", action="store_true", help="Keep stage outputs in compact dtypes")
+    fleet.add_argument("--resume", action="store_true", help="Restart every segment at its first incomplete stage")
+    fleet.set_defaults(handler=_batch)
+
+    report = commands.add_parser("report", help="Show artifacts and the latest run report, or inspect PATHs")
+    report.add_argument("paths", nargs="*", metavar="PATH", help="Artifacts (.npz/.csv) or run reports (.json)")
+    report.add_argument("--data-folder", default=DATA_FOLDER)
+    report.add_argument("--output-folder", default=PIPELINE_FOLDER)
+    report.set_defaults(handler=_report)
+
+    serve = commands.add_parser("serve", help="Serve feature and weld lookups over the outputs via HTTP")
+    serve.add_argument("--output-folder", default=PIPELINE_FOLDER, help="Folder holding aligned/ and features/")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--poll", type=float, default=2.0, help="Seconds between checks for new outputs")
+    serve.set_defaults(handler=_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except Exception as e:
+        print(f"\nERROR: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
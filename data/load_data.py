@@ -1,17 +1,210 @@
-import pandas as pd
+"""
+Ingest an ILI workbook: one sheet per inspection run plus a Summary sheet.
+
+Run sheets are discovered by name (any sheet whose name contains a year, e.g. '2007'
+becomes 'r_2007') and streamed with openpyxl in read-only mode, so the workbook is
+parsed once and only one sheet is held in memory at a time. With workers > 1 each
+sheet is converted in its own process straight into the pipeline's artifact
+format (see pre_processing/storage.py).
+
+Usage: python -m data.load_data <workbook.xlsx> [--format npz|csv] [--workers N]
+"""
+import argparse
 import os
+import re
+
+import pandas as pd
+from openpyxl import load_workbook as _open_workbook
 
-path = "/Users/deep10sun/Downloads/ILIDataV2.xlsx"
+from pre_processing import parallel, storage
 
-summary = pd.read_excel(path, sheet_name="Summary")
-r_2007 = pd.read_excel(path, sheet_name="2007")
-r_2015 = pd.read_excel(path, sheet_name="2015")
-r_2022 = pd.read_excel(path, sheet_name="2022")
+DEFAULT_WORKBOOK = "/Users/deep10sun/Downloads/ILIDataV2.xlsx"
 
 # Save dataframes to data folder
-data_folder = os.path.dirname(__file__)
+data_folder = os.path.dirname(os.path.abspath(__file__))
+
+_YEAR_PATTERN = re.compile(r"(19|20)\d{2}")
+
+# Rows of a sheet converted to a DataFrame at a time (see _sheet_to_frame)
+SHEET_CHUNK_ROWS = 50_000
+
+
+def sheet_output_name(sheet_name):
+    """Map a sheet name to its output name ('2007' -> 'r_2007', 'Summary' -> 'summary'), or None."""
+    if sheet_name.strip().lower() == "summary":
+        return "summary"
+    match = _YEAR_PATTERN.search(sheet_name)
+    if match:
+        return f"r_{match.group(0)}"
+    return None
+
+
+def discover_sheets(path):
+    """Return {output name: sheet name} for the Summary and run sheets of a workbook."""
+    wb = _open_workbook(path, read_only=True)
+    try:
+        names = wb.sheetnames
+    finally:
+        wb.close()
+
+    sheets = {}
+    for sheet_name in names:
+        name = sheet_output_name(sheet_name)
+        if name is None:
+            print(f"Skipping sheet '{sheet_name}' (not a run or summary sheet)")
+        elif name in sheets:
+            raise ValueError(f"Sheets '{sheets[name]}' and '{sheet_name}' both map to {name}")
+        else:
+            sheets[name] = sheet_name
+    return dict(sorted(sheets.items()))
+
+
+def _header_names(header):
+    """Name blank header cells 'Unnamed: i' and de-duplicate repeats like pd.read_excel."""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _records_frame(records, names):
+    """DataFrame of row tuples, padded or cut to the header width."""
+    width = len(names)
+    if any(len(row) != width for row in records):
+        records = [row[:width] + (None,) * (width - len(row)) for row in records]
+    return pd.DataFrame.from_records(records, columns=names)
+
+
+def _concat_chunks(chunks):
+    """
+    Concatenate chunk frames into the frame the rows give in one from_records call. A
+    column inferred differently by its chunks (e.g. blank in one, numbers in another) is
+    inferred again from all its values; blanks are None in the sheet, never NaN.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index=True)
+    for col in df.columns:
+        if len({chunk[col].dtype for chunk in chunks}) > 1:
+            df[col] = pd.Series([None if pd.isna(value) else value for value in df[col]])
+    return df
+
+
+def _sheet_to_frame(ws, chunk_rows=SHEET_CHUNK_ROWS):
+    """
+    Stream a read-only worksheet into a DataFrame (first row is the header).
+
+    Rows are converted chunk_rows at a time, so at most one chunk of row tuples is held
+    besides the columns already converted.
+    """
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    names = _header_names(header)
+
+    chunks = []
+    records = []
+    blank = 0
+    for row in rows:
+        # Read-only sheets can report stale dimensions: empty rows are kept only once a
+        # row with values follows them, so trailing ones are dropped
+        if all(value is None for value in row):
+            blank += 1
+            continue
+        records.extend([()] * blank)
+        blank = 0
+        records.append(row)
+        if len(records) >= chunk_rows:
+            chunks.append(_records_frame(records, names))
+            records = []
+    if records or not chunks:
+        chunks.append(_records_frame(records, names))
+    return _concat_chunks(chunks)
+
+
+def iter_sheets(path, sheets=None):
+    """
+    Read the Summary and run sheets in a single read-only pass over the workbook.
+
+    Yields:
+        (output name, DataFrame) pairs in workbook order
+    """
+    if sheets is None:
+        sheets = discover_sheets(path)
+    wanted = {sheet_name: name for name, sheet_name in sheets.items()}
+
+    wb = _open_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            if ws.title in wanted:
+                yield wanted[ws.title], _sheet_to_frame(ws)
+    finally:
+        wb.close()
+
+
+def load_workbook(path):
+    """Read the Summary sheet and the run sheets into memory, keyed by output name."""
+    return dict(iter_sheets(path))
+
+
+def _convert_sheet(task):
+    """Worker: stream one sheet from its own read-only handle and write it as an artifact."""
+    path, sheet_name, output_path = task
+    wb = _open_workbook(path, read_only=True, data_only=True)
+    try:
+        df = _sheet_to_frame(wb[sheet_name])
+    finally:
+        wb.close()
+    storage.write_frame(df, output_path)
+    return output_path, df.shape
+
+
+def ingest_workbook(path, output_folder=data_folder, fmt=storage.DEFAULT_FORMAT, workers=1):
+    """
+    Convert the Summary and run sheets of a workbook into artifacts in output_folder.
+
+    Args:
+        path: Workbook (.xlsx) to ingest
+        output_folder: Folder for r_<year>.<fmt> and summary.<fmt>
+        fmt: Artifact format ('npz' or 'csv')
+        workers: Number of processes; 1 streams every sheet in one pass in this process
+
+    Returns:
+        dict mapping output name to the written artifact path
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    sheets = discover_sheets(path)
+    outputs = {name: storage.artifact_path(output_folder, name, fmt) for name in sheets}
+
+    if workers > 1 and len(sheets) > 1:
+        tasks = [(path, sheet_name, outputs[name]) for name, sheet_name in sheets.items()]
+        for name, (_, shape) in zip(sheets, parallel.map_ordered(_convert_sheet, tasks, workers)):
+            print(f"Saved {name} {shape} to {outputs[name]}")
+    else:
+        for name, df in iter_sheets(path, sheets):
+            storage.write_frame(df, outputs[name])
+            print(f"Saved {name} {df.shape} to {outputs[name]}")
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an ILI workbook into per-run artifacts")
+    parser.add_argument("workbook", nargs="?", default=DEFAULT_WORKBOOK, help="Path to the .xlsx workbook")
+    parser.add_argument("--output", default=data_folder, help="Output folder (default: data/)")
+    parser.add_argument("--format", choices=storage.FORMATS, default=storage.DEFAULT_FORMAT)
+    parser.add_argument("--workers", type=int, default=1, help="Convert sheets in parallel with N processes")
+    args = parser.parse_args(argv)
+
+    ingest_workbook(args.workbook, args.output, args.format, args.workers)
+
 
-summary.to_csv(os.path.join(data_folder, "summary.csv"), index=False)
-r_2007.to_csv(os.path.join(data_folder, "r_2007.csv"), index=False)
-r_2015.to_csv(os.path.join(data_folder, "r_2015.csv"), index=False)
-r_2022.to_csv(os.path.join(data_folder, "r_2022.csv"), index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -2,79 +2,111 @@
 """
 Complete end-to-end pipeline: Load raw data -> Preprocess -> Extract -> Align -> Drift Correct
 """
-import subprocess
 import sys
 import os
 
-def run_step(script_name, description, working_dir=None):
-    """Run a pipeline step and report results."""
-    print(f"\n{'='*70}")
-    print(f"STEP: {description}")
-    print(f"Script: {script_name}")
-    print(f"{'='*70}")
-    
-    cwd = working_dir if working_dir else os.path.dirname(os.path.abspath(__file__))
-    
-    result = subprocess.run(
-        [sys.executable, script_name],
-        cwd=cwd,
-        capture_output=False
+from data import load_data
+from pre_processing import cache, storage
+from pre_processing.pipeline import run_pipeline, stage_context
+
+
+def ingest_cached(workbook, data_folder=load_data.data_folder, cache_folder=None, fmt=storage.DEFAULT_FORMAT,
+                  use_cache=True, force=False, workers=1):
+    """
+    Convert a workbook into data_folder unless the same bytes were already converted
+    there and every artifact of that conversion is still in data_folder.
+
+    Args:
+        cache_folder: Stage cache that remembers the conversion (default: the pipeline's)
+        force: Convert even when the workbook is unchanged
+
+    Returns:
+        The workbook fingerprint; run_pipeline uses it as the fingerprint of the raw data
+    """
+    cache_folder = cache_folder or stage_context()["cache"]
+    workbook_fingerprint = cache.stage_fingerprint(
+        "ingest", cache.hash_files([workbook]), {"format": fmt}, cache.code_version([load_data])
     )
-    
-    if result.returncode != 0:
-        print(f"\nERROR in {script_name}")
-        return False
-    
-    print(f"\n{description} completed successfully")
-    return True
+    cached = use_cache and not force and cache.is_cached(cache_folder, "ingest", workbook_fingerprint)
+    if cached:
+        # The cache only remembers the conversion; its artifacts may have been deleted since
+        missing = [
+            name for name in load_data.discover_sheets(workbook)
+            if not os.path.exists(storage.artifact_path(data_folder, name, fmt))
+        ]
+        if missing:
+            print(f"Workbook unchanged but {', '.join(missing)} missing from {data_folder}; converting it again")
+            cached = False
+    if cached:
+        print(f"Workbook unchanged; using raw data already in {data_folder}")
+    else:
+        load_data.ingest_workbook(workbook, data_folder, fmt, workers)
+        if use_cache:
+            cache.store_cached(cache_folder, "ingest", workbook_fingerprint, None)
+    return workbook_fingerprint
 
-def main():
+
+def main(workbook=load_data.DEFAULT_WORKBOOK, fmt=storage.DEFAULT_FORMAT, use_cache=True, force=(), workers=1):
     # Get paths
     root_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(root_dir, "data")
     preproc_dir = os.path.join(root_dir, "pre_processing")
-    
-    steps = [
-        ("load_data.py", "Load raw data from Excel and save to CSV", data_dir),
-        ("pre_processing/run_pipeline.py", "Run preprocessing and alignment pipeline", root_dir),
-    ]
-    
+
     print("\n" + "="*70)
     print("COMPLETE END-TO-END PIPELINE")
     print("Raw Data → Processed → Extracted → Aligned → Drift Corrected")
     print("="*70)
-    
-    for script, description, working_dir in steps:
-        if not run_step(script, description, working_dir):
-            print(f"\nPipeline stopped at: {description}")
-            return 1
+
+    # Every stage runs in this process; raw frames are handed to preprocessing in memory.
+    try:
+        print(f"\n{'='*70}")
+        print(f"STEP: Load raw data from {workbook}")
+        print(f"{'='*70}")
+        # The workbook is only re-read when its bytes or the loader code changed
+        workbook_fingerprint = ingest_cached(
+            workbook, fmt=fmt, use_cache=use_cache, force="ingest" in force, workers=workers
+        )
+
+        run_pipeline(
+            write=True,
+            fmt=fmt,
+            use_cache=use_cache,
+            force=[stage for stage in force if stage != "ingest"],
+            input_fingerprints={"raw": workbook_fingerprint},
+            workers=workers,
+            report=True,
+        )
+    except Exception as e:
+        print(f"\nERROR: {e}")
+        print("\nPipeline stopped")
+        return 1
     
     print("\n" + "="*70)
     print("COMPLETE PIPELINE EXECUTED SUCCESSFULLY")
     print("="*70)
     print("\nGenerated files:")
     print("\n  RAW DATA (data/):")
-    print("    - r_2007.csv")
-    print("    - r_2015.csv")
-    print("    - r_2022.csv")
-    print("    - summary.csv")
+    print(f"    - r_2007.{fmt}")
+    print(f"    - r_2015.{fmt}")
+    print(f"    - r_2022.{fmt}")
+    print(f"    - summary.{fmt}")
     
     print("\n  PROCESSED DATA (pre_processing/processed/):")
-    print("    - r_2007_processed.csv")
-    print("    - r_2015_processed.csv")
-    print("    - r_2022_processed.csv")
+    print(f"    - r_2007_processed.{fmt}")
+    print(f"    - r_2015_processed.{fmt}")
+    print(f"    - r_2022_processed.{fmt}")
     
-    print("\n  EXTRACTED WELDS (pre_processing/extracted/):")
-    print("    - r_2007_weld_aligned.csv")
-    print("    - r_2015_weld_aligned.csv")
-    print("    - r_2022_weld_aligned.csv")
+    print("\n  EXTRACTED FEATURES (pre_processing/extracted/):")
+    print(f"    - r_2007_weld_aligned.{fmt}")
+    print(f"    - r_2015_weld_aligned.{fmt}")
+    print(f"    - r_2022_weld_aligned.{fmt}")
+    print(f"    - r_<year>_<class>_aligned.{fmt} for the other feature classes")
     
     print("\n  ALIGNED & CORRECTED (pre_processing/aligned/):")
-    print("    - merged_by_distance.csv")
-    print("    - merged_by_distance_corrected.csv (FINAL OUTPUT)")
+    print(f"    - merged_by_distance.{fmt}")
+    print(f"    - merged_by_distance_corrected.{fmt} (FINAL OUTPUT)")
     
     print("\nFinal output location:")
-    print(f"  {os.path.join(preproc_dir, 'aligned', 'merged_by_distance_corrected.csv')}")
+    print(f"  {storage.artifact_path(os.path.join(preproc_dir, 'aligned'), 'merged_by_distance_corrected', fmt)}")
     print("\n")
     
     return 0
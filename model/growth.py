@@ -0,0 +1,261 @@
+"""
+Corrosion growth of metal-loss features between inspections.
+
+The features stage places every feature of every run in reference coordinates, with
+the aligned id of the weld upstream of it. Each metal-loss feature of the latest run is
+matched to the same anomaly in every earlier run: within the same joint, the nearest
+feature by corrected distance with a nearest merge_asof, then pairs further apart than
+CLOCK_TOLERANCE around the pipe are dropped and an earlier feature claimed twice keeps
+only its closest pair. Matching every earlier run against the latest one directly
+means an anomaly missed by a middle run still has a rate.
+
+From the matched depths, lengths and widths (one column per run) every feature gets:
+
+- depth, length and width growth rates over its longest matched span, (last - first)
+  / (years between the inspections), years taken from the run names (r_2007 -> 2007)
+- years until its depth reaches CRITICAL_DEPTH at that rate (inf if it is not growing,
+  0 if it is already there)
+
+and every joint the maximum of each. Everything is batched NumPy/pandas over whole
+runs; nothing loops over features.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from pre_processing import feature_correction, instrument, schema, storage
+
+# growth/ next to the other stage folders in the pipeline folder, as in
+# pipeline.stage_context (pipeline imports this module, so it is not imported here)
+GROWTH_FOLDER = os.path.join(os.path.dirname(feature_correction.FEATURES_FOLDER), "growth")
+FEATURE_STEM = "metal_loss_growth"
+JOINT_STEM = "joint_growth"
+
+# Feature class that grows (see extract.FEATURE_CLASSES)
+FEATURE_CLASS = "metal_loss"
+
+# Maximum corrected distance (ft) and clock difference (degrees) between matched features
+MATCH_TOLERANCE = 3.0
+CLOCK_TOLERANCE = 30.0
+
+# Depth (% of wall thickness) at which a feature is considered critical
+CRITICAL_DEPTH = 80.0
+
+# Growth quantities: output name -> (schema column, rate unit)
+QUANTITIES = {
+    "depth": (schema.DEPTH, "%/yr"),
+    "length": (schema.LENGTH, "in/yr"),
+    "width": (schema.WIDTH, "in/yr"),
+}
+
+_YEAR_PATTERN = re.compile(r"(?:19|20)\d\d")
+
+
+def run_year(run):
+    """Inspection year from a run name (e.g. 'r_2015' -> 2015)."""
+    match = _YEAR_PATTERN.search(run)
+    if match is None:
+        raise ValueError(f"Cannot tell the inspection year of run {run!r}")
+    return int(match.group())
+
+
+def select_class(features, feature_class=FEATURE_CLASS):
+    """
+    Pick one feature class of every run from the corrected feature tables.
+
+    Args:
+        features: dict mapping '<run>_<class>_corrected' to its rows (the features stage output)
+
+    Returns:
+        dict mapping run name to its rows, oldest inspection first
+    """
+    suffix = f"_{feature_class}{feature_correction.OUTPUT_SUFFIX}"
+    runs = {stem[: -len(suffix)]: df for stem, df in features.items() if stem.endswith(suffix)}
+    return dict(sorted(runs.items(), key=lambda item: run_year(item[0])))
+
+
+def _column(df, col):
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[col].to_numpy(dtype="float64", na_value=np.nan)
+
+
+def match_features(earlier, later, tolerance=MATCH_TOLERANCE, clock_tolerance=CLOCK_TOLERANCE):
+    """
+    Match the features of a later run to those of an earlier one in the same joint.
+
+    Args:
+        earlier, later: Corrected feature rows (weld_id, distance_corrected and optionally clock [deg])
+        tolerance: Maximum corrected distance (ft) between matched features
+        clock_tolerance: Maximum clock difference (degrees); ignored where either clock is missing
+
+    Returns:
+        int64 array with, for every row of `later`, the position of its match in
+        `earlier` or -1
+    """
+
+    def keys(df, row):
+        frame = pd.DataFrame({
+            "weld_id": df["weld_id"].to_numpy(dtype="int64"),
+            "x": _column(df, "distance_corrected"),
+            row: np.arange(len(df)),
+        })
+        return frame[~np.isnan(frame["x"].to_numpy())].sort_values("x", kind="stable")
+
+    pairs = pd.merge_asof(
+        keys(later, "later"),
+        keys(earlier, "earlier").rename(columns={"x": "x_earlier"}),
+        left_on="x",
+        right_on="x_earlier",
+        by="weld_id",
+        direction="nearest",
+        tolerance=tolerance,
+    ).dropna(subset=["earlier"])
+    later_rows = pairs["later"].to_numpy()
+    earlier_rows = pairs["earlier"].to_numpy(dtype="int64")
+
+    angle = _column(later, "clock [deg]")[later_rows] - _column(earlier, "clock [deg]")[earlier_rows]
+    clock_error = np.abs((angle + 180.0) % 360.0 - 180.0)
+    keep = ~(clock_error > clock_tolerance)
+
+    # An earlier feature nearest to several later ones stays with the closest
+    error = np.abs(pairs["x"].to_numpy() - pairs["x_earlier"].to_numpy())
+    order = np.argsort(np.where(keep, error, np.inf), kind="stable")
+    first = np.zeros(len(order), dtype=bool)
+    first[order[~pd.Series(earlier_rows[order]).duplicated().to_numpy()]] = True
+    keep &= first
+
+    matched = np.full(len(later), -1, dtype="int64")
+    matched[later_rows[keep]] = earlier_rows[keep]
+    return matched
+
+
+def span_rates(values, years):
+    """
+    Growth rate of every row over its longest measured span.
+
+    Args:
+        values: (features, runs) array, NaN where a run did not measure the feature
+        years: Inspection year of each run column, increasing
+
+    Returns:
+        (last - first) / (years between them) per row; NaN with fewer than two measurements
+    """
+    measured = ~np.isnan(values)
+    first = np.argmax(measured, axis=1)
+    last = values.shape[1] - 1 - np.argmax(measured[:, ::-1], axis=1)
+    rows = np.arange(len(values))
+    span = years[last] - years[first]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = (values[rows, last] - values[rows, first]) / span
+    return np.where(span > 0, rate, np.nan)
+
+
+def years_to_critical(depth, rate, critical=CRITICAL_DEPTH):
+    """Years until `depth` reaches `critical` at `rate`: inf when not growing, 0 when already there."""
+    remaining = critical - depth
+    with np.errstate(invalid="ignore", divide="ignore"):
+        years = np.where(rate > 0, remaining / rate, np.inf)
+    years = np.where(remaining <= 0, 0.0, years)
+    return np.where(np.isnan(depth) | np.isnan(rate), np.nan, years)
+
+
+def joint_maximums(growth):
+    """
+    Worst feature of every joint: feature count, maximum depth and growth rates, and the
+    shortest time to critical depth.
+    """
+    rates = [f"{name}_rate [{unit}]" for name, (_, unit) in QUANTITIES.items()]
+    joints = growth.groupby("weld_id", sort=True).agg(
+        features=("weld_id", "size"),
+        **{f"max {schema.DEPTH}": (schema.DEPTH, "max")},
+        **{f"max {rate}": (rate, "max") for rate in rates},
+        min_years_to_critical=("years_to_critical", "min"),
+    )
+    return joints.reset_index()
+
+
+def compute_growth(
+    features,
+    feature_class=FEATURE_CLASS,
+    tolerance=MATCH_TOLERANCE,
+    clock_tolerance=CLOCK_TOLERANCE,
+    critical=CRITICAL_DEPTH,
+):
+    """
+    Match every run's features to the latest run and compute their growth.
+
+    Args:
+        features: dict mapping '<run>_<class>_corrected' to its rows (the features stage output)
+        feature_class: Class whose features are matched
+        tolerance, clock_tolerance: See match_features
+        critical: Depth (%) used for years_to_critical
+
+    Returns:
+        dict with 'metal_loss_growth' (one row per feature of the latest run: its position,
+        the depth/length/width each run measured, rates and years to critical) and
+        'joint_growth' (one row per joint, see joint_maximums)
+    """
+    runs = select_class(features, feature_class)
+    if len(runs) < 2:
+        raise ValueError(f"Growth needs {feature_class} features from at least two runs, found {list(runs)}")
+    names = list(runs)
+    years = np.array([run_year(run) for run in names], dtype="float64")
+    latest = runs[names[-1]]
+    instrument.record_rows(rows_in=sum(len(df) for df in runs.values()))
+
+    growth = {
+        "weld_id": latest["weld_id"].to_numpy(),
+        "distance_corrected": _column(latest, "distance_corrected"),
+        "clock [deg]": _column(latest, "clock [deg]"),
+    }
+    measured = {name: np.full((len(latest), len(names)), np.nan) for name in QUANTITIES}
+    matched_runs = np.zeros(len(latest), dtype="int64")
+    for k, run in enumerate(names):
+        df = runs[run]
+        if k == len(names) - 1:
+            rows = np.arange(len(df))
+        else:
+            rows = match_features(df, latest, tolerance, clock_tolerance)
+            unmatched = len(df) - int((rows >= 0).sum())
+            print(f"Matched {len(df) - unmatched} of {len(df)} {feature_class} features of {run} to {names[-1]}")
+            instrument.record_dropped(unmatched, f"{run}: {feature_class} not matched in {names[-1]}")
+        found = rows >= 0
+        matched_runs += found
+        for name, (col, _) in QUANTITIES.items():
+            measured[name][found, k] = _column(df, col)[rows[found]]
+            growth[f"{run}__{name}"] = measured[name][:, k]
+
+    growth["matched_runs"] = matched_runs
+    for name, (col, unit) in QUANTITIES.items():
+        growth[f"{name}_rate [{unit}]"] = span_rates(measured[name], years)
+    growth[schema.DEPTH] = measured["depth"][:, -1]
+    growth["years_to_critical"] = years_to_critical(growth[schema.DEPTH], growth["depth_rate [%/yr]"], critical)
+    growth = pd.DataFrame(growth)
+
+    growing = int((growth["matched_runs"] > 1).sum())
+    print(f"Growth rates for {growing} of {len(growth)} {feature_class} features of {names[-1]}")
+    return {FEATURE_STEM: growth, JOINT_STEM: joint_maximums(growth)}
+
+
+def load_features(features_folder=feature_correction.FEATURES_FOLDER, feature_class=FEATURE_CLASS):
+    """Load the corrected feature tables of one class for every run."""
+    pattern = f"*_{feature_class}{feature_correction.OUTPUT_SUFFIX}"
+    return {stem: storage.read_frame(path) for stem, path in storage.list_artifacts(features_folder, pattern).items()}
+
+
+def save_growth(tables, output_folder=GROWTH_FOLDER, fmt=storage.DEFAULT_FORMAT):
+    os.makedirs(output_folder, exist_ok=True)
+    for stem, df in tables.items():
+        storage.write_frame(df, storage.artifact_path(output_folder, stem, fmt))
+    print(f"Saved {len(tables)} growth tables to {output_folder}")
+
+
+def main():
+    save_growth(compute_growth(load_features()))
+
+
+if __name__ == "__main__":
+    main()
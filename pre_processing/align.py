@@ -1,260 +1,515 @@
+import fnmatch
 import os
-from glob import glob
 import pandas as pd
 import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from pre_processing import coarse_align, instrument, parallel, schema, storage
+from pre_processing.drift_model import DriftModel, model_path
 
 EXTRACTED_FOLDER = os.path.join(os.path.dirname(__file__), "extracted")
 ALIGNED_FOLDER = os.path.join(os.path.dirname(__file__), "aligned")
 
+# Maximum distance (ft) between welds paired by merge_asof
+MERGE_TOLERANCE = 20.0
 
-def _normalize_column_name(name):
-    return "".join(ch for ch in name.lower() if ch.isalnum())
+# Extracted artifacts holding the weld class of each run (see extract.FEATURE_CLASSES)
+WELD_ARTIFACTS = "*_weld_aligned"
 
+# Stem of the run every other run is aligned to; None uses the first (oldest) run
+REFERENCE_RUN = None
 
-def _find_distance_column(columns):
-    candidates = [
-        "log dist. [ft]",
-        "Log Dist. [ft]",
-        "log distance",
-        "Log Distance",
-        "distance",
-        "Distance",
-        "ILI Wheel Count  [ft.]",
-    ]
-    normalized_candidates = {_normalize_column_name(c) for c in candidates}
-    for col in columns:
-        if _normalize_column_name(col) in normalized_candidates:
-            return col
-    return None
+# Shift each run by its joint-length cross-correlation offset before merge_asof
+COARSE_ALIGN = True
 
+# How welds are paired: "nearest" (merge_asof; one run weld may pair with several
+# reference welds) or "assignment" (one-to-one, see _assign)
+MATCH_METHOD = "nearest"
+MATCH_METHODS = ("nearest", "assignment")
 
-def _load_and_prepare(file_path):
-    df = pd.read_csv(file_path)
-    distance_col = _find_distance_column(df.columns)
-    if distance_col is None:
-        raise ValueError(f"No distance column found in {file_path}")
+# Assignment cost of a pair: |distance difference| / tolerance plus JOINT_WEIGHT times the
+# joint-length disagreement, which counts in full from JOINT_SCALE ft. Blocks of welds
+# are capped at MAX_BLOCK welds (both runs together).
+JOINT_WEIGHT = 1.0
+JOINT_SCALE = 2.0
+MAX_BLOCK = 64
 
-    stem = os.path.splitext(os.path.basename(file_path))[0]
-    df = df.copy()
-    df["distance_ft"] = pd.to_numeric(df[distance_col], errors="coerce")
-    df = df.dropna(subset=["distance_ft"])
-    df["distance_ft"] = df["distance_ft"].astype("float64")
-    df[f"{stem}__distance_ft"] = df["distance_ft"].astype("float64")
-
-    rename_map = {}
-    for col in df.columns:
-        if col in {"distance_ft", f"{stem}__distance_ft"}:
-            continue
-        rename_map[col] = f"{stem}__{col}"
-    df = df.rename(columns=rename_map)
-
-    return df, stem
-
-
-def _extract_year(stem):
-    digits = "".join(ch for ch in stem if ch.isdigit())
-    for i in range(len(digits) - 3):
-        year = int(digits[i : i + 4])
-        if 1900 <= year <= 2100:
-            return year
-    return None
-
-
-def _pick_delta_order(stems):
-    year_map = {stem: _extract_year(stem) for stem in stems}
-    if 2007 in year_map.values() and 2015 in year_map.values():
-        stem_2007 = next(stem for stem, year in year_map.items() if year == 2007)
-        stem_2015 = next(stem for stem, year in year_map.items() if year == 2015)
-        return stem_2007, stem_2015
-    return stems[0], stems[1]
-
-
-def _find_column_by_pattern(columns, patterns):
-    """Find column matching any of the patterns (case-insensitive)."""
-    normalized_patterns = {_normalize_column_name(p) for p in patterns}
-    for col in columns:
-        if _normalize_column_name(col) in normalized_patterns:
-            return col
-    return None
-
-
-def _get_target_columns(stem_a, stem_b, merged_df):
-    """Get the target column pairs for avg/delta calculation."""
-    target_mappings = {
-        "distance_ft": ["log dist. [ft]", "Log Dist. [ft]", "distance", "Distance"],
-        "height": ["Height", "height", "Elevation", "elevation"],
-        "thickness": ["t [in]", "T [in]", "Wt [in]", "WT [in]", "thickness", "Thickness"],
-        "jlength": ["J. len [ft]", "J.len [ft]", "Joint Length", "joint length", "J. length"],
-    }
-    
-    target_cols = {}
-    for key, patterns in target_mappings.items():
-        col_a = _find_column_by_pattern([col[len(f"{stem_a}__"):] for col in merged_df.columns if col.startswith(f"{stem_a}__")], patterns)
-        col_b = _find_column_by_pattern([col[len(f"{stem_b}__"):] for col in merged_df.columns if col.startswith(f"{stem_b}__")], patterns)
-        
-        if col_a and col_b:
-            target_cols[key] = (f"{stem_a}__{col_a}", f"{stem_b}__{col_b}")
-    
-    return target_cols
-
-
-def _linear_extrapolate(x, x0, y0, x1, y1):
-    if x1 == x0:
-        return y0
-    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
-
-
-def _build_drift_function(x_2007, x_2015):
-    """Return a callable Δ(x) using piecewise-linear interpolation/extrapolation."""
-    x = np.asarray(x_2007, dtype="float64")
-    y = np.asarray(x_2015, dtype="float64")
-    delta = y - x
-
-    sort_idx = np.argsort(x)
-    x_sorted = x[sort_idx]
-    delta_sorted = delta[sort_idx]
-
-    def drift_fn(x_query):
-        xq = np.asarray(x_query, dtype="float64")
-        delta_interp = np.interp(xq, x_sorted, delta_sorted)
-
-        if len(x_sorted) >= 2:
-            left_mask = xq < x_sorted[0]
-            right_mask = xq > x_sorted[-1]
-
-            if np.any(left_mask):
-                delta_interp[left_mask] = _linear_extrapolate(
-                    xq[left_mask],
-                    x_sorted[0],
-                    delta_sorted[0],
-                    x_sorted[1],
-                    delta_sorted[1],
-                )
-
-            if np.any(right_mask):
-                delta_interp[right_mask] = _linear_extrapolate(
-                    xq[right_mask],
-                    x_sorted[-2],
-                    delta_sorted[-2],
-                    x_sorted[-1],
-                    delta_sorted[-1],
-                )
-
-        return delta_interp
-
-    return drift_fn
-
-
-def _apply_coordinate_transform(x_values, drift_fn):
-    """Apply T(x) = x - Δ(x)."""
-    return np.asarray(x_values, dtype="float64") - drift_fn(x_values)
+# With workers > 1, matching is split into segments of about SEGMENT_WELDS reference welds,
+# cut where no pair can cross (see _segments), and the segments are matched in parallel
+SEGMENT_WELDS = 50000
 
+# Iterative matching (see _refine_match): fit a smooth drift to the matched welds, map the
+# run onto the reference with it and match again with a tolerance of RESIDUAL_SIGMAS
+# robust standard deviations of the residuals (never below MIN_TOLERANCE ft, never above
+# the previous tolerance), until the matched set stops changing or MAX_ITERATIONS
+ITERATIVE_ALIGN = False
+SMOOTH_WELDS = 25
+RESIDUAL_SIGMAS = 5.0
+MIN_TOLERANCE = 1.0
+MAX_ITERATIONS = 10
 
-def main():
-    os.makedirs(ALIGNED_FOLDER, exist_ok=True)
+# Per-run weld attributes carried into the aligned table: key -> schema column
+TARGET_COLUMNS = {
+    "height": schema.HEIGHT,
+    "thickness": schema.THICKNESS,
+    "jlength": schema.JOINT_LENGTH,
+}
 
-    csv_files = sorted(glob(os.path.join(EXTRACTED_FOLDER, "*.csv")))
-    if not csv_files:
-        print(f"No CSV files found in {EXTRACTED_FOLDER}")
-        return
 
-    merged_df = None
-    stems = []
-    for idx, file_path in enumerate(csv_files):
-        df, stem = _load_and_prepare(file_path)
-        stems.append(stem)
-        df = df.sort_values("distance_ft")
+def _needed_columns(columns):
+    """Columns align_runs uses: distance plus the height/thickness/joint-length targets."""
+    needed = [schema.find_column(columns, canonical) for canonical in [schema.DISTANCE, *TARGET_COLUMNS.values()]]
+    return [col for col in columns if col in needed]
+
+
+def _load_columns(file_path):
+    """Read only the columns align_runs needs from an extracted artifact."""
+    return storage.read_frame(file_path, columns=_needed_columns(storage.read_columns(file_path)))
+
+
+def _load_and_prepare(file_path):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return _prepare(_load_columns(file_path), stem), stem
+
 
-        if merged_df is None:
-            merged_df = df
+def _prepare(df, stem):
+    """
+    Reduce a weld frame to its distance and target attributes, sorted by distance.
+
+    Columns: distance_ft (the merge key), {stem}__distance and {stem}__<key> for each
+    TARGET_COLUMNS key found in the frame.
+    """
+    distance_col = schema.find_column(df.columns, schema.DISTANCE)
+    if distance_col is None:
+        raise ValueError(f"No distance column found in {stem}")
+
+    distance = pd.to_numeric(df[distance_col], errors="coerce").astype("float64")
+    prepared = {"distance_ft": distance, f"{stem}__distance": distance}
+    for key, canonical in TARGET_COLUMNS.items():
+        col = schema.find_column(df.columns, canonical)
+        if col is not None:
+            prepared[f"{stem}__{key}"] = pd.to_numeric(df[col], errors="coerce")
+
+    prepared = pd.DataFrame(prepared).dropna(subset=["distance_ft"])
+    instrument.record_dropped(len(df) - len(prepared), f"{stem}: no distance")
+    return prepared.sort_values("distance_ft", ignore_index=True)
+
+
+def _coarse_key(ref, run, reference, stem, workers=1):
+    """Run distances shifted onto the reference by the joint-length offset (see coarse_align.py)."""
+    ref_col, run_col = f"{reference}__jlength", f"{stem}__jlength"
+    if ref_col not in ref or run_col not in run:
+        print(f"{stem}: no joint lengths to compare with {reference}; no coarse offset")
+        return run["distance_ft"]
+
+    estimate = coarse_align.estimate_offsets(
+        ref["distance_ft"].to_numpy(),
+        ref[ref_col].to_numpy(),
+        run["distance_ft"].to_numpy(),
+        run[run_col].to_numpy(),
+        workers,
+    )
+    if estimate is None:
+        print(f"{stem}: joint lengths do not correlate with {reference}; no coarse offset")
+        return run["distance_ft"]
+
+    knots, offsets, score = estimate
+    print(
+        f"{stem}: coarse offset {np.median(offsets):+.2f} ft "
+        f"(range {offsets.min():+.2f} to {offsets.max():+.2f} ft over {len(offsets)} segment(s), score {score:.2f})"
+    )
+    return run["distance_ft"] - coarse_align.offset_at(run["distance_ft"].to_numpy(), knots, offsets)
+
+
+def _blocks(positions, tolerance, max_block):
+    """
+    Split sorted positions into runs of [start, stop) where neighbours are within tolerance.
+
+    No pair within tolerance crosses a gap wider than it, so the blocks can be assigned
+    independently. A block of more than max_block positions is cut at its widest gaps,
+    which only loses pairs across those cuts.
+    """
+    gaps = np.diff(positions)
+    cuts = np.flatnonzero(gaps > tolerance) + 1
+    bounds = np.stack([np.concatenate([[0], cuts]), np.concatenate([cuts, [len(positions)]])], axis=1)
+    blocks = []
+    for start, stop in bounds[bounds[:, 1] - bounds[:, 0] > max_block]:
+        pending = [(start, stop)]
+        while pending:
+            lo, hi = pending.pop()
+            if hi - lo <= max_block:
+                blocks.append((lo, hi))
+                continue
+            cut = lo + 1 + int(np.argmax(gaps[lo:hi - 1]))
+            pending += [(lo, cut), (cut, hi)]
+    small = bounds[bounds[:, 1] - bounds[:, 0] <= max_block]
+    return small, blocks
+
+
+def _assign(ref_key, run_key, ref_jlength, run_jlength, tolerance, max_block=MAX_BLOCK):
+    """
+    One-to-one pairing of reference and run welds with the lowest total cost.
+
+    Both weld lists are merged by position and cut into blocks at gaps wider than the
+    tolerance. A block of one reference and one run weld is a pair; larger blocks are
+    solved with linear_sum_assignment on a cost matrix padded with an "unmatched" option
+    for every weld, so a weld may stay unmatched rather than take a worse partner. Pairs
+    further apart than the tolerance are not allowed. With blocks capped at max_block the
+    total work is linear in the number of welds.
+
+    Args:
+        ref_key, run_key: Sorted match keys (ft)
+        ref_jlength, run_jlength: Joint lengths in the same order (NaN: no joint-length term)
+        tolerance: Maximum distance between paired welds
+
+    Returns:
+        int64 array with the run position paired with each reference weld, or -1
+    """
+    n_ref = len(ref_key)
+    positions = np.concatenate([ref_key, run_key])
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    is_ref = order < n_ref
+    small, large = _blocks(positions, tolerance, max_block)
+    matched = np.full(n_ref, -1, dtype="int64")
+
+    # Blocks of exactly one weld of each run pair up directly (they are within tolerance)
+    size = small[:, 1] - small[:, 0]
+    counted = np.concatenate([[0], np.cumsum(is_ref)])
+    refs = counted[small[:, 1]] - counted[small[:, 0]]
+    pairs = small[(size == 2) & (refs == 1)]
+    first, second = order[pairs[:, 0]], order[pairs[:, 0] + 1]
+    ref_pos = np.where(first < n_ref, first, second)
+    run_pos = np.where(first < n_ref, second, first) - n_ref
+    matched[ref_pos] = run_pos
+
+    blocks = [tuple(b) for b in small[(size > 2) & (refs > 0) & (refs < size)]] + large
+    unmatched_cost = 1.0 + JOINT_WEIGHT
+    for lo, hi in blocks:
+        members = order[lo:hi]
+        r = members[members < n_ref]
+        c = members[members >= n_ref] - n_ref
+        if len(r) == 0 or len(c) == 0:
             continue
+        distance = np.abs(ref_key[r][:, None] - run_key[c][None, :])
+        joint = np.abs(ref_jlength[r][:, None] - run_jlength[c][None, :])
+        cost = distance / tolerance + JOINT_WEIGHT * np.nan_to_num(np.minimum(joint / JOINT_SCALE, 1.0))
+        allowed = distance <= tolerance
+        # Square matrix: pairs (top left), a private "unmatched" column per reference weld
+        # and row per run weld, and free dummy-to-dummy cells
+        n, m = len(r), len(c)
+        full = np.full((n + m, m + n), np.inf)
+        full[:n, :m] = np.where(allowed, cost, np.inf)
+        full[np.arange(n), m + np.arange(n)] = unmatched_cost
+        full[n + np.arange(m), np.arange(m)] = unmatched_cost
+        full[n:, m:] = 0.0
+        rows, cols = linear_sum_assignment(full)
+        paired = (rows < n) & (cols < m)
+        matched[r[rows[paired]]] = c[cols[paired]]
+    return matched
+
+
+def _segments(ref_key, run_key, tolerance):
+    """
+    Split a match into independent segments of about SEGMENT_WELDS reference welds.
+
+    Each cut lies in a gap wider than the tolerance between consecutive keys of both runs
+    together, so no pair within tolerance crosses it: a reference weld sees the same
+    nearest run weld, and _assign the same blocks, in its segment as in the whole line.
+    The segments' matches therefore concatenate to the match of the whole line.
+
+    Returns:
+        List of (ref_start, ref_stop, run_start, run_stop) index bounds covering both runs
+    """
+    positions = np.sort(np.concatenate([ref_key, run_key]))
+    gaps = np.flatnonzero(np.diff(positions) > tolerance)
+    cuts = (positions[gaps] + positions[gaps + 1]) / 2.0
+    if len(cuts):
+        # The first wide gap at or after every SEGMENT_WELDS-th reference weld
+        targets = np.searchsorted(cuts, ref_key[SEGMENT_WELDS::SEGMENT_WELDS])
+        cuts = np.unique(cuts[np.minimum(targets, len(cuts) - 1)])
+    ref_bounds = np.concatenate([[0], np.searchsorted(ref_key, cuts), [len(ref_key)]])
+    run_bounds = np.concatenate([[0], np.searchsorted(run_key, cuts), [len(run_key)]])
+    return list(zip(ref_bounds[:-1], ref_bounds[1:], run_bounds[:-1], run_bounds[1:]))
+
+
+def _match_segment(task):
+    """Worker: _match of one segment (see _merge)."""
+    return _match(*task)
+
+
+def _merge(ref, run, tolerance, method=MATCH_METHOD, jlength_columns=(None, None), workers=1):
+    """
+    Pair the reference welds with the run (sorted by its distance_ft key).
+
+    With workers > 1 the line is cut into segments (see _segments) that are matched in
+    a process pool and concatenated in order; the result is identical to a serial match.
+
+    Returns:
+        One row per reference weld with its distance_ft and the paired run row's columns
+        (NaN where unpaired), as from merge_asof
+    """
+    if parallel.resolve_workers(workers) <= 1:
+        return _match(ref, run, tolerance, method, jlength_columns)
+
+    segments = _segments(
+        ref["distance_ft"].to_numpy(dtype="float64"), run["distance_ft"].to_numpy(dtype="float64"), tolerance
+    )
+    # Segments without reference welds add no rows
+    tasks = [
+        (ref.iloc[ref_start:ref_stop], run.iloc[run_start:run_stop], tolerance, method, jlength_columns)
+        for ref_start, ref_stop, run_start, run_stop in segments
+        if ref_stop > ref_start
+    ]
+    if len(tasks) <= 1:
+        return _match(ref, run, tolerance, method, jlength_columns)
+    return pd.concat(parallel.map_ordered(_match_segment, tasks, workers), ignore_index=True)
+
+
+def _match(ref, run, tolerance, method=MATCH_METHOD, jlength_columns=(None, None)):
+    """_merge of a whole line or segment in this process."""
+    if method == "nearest":
+        return pd.merge_asof(ref[["distance_ft"]], run, on="distance_ft", direction="nearest", tolerance=tolerance)
+    if method != "assignment":
+        raise ValueError(f"Unknown match method {method!r}, expected one of {MATCH_METHODS}")
+
+    def jlength(frame, col):
+        if col is None or col not in frame:
+            return np.full(len(frame), np.nan)
+        return frame[col].to_numpy(dtype="float64", na_value=np.nan)
+
+    matched = _assign(
+        ref["distance_ft"].to_numpy(dtype="float64"),
+        run["distance_ft"].to_numpy(dtype="float64"),
+        jlength(ref, jlength_columns[0]),
+        jlength(run, jlength_columns[1]),
+        tolerance,
+    )
+    paired = run.drop(columns="distance_ft").reset_index(drop=True).reindex(matched)
+    return pd.concat([ref[["distance_ft"]].reset_index(drop=True), paired.reset_index(drop=True)], axis=1)
+
+
+def _smooth_drift(delta, window=SMOOTH_WELDS):
+    """Rolling median of the matched drift over `window` welds: the drift without the spurious pairs."""
+    return pd.Series(delta).rolling(window, center=True, min_periods=1).median().to_numpy()
+
+
+def _to_reference(x_run, x_ref, smooth):
+    """Run distances mapped into reference coordinates through the smooth drift."""
+    model = DriftModel.from_pairs(x_ref, x_ref + smooth)
+    try:
+        return model.inverse().forward(x_run)
+    except ValueError:
+        # The smoothed drift folds over somewhere; evaluating it at the run distance
+        # instead of the reference one is off only by the drift's slope times the drift
+        return x_run - model(x_run)
+
+
+def _refine_match(ref, run, stem, tolerance, method=MATCH_METHOD, jlength_columns=(None, None), workers=1):
+    """
+    Match a run to the reference by iterating fit drift -> transform -> match.
+
+    Each pass is one rolling median, one interpolation and one merge_asof over the whole
+    run; the matches are split across workers (see _merge), the fit stays global. Every pass prints and returns its tolerance, match count and residuals (matched
+    drift minus the smooth drift, ft).
+
+    Args:
+        ref: Prepared reference welds (distance_ft is the reference distance)
+        run: Prepared run welds with _row, sorted by their distance_ft match key
+        tolerance: Tolerance of the first match
+        method, jlength_columns, workers: See _merge
+
+    Returns:
+        (matched frame as from _merge, list of per-iteration dicts)
+    """
+    x_ref = ref["distance_ft"].to_numpy()
+    x_run = run[f"{stem}__distance"].to_numpy(dtype="float64")
+    matched = _merge(ref, run, tolerance, method, jlength_columns, workers)
+    iterations = []
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        rows = matched["_row"].to_numpy()
+        valid = ~np.isnan(rows)
+        if valid.sum() < 2:
+            break
+        delta = x_run[rows[valid].astype("int64")] - x_ref[valid]
+        smooth = _smooth_drift(delta)
+        residual = np.abs(delta - smooth)
+        next_tolerance = float(np.clip(RESIDUAL_SIGMAS * 1.4826 * np.median(residual), MIN_TOLERANCE, tolerance))
+        iterations.append({
+            "iteration": iteration,
+            "tolerance": float(tolerance),
+            "matched": int(valid.sum()),
+            "residual_median": float(np.median(residual)),
+            "residual_p95": float(np.percentile(residual, 95)),
+            "residual_max": float(residual.max()),
+            "next_tolerance": next_tolerance,
+        })
+        print(
+            f"{stem}: iteration {iteration}, tolerance {tolerance:.2f} ft, {valid.sum()} matched, "
+            f"residual median {np.median(residual):.3f} ft, p95 {np.percentile(residual, 95):.3f} ft, "
+            f"max {residual.max():.3f} ft; next tolerance {next_tolerance:.2f} ft"
+        )
 
-        merged_df = pd.merge_asof(
-            merged_df.sort_values("distance_ft"),
-            df,
-            on="distance_ft",
-            direction="nearest",
-            tolerance=20.0,
-            suffixes=("", f"__{stem}"),
+        tolerance = next_tolerance
+        keyed = run.assign(distance_ft=_to_reference(x_run, x_ref[valid], smooth)).sort_values("distance_ft")
+        rematched = _merge(ref, keyed, tolerance, method, jlength_columns, workers)
+        if np.array_equal(rematched["_row"].to_numpy(), rows, equal_nan=True):
+            print(f"{stem}: matched set unchanged; converged after {iteration} iteration(s)")
+            break
+        matched = rematched
+    else:
+        print(f"{stem}: matched set still changing after {MAX_ITERATIONS} iterations")
+    return matched, iterations
+
+
+def align_runs(
+    frames,
+    reference=REFERENCE_RUN,
+    tolerance=MERGE_TOLERANCE,
+    coarse=COARSE_ALIGN,
+    iterative=ITERATIVE_ALIGN,
+    workers=1,
+    method=MATCH_METHOD,
+):
+    """
+    Align every run to a reference run and build the drift-corrected weld table.
+
+    Each run is matched to the reference welds on its own with a nearest merge_asof, so
+    the cost grows linearly with the number of runs. With method="assignment" the pairs
+    are one-to-one instead (see _assign). With coarse=True the run is first
+    shifted by the offset found by cross-correlating joint lengths, so large start
+    offsets and odometer slip do not push welds out of tolerance. Every reference weld is kept; a run
+    with no weld within tolerance gets NaN in its columns for that row.
+
+    With iterative=True the single match is refined by _refine_match: the drift fitted
+    to the matched welds maps the run onto the reference and the welds are matched again
+    with a tighter tolerance until the matched set stops changing. Each run's iterations
+    go into the run report.
+
+    The drift Δ(x) is built from the reference and the first other run (the drift run)
+    and applied as T(x) = x - Δ(x) to the reference and to every later run.
+
+    Args:
+        frames: dict mapping run stem (e.g. 'r_2007_weld_aligned') to its weld DataFrame,
+            in run order
+        reference: Stem of the run the others are aligned to (None: the first run)
+        tolerance: Maximum distance (ft) between matched welds, after the coarse offset
+        coarse: Estimate a coarse offset per run from joint lengths before matching
+        iterative: Refine each run's match iteratively (see ITERATIVE_ALIGN)
+        workers: Processes for long runs: the coarse offset walk is split into pieces
+            of windows (see coarse_align._walk_split) and the matching into segments
+            cut where no pair can cross (see _segments); 0 or None means one per CPU.
+            The table, its weld ids and the drift model are identical to a serial run.
+        method: "nearest" or "assignment" (see MATCH_METHOD)
+
+    Returns:
+        DataFrame with one row per reference weld: id, distance_corrected, the per-run
+        columns {stem}__distance and {stem}__<attribute> (plus {stem}__distance_corrected
+        for runs after the drift run) and the reference/drift-run comparison columns
+        distance__delta, <attribute>__avg and <attribute>__delta
+    """
+    stems = list(frames)
+    if reference is None:
+        reference = stems[0]
+    if reference not in frames:
+        raise ValueError(f"Reference run {reference} is not one of {stems}")
+    others = [stem for stem in stems if stem != reference]
+
+    ref = _prepare(frames[reference], reference)
+    blocks = [ref.drop(columns="distance_ft")]
+    for stem in others:
+        run = _prepare(frames[stem], stem)
+        if coarse:
+            run["distance_ft"] = _coarse_key(ref, run, reference, stem, workers)
+            run = run.sort_values("distance_ft")
+        run["_row"] = np.arange(len(run))
+        jlength_columns = (f"{reference}__jlength", f"{stem}__jlength")
+        if iterative:
+            matched, iterations = _refine_match(ref, run, stem, tolerance, method, jlength_columns, workers)
+            instrument.record_detail(f"{stem} iterations", iterations)
+        else:
+            matched = _merge(ref, run, tolerance, method, jlength_columns, workers)
+        unmatched = len(run) - matched["_row"].nunique()
+        repeated = matched["_row"].notna().sum() - matched["_row"].nunique()
+        instrument.record_dropped(unmatched, f"{stem}: unmatched in {'merge_asof' if method == 'nearest' else method}")
+        print(
+            f"{stem}: {matched['_row'].notna().sum()} of {len(ref)} reference welds matched, "
+            f"{unmatched} of its {len(run)} welds unmatched"
+            + (f", {repeated} pairs reuse a weld" if repeated else "")
         )
+        blocks.append(matched.drop(columns=["distance_ft", "_row"]))
+    wide = pd.concat(blocks, axis=1)
+
+    x_ref = wide[f"{reference}__distance"].to_numpy()
+    drift_run = others[0] if others else None
+    model = None
+    if drift_run is not None:
+        # Build drift and compute corrected distance using T(x)=x-Δ(x) from the matched pairs
+        x_drift = wide[f"{drift_run}__distance"].to_numpy()
+        if np.isnan(x_drift).all():
+            raise ValueError(f"No welds of {drift_run} within {tolerance} ft of {reference}")
+        model = DriftModel.from_pairs(x_ref, x_drift, reference, drift_run)
+
+    result = {"id": np.arange(1, len(wide) + 1)}
+    result["distance_corrected"] = x_ref if model is None else model.transform(x_ref)
+
+    # Raw distances and attributes of every run, for later drift correction
+    for stem in [reference] + others:
+        result[f"{stem}__distance"] = wide[f"{stem}__distance"]
+        if stem not in (reference, drift_run):
+            result[f"{stem}__distance_corrected"] = model.transform(wide[f"{stem}__distance"].to_numpy())
+        for key in TARGET_COLUMNS:
+            if f"{stem}__{key}" in wide:
+                result[f"{stem}__{key}"] = wide[f"{stem}__{key}"]
+
+    # Average and delta between the reference and the drift run
+    if drift_run is not None:
+        result["distance__delta"] = wide[f"{drift_run}__distance"] - wide[f"{reference}__distance"]
+        for key in TARGET_COLUMNS:
+            col_a, col_b = f"{reference}__{key}", f"{drift_run}__{key}"
+            if col_a in wide and col_b in wide:
+                result[f"{key}__avg"] = (wide[col_a] + wide[col_b]) / 2.0
+                result[f"{key}__delta"] = wide[col_b] - wide[col_a]
+
+    # The per-run columns are taken over from `wide` as they are, not copied again
+    return pd.DataFrame(result, copy=False)
+
+
+def select_welds(extracted):
+    """Keep the weld partitions of an extract stage output (stems matching WELD_ARTIFACTS)."""
+    return {stem: df for stem, df in extracted.items() if fnmatch.fnmatch(stem, WELD_ARTIFACTS)}
+
+
+def load_extracted(extracted_folder=EXTRACTED_FOLDER):
+    """Load the columns align_runs needs from the extracted weld artifacts, keyed by stem in sorted order."""
+    return {
+        stem: _load_columns(file_path)
+        for stem, file_path in storage.list_artifacts(extracted_folder, WELD_ARTIFACTS).items()
+    }
 
-        matched_col = f"{stem}__distance_ft"
-        merged_df = merged_df[merged_df[matched_col].notna()]
-
-    if len(stems) >= 2:
-        stem_a, stem_b = _pick_delta_order(stems[:2])
-        
-        # Get target columns for distance, height, thickness, and J.length
-        target_cols = _get_target_columns(stem_a, stem_b, merged_df)
-        
-        # Create new dataframe with id, corrected distance, and other metrics
-        result_df = pd.DataFrame()
-        result_df["id"] = range(1, len(merged_df) + 1)
-        
-        # Build drift and compute corrected distance using T(x)=x-Δ(x) from 2007/2015
-        dist_a_col = f"{stem_a}__distance_ft"
-        dist_b_col = f"{stem_b}__distance_ft"
-        dist_a = pd.to_numeric(merged_df[dist_a_col], errors="coerce")
-        dist_b = pd.to_numeric(merged_df[dist_b_col], errors="coerce")
-        drift_fn = _build_drift_function(dist_a.values, dist_b.values)
-        corrected_distance = _apply_coordinate_transform(dist_a.values, drift_fn)
-        
-        # Store raw distances for later drift correction
-        result_df[f"{stem_a}__distance"] = dist_a
-        result_df[f"{stem_b}__distance"] = dist_b
-        
-        result_df.insert(1, "distance_corrected", corrected_distance)
-        result_df["distance__delta"] = dist_b - dist_a
-        
-        # For other metrics, store average and delta
-        for key, (col_a, col_b) in target_cols.items():
-            if key == "distance_ft":
-                continue  # Skip distance as we already handled it separately
-            
-            series_a = pd.to_numeric(merged_df[col_a], errors="coerce")
-            series_b = pd.to_numeric(merged_df[col_b], errors="coerce")
-            
-            result_df[f"{key}__avg"] = (series_a + series_b) / 2.0
-            result_df[f"{key}__delta"] = series_b - series_a
-        
-        # If r_2022 exists (3+ files), add its columns with suffix _2022
-        if len(stems) >= 3:
-            stem_2022 = next((s for s in stems if _extract_year(s) == 2022), None)
-            if stem_2022:
-                # Apply drift correction to r_2022 distances as well
-                dist_2022_col = f"{stem_2022}__distance_ft"
-                if dist_2022_col in merged_df.columns:
-                    dist_2022 = pd.to_numeric(merged_df[dist_2022_col], errors="coerce")
-                    result_df["distance_2022"] = dist_2022
-                    result_df["distance_2022_corrected"] = _apply_coordinate_transform(dist_2022.values, drift_fn)
-                
-                # Add other metrics from 2022
-                height_2022_col = _find_column_by_pattern(
-                    [col[len(f"{stem_2022}__"):] for col in merged_df.columns if col.startswith(f"{stem_2022}__")],
-                    ["Height", "height", "Elevation", "elevation"]
-                )
-                thickness_2022_col = _find_column_by_pattern(
-                    [col[len(f"{stem_2022}__"):] for col in merged_df.columns if col.startswith(f"{stem_2022}__")],
-                    ["t [in]", "T [in]", "Wt [in]", "WT [in]", "thickness", "Thickness"]
-                )
-                jlength_2022_col = _find_column_by_pattern(
-                    [col[len(f"{stem_2022}__"):] for col in merged_df.columns if col.startswith(f"{stem_2022}__")],
-                    ["J. len [ft]", "J.len [ft]", "Joint Length", "joint length", "J. length"]
-                )
-                
-                if height_2022_col:
-                    result_df["height_2022"] = pd.to_numeric(merged_df[f"{stem_2022}__{height_2022_col}"], errors="coerce")
-                if thickness_2022_col:
-                    result_df["thickness_2022"] = pd.to_numeric(merged_df[f"{stem_2022}__{thickness_2022_col}"], errors="coerce")
-                if jlength_2022_col:
-                    result_df["jlength_2022"] = pd.to_numeric(merged_df[f"{stem_2022}__{jlength_2022_col}"], errors="coerce")
-        
-        merged_df = result_df
-
-    output_path = os.path.join(ALIGNED_FOLDER, "merged_by_distance.csv")
-    merged_df.to_csv(output_path, index=False)
+
+def save_aligned(merged_df, output_folder=ALIGNED_FOLDER, fmt=storage.DEFAULT_FORMAT):
+    os.makedirs(output_folder, exist_ok=True)
+    output_path = storage.artifact_path(output_folder, "merged_by_distance", fmt)
+    storage.write_frame(merged_df, output_path)
     print(f"Saved merged and averaged data to {output_path}")
 
+    # The drift model is saved once so later corrections only load and evaluate it
+    if sum(col.endswith("__distance") for col in merged_df.columns) >= 2:
+        path = model_path(output_folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        DriftModel.from_aligned(merged_df).save(path)
+        print(f"Saved drift model to {path}")
+
+
+def main():
+    frames = load_extracted()
+    if not frames:
+        print(f"No extracted weld files found in {EXTRACTED_FOLDER}")
+        return
+
+    save_aligned(align_runs(frames))
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Content-hash cache for pipeline stage outputs.
+
+A stage fingerprint combines the fingerprint of its input, its parameters and the
+source code of the modules that implement it. When a stage runs with a fingerprint
+that matches the one stored in its cache folder, the cached output is loaded instead
+of recomputing it. Fingerprints chain: a stage whose input came from an upstream stage
+in the same run uses that stage's fingerprint, so nothing upstream has to be re-read
+to decide that a stage is unchanged.
+
+Layout: <cache_folder>/<stage>/manifest.json plus one .npz artifact per output frame.
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from pre_processing import storage
+
+_MANIFEST = "manifest.json"
+_CHUNK_SIZE = 1 << 20
+
+
+def hash_files(paths):
+    """Hash the names and byte contents of files (order-independent)."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _update_with_frame(digest, df):
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+
+
+def hash_frames(value):
+    """Hash a DataFrame or a dict of DataFrames by content."""
+    digest = hashlib.sha256()
+    if isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(str(key).encode())
+            _update_with_frame(digest, value[key])
+    else:
+        _update_with_frame(digest, value)
+    return digest.hexdigest()
+
+
+def code_version(modules):
+    """Hash the source code of the given modules."""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, input_fingerprint, params, code):
+    """Combine everything a stage output depends on into one fingerprint."""
+    payload = json.dumps(
+        {"stage": stage, "input": input_fingerprint, "params": params, "code": code},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _stage_folder(cache_folder, stage):
+    return os.path.join(cache_folder, stage)
+
+
+def _read_manifest(cache_folder, stage):
+    manifest_path = os.path.join(_stage_folder(cache_folder, stage), _MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def is_cached(cache_folder, stage, fingerprint):
+    manifest = _read_manifest(cache_folder, stage)
+    return manifest is not None and manifest["fingerprint"] == fingerprint
+
+
+def load_cached(cache_folder, stage):
+    """
+    Load the cached output of a stage: a DataFrame, dict of DataFrames or None, or
+    for streamed stages a dict of paths to the cached artifacts.
+    """
+    manifest = _read_manifest(cache_folder, stage)
+    folder = _stage_folder(cache_folder, stage)
+    if manifest["kind"] == "none":
+        return None
+    if manifest["kind"] == "frame":
+        return storage.read_frame(storage.artifact_path(folder, "value"))
+    if manifest["kind"] == "paths":
+        return {key: os.path.join(folder, name) for key, name in zip(manifest["keys"], manifest["files"])}
+    return {
+        key: storage.read_frame(storage.artifact_path(folder, f"value_{i}"))
+        for i, key in enumerate(manifest["keys"])
+    }
+
+
+def store_cached(cache_folder, stage, fingerprint, value):
+    """Replace the cached output of a stage."""
+    invalidate(cache_folder, stage)
+    folder = _stage_folder(cache_folder, stage)
+    os.makedirs(folder)
+
+    if value is None:
+        manifest = {"kind": "none"}
+    elif isinstance(value, dict) and all(isinstance(v, str) for v in value.values()):
+        # Streamed outputs stay on disk: cache copies of the artifacts, not frames
+        files = []
+        for i, path in enumerate(value.values()):
+            files.append(f"value_{i}{os.path.splitext(path)[1]}")
+            shutil.copyfile(path, os.path.join(folder, files[-1]))
+        manifest = {"kind": "paths", "keys": list(value), "files": files}
+    elif isinstance(value, dict):
+        for i, df in enumerate(value.values()):
+            storage.write_frame(df, storage.artifact_path(folder, f"value_{i}"))
+        manifest = {"kind": "frames", "keys": list(value)}
+    else:
+        storage.write_frame(value, storage.artifact_path(folder, "value"))
+        manifest = {"kind": "frame"}
+
+    # The manifest is written last so an interrupted store never looks valid
+    manifest["fingerprint"] = fingerprint
+    storage.write_json(manifest, os.path.join(folder, _MANIFEST))
+
+
+def invalidate(cache_folder, stage=None):
+    """Drop the cached output of one stage, or of every stage when stage is None."""
+    folder = cache_folder if stage is None else _stage_folder(cache_folder, stage)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
@@ -0,0 +1,75 @@
+"""
+Completion markers for resumable pipeline runs.
+
+When a stage has saved its outputs, the pipeline writes <checkpoint_folder>/<stage>.json
+recording the stage fingerprint and the size and modification time of every artifact
+it wrote. The fingerprint combines the size and modification time of the stage's input
+artifacts with its parameters and code (see cache.stage_fingerprint), so nothing is
+hashed: a stage counts as complete while its inputs, settings and code are unchanged and
+its outputs are still the files it wrote. A stage that is rewritten changes the files
+the next stage reads, which invalidates that stage's marker in turn.
+
+The marker of a stage is removed before the stage saves and written once every output
+is in place, so a run stopped partway through leaves that stage incomplete and
+`run_pipeline(resume=True)` restarts from it.
+"""
+import datetime
+import json
+import os
+
+from pre_processing import storage
+
+
+def files_signature(paths):
+    """Size and modification time (ns) of each file, keyed by absolute path."""
+    signature = {}
+    for path in sorted(paths):
+        info = os.stat(path)
+        signature[os.path.abspath(path)] = [info.st_size, info.st_mtime_ns]
+    return signature
+
+
+def _marker_path(checkpoint_folder, stage):
+    return os.path.join(checkpoint_folder, f"{stage}.json")
+
+
+def read_marker(checkpoint_folder, stage):
+    """Completion marker of a stage, or None when it has none (or an unreadable one)."""
+    path = _marker_path(checkpoint_folder, stage)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_complete(checkpoint_folder, stage, fingerprint):
+    """Whether the stage completed with this fingerprint and its outputs are unchanged since."""
+    marker = read_marker(checkpoint_folder, stage)
+    if marker is None or marker["fingerprint"] != fingerprint:
+        return False
+    try:
+        return files_signature(marker["outputs"]) == marker["outputs"]
+    except OSError:
+        return False
+
+
+def mark_complete(checkpoint_folder, stage, fingerprint, output_paths):
+    """Record that a stage saved `output_paths` with this fingerprint."""
+    os.makedirs(checkpoint_folder, exist_ok=True)
+    marker = {
+        "stage": stage,
+        "completed": datetime.datetime.now().isoformat(timespec="seconds"),
+        "fingerprint": fingerprint,
+        "outputs": files_signature(output_paths),
+    }
+    storage.write_json(marker, _marker_path(checkpoint_folder, stage))
+
+
+def clear(checkpoint_folder, stage):
+    """Remove the completion marker of a stage."""
+    path = _marker_path(checkpoint_folder, stage)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,122 @@
+"""
+Clock-position parsing.
+
+Runs record orientation as 'h:mm' text ("2:25", "12:05"), as times read from Excel
+("02:25:00", possibly with a date in front), or as numbers (a fraction of a day from
+Excel, or hours). parse_clock converts any of these to an angle clockwise from 12
+o'clock in one vectorized pass: the column is factorized, only the distinct values are
+parsed, and the angles are spread back through the codes. Values that cannot be
+parsed become NaN and are counted.
+
+A plain number is ambiguous: 0.5 is 12:00 as an Excel fraction of a day but 0:30 as
+hours. Excel times arrive as times, not numbers, so numbers are read as fractions of a
+day only when every number in the column is below 1 (a column of day fractions never
+reaches 1); otherwise they are hours. Readers that see a column in chunks decide once
+for the whole column with largest_number and pass day_fraction to parse_clock.
+"""
+import numpy as np
+import pandas as pd
+
+# h:mm with optional :ss, at the end of the value (anything before it, e.g. a date, is ignored)
+_CLOCK_PATTERN = r"(?:^|\s|T)(\d{1,2})\s*:\s*(\d{1,2})(?:\s*:\s*(\d{1,2}(?:\.\d*)?))?\s*$"
+
+
+def _hours_to_degrees(hours):
+    return np.mod(hours, 12.0) * 30.0
+
+
+def _is_number_column(values):
+    return pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+
+
+def _plain_numbers(labels):
+    """Each string in labels as a number ("3", "0.25"), NaN where it is not a plain number."""
+    return pd.to_numeric(pd.Series(labels, dtype="str").str.strip(), errors="coerce").to_numpy(dtype="float64")
+
+
+def _largest(numbers):
+    numbers = numbers[~np.isnan(numbers)]
+    return float(numbers.max()) if len(numbers) else np.nan
+
+
+def _is_day_fraction(numbers):
+    """Whether numbers are Excel fractions of a day: there is one and all are below 1."""
+    return _largest(numbers) < 1.0
+
+
+def _numeric_hours(values, day_fraction):
+    """Hours from numbers that are fractions of a day or already hours."""
+    return values * 24.0 if day_fraction else values
+
+
+def _text_hours(values, day_fraction=None):
+    """Hours for each string in values, or NaN where it is not a clock position."""
+    text = pd.Series(values, dtype="str").str.strip()
+    parts = text.str.extract(_CLOCK_PATTERN)
+    hours = pd.to_numeric(parts[0], errors="coerce").to_numpy(dtype="float64")
+    minutes = pd.to_numeric(parts[1], errors="coerce").to_numpy(dtype="float64")
+    seconds = pd.to_numeric(parts[2], errors="coerce").fillna(0).to_numpy(dtype="float64")
+    valid = (hours <= 24) & (minutes < 60) & (seconds < 60)
+    parsed = np.where(valid, hours + minutes / 60.0 + seconds / 3600.0, np.nan)
+
+    # Plain numbers stored as text ("3", "0.25")
+    numbers = _plain_numbers(text)
+    if day_fraction is None:
+        day_fraction = _is_day_fraction(numbers)
+    return np.where(np.isnan(parsed), _numeric_hours(numbers, day_fraction), parsed)
+
+
+def largest_number(values):
+    """
+    Largest plain number among clock values (h:mm text and times are not numbers), or
+    NaN when there is none. A column is read as day fractions when this is below 1.
+    """
+    values = pd.Series(values)
+    if _is_number_column(values):
+        numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+    elif pd.api.types.is_timedelta64_dtype(values):
+        return np.nan
+    else:
+        numbers = _plain_numbers(pd.Index(pd.unique(values.dropna())).astype(str))
+    return _largest(numbers)
+
+
+def parse_clock(values, unit="deg", day_fraction=None):
+    """
+    Convert clock positions to angles clockwise from 12 o'clock.
+
+    Args:
+        values: Series or array of clock positions in any supported form
+        unit: 'deg' (0-360) or 'rad' (0-2π)
+        day_fraction: Whether plain numbers are Excel fractions of a day (True) or
+            hours (False); None decides from the values: fractions when every number
+            is below 1 (see the module docstring)
+
+    Returns:
+        (angles, unparseable): float64 array of angles, NaN where the value is missing or
+        could not be parsed, and the number of non-missing values that could not be parsed
+    """
+    if unit not in ("deg", "rad"):
+        raise ValueError(f"Unknown angle unit {unit!r}; use 'deg' or 'rad'")
+    values = pd.Series(values)
+
+    if _is_number_column(values):
+        numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+        hours = _numeric_hours(numbers, _is_day_fraction(numbers) if day_fraction is None else day_fraction)
+        missing = values.isna().to_numpy()
+    elif pd.api.types.is_timedelta64_dtype(values):
+        hours = (values.dt.total_seconds() / 3600.0).to_numpy(dtype="float64", na_value=np.nan)
+        missing = values.isna().to_numpy()
+    else:
+        codes, uniques = pd.factorize(values)
+        labels = pd.Index(uniques).astype(str)
+        # Missing values have code -1 and pick up the entry appended at the end
+        hours = np.append(_text_hours(labels, day_fraction), np.nan)[codes]
+        blank = np.asarray(labels.str.strip() == "")
+        missing = np.append(blank, True)[codes]
+
+    degrees = _hours_to_degrees(hours)
+    unparseable = int(np.count_nonzero(np.isnan(degrees) & ~missing))
+    if unit == "rad":
+        return np.deg2rad(degrees), unparseable
+    return degrees, unparseable
@@ -0,0 +1,244 @@
+"""
+Coarse run-to-run offsets from joint-length signatures.
+
+The sequence of joint lengths along a line is nearly the same in every inspection,
+whatever the odometer did. Cross-correlating the joint-length sequences of two runs
+with an FFT (O(n log n)) gives the joint lag between them, and the median distance
+difference over the overlapping joints is the coarse offset. The lag is first found
+for one stretch of reference joints (the anchor); every window is then correlated
+against a short stretch of the run where its neighbour's offset places it, which gives a
+piecewise offset that follows odometer slip and missing welds along the line.
+
+align.py shifts each run's merge key by this offset before the fine merge_asof, so the
+match tolerance can stay tight without losing welds.
+
+The window walk is sequential, but on long lines it can be split into pieces walked in
+parallel processes with exactly the serial result (see _walk_split).
+"""
+import numpy as np
+
+from pre_processing import parallel
+
+# Reference joints per piecewise window
+WINDOW_JOINTS = 64
+# Extra run joints searched on each side of a window's predicted position
+SEARCH_JOINTS = 8
+# Minimum correlation score (about a Pearson coefficient) to accept a lag
+MIN_SCORE = 0.5
+# Joint lengths are clipped to this many robust standard deviations from the median
+CLIP = 2.5
+# Reference joints in the anchor stretch that is located in the whole run; it is
+# longer than a window so a chance match in a long run cannot reach MIN_SCORE
+ANCHOR_JOINTS = 256
+# Anchor stretches tried, in order from the start of the reference
+ANCHOR_TRIES = 8
+# Windows per piece when the walk is split across processes
+PIECE_WINDOWS = 64
+
+
+def _standardize(values):
+    """
+    Zero-mean, unit-variance copy of a sequence; missing values become 0. Values more
+    than CLIP robust standard deviations (median/MAD) from the median are clipped first,
+    so short pup joints and merged joints (a missed weld) neither dominate the
+    correlation nor inflate the scale of the ordinary joints.
+    """
+    values = np.asarray(values, dtype="float64")
+    finite = np.isfinite(values)
+    if finite.sum() < 2:
+        return np.zeros(len(values))
+    x = values[finite]
+    median = np.median(x)
+    mad = 1.4826 * np.median(np.abs(x - median))
+    if mad > 0:
+        x = np.clip(x, median - CLIP * mad, median + CLIP * mad)
+    if x.std() == 0:
+        return np.zeros(len(values))
+    z = np.zeros(len(values))
+    z[finite] = (x - x.mean()) / x.std()
+    return np.clip(z, -CLIP, CLIP)
+
+
+def cross_correlate(a, b):
+    """
+    Correlate two standardized sequences at every lag with an FFT.
+
+    Args:
+        a, b: Standardized sequences
+
+    Returns:
+        (lags, scores, overlap): scores[i] is the mean of a[j] * b[j + lags[i]] over
+        the overlap[i] positions where both sequences are defined
+    """
+    size = 1 << (len(a) + len(b) - 2).bit_length()
+    full = np.fft.irfft(np.conj(np.fft.rfft(a, size)) * np.fft.rfft(b, size), size)
+
+    lags = np.arange(-(len(a) - 1), len(b))
+    overlap = np.minimum(len(a), len(b) - lags) - np.maximum(0, -lags)
+    return lags, full[lags % size] / overlap, overlap
+
+
+def _best_lag(a, b, min_overlap):
+    """Lag of b relative to a with the highest score, or (None, nan) if a or b is too short."""
+    if len(a) < 2 or len(b) < 2:
+        return None, np.nan
+    lags, scores, overlap = cross_correlate(_standardize(a), _standardize(b))
+    scores = np.where(overlap >= min_overlap, scores, -np.inf)
+    best = int(np.argmax(scores))
+    return int(lags[best]), scores[best]
+
+
+def _median_offset(ref_distance, run_distance, start, stop, lag):
+    """Median run-minus-reference distance over reference joints [start, stop) shifted by lag."""
+    i = np.arange(start, stop)
+    j = i + lag
+    keep = (j >= 0) & (j < len(run_distance))
+    if not keep.any():
+        return np.nan
+    return np.nanmedian(run_distance[j[keep]] - ref_distance[i[keep]])
+
+
+def _anchor(ref_distance, ref_jlength, run_distance, run_jlength):
+    """
+    Locate a stretch of ANCHOR_JOINTS reference joints in the whole run.
+
+    Returns:
+        (start, offset, score) of the first stretch that correlates, or None
+    """
+    for start in range(0, len(ref_jlength) - 1, ANCHOR_JOINTS)[:ANCHOR_TRIES]:
+        stop = min(start + ANCHOR_JOINTS, len(ref_jlength))
+        local, score = _best_lag(ref_jlength[start:stop], run_jlength, stop - start)
+        if local is not None and score >= MIN_SCORE:
+            return start, _median_offset(ref_distance, run_distance, start, stop, local - start), score
+    return None
+
+
+def _window_offset(start, stop, offset, ref_distance, ref_jlength, run_distance, run_jlength):
+    """
+    Offset of the window of reference joints [start, stop), searched within SEARCH_JOINTS
+    of where the neighbouring window's offset puts it in the run, or nan when nothing
+    there correlates.
+    """
+    predicted = int(np.searchsorted(run_distance, ref_distance[start] + offset))
+    lo = max(0, predicted - SEARCH_JOINTS)
+    hi = min(len(run_distance), predicted + (stop - start) + SEARCH_JOINTS)
+    # Only lags that keep the whole window inside the searched stretch
+    local, score = _best_lag(ref_jlength[start:stop], run_jlength[lo:hi], stop - start)
+    if local is None or not score >= MIN_SCORE:
+        return np.nan
+    return _median_offset(ref_distance, run_distance, start, stop, lo + local - start)
+
+
+def _walk(arrays, task):
+    """
+    Offsets of a sequence of windows, each searched near the last accepted offset.
+
+    Args:
+        arrays: (ref_distance, ref_jlength, run_distance, run_jlength)
+        task: (window bounds [(start, stop), ...] in visiting order, offset carried into the first)
+    """
+    bounds, carried = task
+    offsets = np.full(len(bounds), np.nan)
+    for n, (start, stop) in enumerate(bounds):
+        offsets[n] = _window_offset(start, stop, carried, *arrays)
+        if not np.isnan(offsets[n]):
+            carried = offsets[n]
+    return offsets
+
+
+def _walk_split(arrays, bounds, carried, workers):
+    """
+    _walk(arrays, (bounds, carried)), split into pieces of PIECE_WINDOWS walked in parallel.
+
+    The result is exactly the serial one. A quick serial pass over the first window of
+    every piece gives the offset each piece starts from. After the parallel walk, each
+    piece is walked again from the offset the piece before it really ended with, until
+    a window gives the same accepted offset as the parallel walk; from there both walks
+    carry the same value, so the rest of the piece already is the serial result.
+    """
+    if parallel.resolve_workers(workers) <= 1 or len(bounds) < 2 * PIECE_WINDOWS:
+        return _walk(arrays, (bounds, carried))
+
+    starts = list(range(0, len(bounds), PIECE_WINDOWS))
+    first_windows = _walk(arrays, ([bounds[i] for i in starts], carried))
+    tasks = [(bounds[:PIECE_WINDOWS], carried)]
+    guess = carried
+    for i, offset in zip(starts[1:], first_windows[1:]):
+        guess = guess if np.isnan(offset) else offset
+        tasks.append((bounds[i:i + PIECE_WINDOWS], guess))
+    offsets = np.concatenate(parallel.map_ordered(_walk, tasks, workers, context=arrays))
+
+    for i in starts:
+        stop = min(i + PIECE_WINDOWS, len(bounds))
+        if i > 0:
+            for k in range(i, stop):
+                offset = _window_offset(*bounds[k], carried, *arrays)
+                converged = offset == offsets[k]
+                offsets[k] = offset
+                if not np.isnan(offset):
+                    carried = offset
+                if converged:
+                    break
+        accepted = offsets[i:stop][~np.isnan(offsets[i:stop])]
+        if len(accepted):
+            carried = accepted[-1]
+    return offsets
+
+
+def estimate_offsets(ref_distance, ref_jlength, run_distance, run_jlength, workers=1):
+    """
+    Estimate the piecewise offset of a run relative to the reference.
+
+    One stretch of reference joints is located in the whole run (the anchor). The
+    windows are visited outwards from it; each is searched only near the position its
+    neighbour's offset predicts, so a missing or extra weld moves the joint lag but not
+    the offset that is carried forward.
+
+    Args:
+        ref_distance, ref_jlength: Reference weld distances and joint lengths, sorted by distance
+        run_distance, run_jlength: The same for the run
+        workers: Processes for the window walk on long lines (0 or None: one per CPU);
+            the offsets are identical to a serial walk
+
+    Returns:
+        (knots, offsets, score), where offsets (run minus reference, ft) apply at knots in
+        run distance and score is the correlation of the anchor stretch; None when the
+        joint-length signatures do not correlate
+    """
+    ref_distance = np.asarray(ref_distance, dtype="float64")
+    run_distance = np.asarray(run_distance, dtype="float64")
+    ref_jlength = np.asarray(ref_jlength, dtype="float64")
+    run_jlength = np.asarray(run_jlength, dtype="float64")
+    if len(ref_distance) < 2 or len(run_distance) < 2:
+        return None
+
+    anchor = _anchor(ref_distance, ref_jlength, run_distance, run_jlength)
+    if anchor is None:
+        return None
+    anchor_start, anchor_offset, score = anchor
+
+    windows = np.array_split(np.arange(len(ref_distance)), max(1, round(len(ref_distance) / WINDOW_JOINTS)))
+    first = next(k for k, window in enumerate(windows) if window[-1] >= anchor_start)
+    bounds = [(int(window[0]), int(window[-1]) + 1) for window in windows]
+    arrays = (ref_distance, ref_jlength, run_distance, run_jlength)
+    offsets = np.full(len(windows), np.nan)
+    for order in (np.arange(first, len(windows)), np.arange(first - 1, -1, -1)):
+        # Carry the last accepted offset outwards from the anchor
+        offsets[order] = _walk_split(arrays, [bounds[k] for k in order], anchor_offset, workers)
+
+    # Windows that did not correlate (e.g. around a missed weld) follow their neighbours
+    centres = np.array([np.median(ref_distance[window]) for window in windows])
+    found = ~np.isnan(offsets)
+    if not found.any():
+        offsets[:] = anchor_offset
+    else:
+        offsets[~found] = np.interp(centres[~found], centres[found], offsets[found])
+
+    knots = centres + offsets
+    order = np.argsort(knots)
+    return knots[order], offsets[order], score
+
+
+def offset_at(run_distance, knots, offsets):
+    """Offset at each run distance: linear between knots, constant beyond the ends."""
+    return np.interp(np.asarray(run_distance, dtype="float64"), knots, offsets)
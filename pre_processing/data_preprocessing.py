@@ -1,22 +1,55 @@
-import pandas as pd
+import argparse
 import os
-from glob import glob
+
+import numpy as np
+
+from pre_processing import clock, instrument, memory, parallel, schema, storage
 
 # Get the data folder path
-data_folder = os.path.join(os.path.dirname(__file__), "..", "data")
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), "..", "data")
+PROCESSED_FOLDER = os.path.join(os.path.dirname(__file__), "processed")
 
-# Load all r_*.csv files
-csv_files = glob(os.path.join(data_folder, "r_*.csv"))
+# Rows per chunk in streaming mode
+DEFAULT_CHUNK_ROWS = 100_000
 
-# Create a dictionary to store dataframes
-dataframes = {}
+# Numeric clock position added next to the schema's clock column
+CLOCK_ANGLE_COLUMN = "clock [deg]"
 
-for file_path in sorted(csv_files):
-    filename = os.path.basename(file_path)
-    key = filename.replace(".csv", "")
-    df = pd.read_csv(file_path)
-    original_shape = df.shape
 
+def raw_run_paths(data_folder=DATA_FOLDER):
+    """Return the r_* run artifacts in the data folder, keyed by run name (e.g. 'r_2007')."""
+    return storage.list_artifacts(data_folder, "r_*")
+
+
+def load_raw_runs(data_folder=DATA_FOLDER):
+    """Load the schema columns of all r_* run artifacts in the data folder, keyed by run name."""
+    return {key: schema.read_run(file_path, key) for key, file_path in raw_run_paths(data_folder).items()}
+
+
+def run_ids(runs):
+    """1-based run_id of each run name, in sorted (chronological) order."""
+    return {key: i + 1 for i, key in enumerate(sorted(runs))}
+
+
+def add_run_columns(df, run_id, day_fraction=None):
+    """
+    Add run_id and CLOCK_ANGLE_COLUMN, the clock position in degrees clockwise from 12
+    o'clock (see clock.py). day_fraction is passed to clock.parse_clock; None decides
+    from this frame's clock values.
+
+    Returns:
+        (df, number of clock values that could not be parsed)
+    """
+    df = df.assign(run_id=run_id)
+    if schema.CLOCK not in df.columns:
+        return df, 0
+    angles, unparseable = clock.parse_clock(df[schema.CLOCK], day_fraction=day_fraction)
+    df[CLOCK_ANGLE_COLUMN] = angles
+    return df, unparseable
+
+
+def preprocess_frame(df):
+    """Drop all-NaN columns and all-NaN rows. Returns (df, null_columns)."""
     # Find columns that are completely NaN/Null
     null_columns = df.columns[df.isnull().all()].tolist()
     # Delete columns with all NaN/Null values
@@ -24,23 +57,184 @@ for file_path in sorted(csv_files):
 
     # Delete rows where all values are NaN/Null
     df = df.dropna(how='all')
+    return df, null_columns
+
+
+def _preprocess_one(item):
+    """Worker: load (if given a path) the schema columns of one run and preprocess them."""
+    key, df, run_id, compact = item
+    if isinstance(df, str):
+        df = schema.read_run(df, key, compact)
+    else:
+        df = schema.apply_schema(df, key, compact)
+    original_shape = df.shape
+    df, null_columns = preprocess_frame(df)
+    df, unparseable = add_run_columns(df, run_id)
+    if compact:
+        df = memory.compact_frame(df)
+    return key, df, original_shape, null_columns, unparseable
+
+
+def preprocess_runs(raw_runs, workers=1, compact=False):
+    """
+    Preprocess every raw run and return a dict of cleaned frames.
+
+    Only the columns declared in schema.py are kept, under their canonical names and
+    dtypes; each run also gets its run_id and the clock angle (see add_run_columns).
+
+    Args:
+        raw_runs: dict mapping run name to its raw DataFrame or to an artifact path,
+            which is then loaded by the worker that preprocesses it
+        workers: Number of processes; runs are independent so each can go to its own
+            worker. Output order follows raw_runs.
+        compact: Read measurements as float32 and shrink the frames (see memory.py)
+    """
+    ids = run_ids(raw_runs)
+    tasks = [(key, df, ids[key], compact) for key, df in raw_runs.items()]
+    dataframes = {}
+    for key, df, original_shape, null_columns, unparseable in parallel.map_ordered(
+        _preprocess_one, tasks, workers
+    ):
+        dataframes[key] = df
+        instrument.record_rows(rows_in=original_shape[0], rows_out=len(df))
+        instrument.record_dropped(original_shape[0] - len(df), "all-NaN rows")
+
+        print(f"Loaded {key}")
+        print(f"  Shape after schema read: {original_shape}")
+        if null_columns:
+            print(f"  Deleted {len(null_columns)} completely empty columns: {null_columns}")
+        if unparseable:
+            print(f"  {unparseable} clock values could not be parsed and were set to NaN")
+        print(f"  Final shape: {df.shape}")
+
+    print(f"\nProcessed {len(dataframes)} dataframes")
+    return dataframes
+
+
+def find_null_columns_chunked(input_path, chunksize=DEFAULT_CHUNK_ROWS, run=None):
+    """
+    First streaming pass: find the schema columns that are NaN/Null in every row of the
+    file, and whether its clock numbers are fractions of a day, which is decided over the
+    whole column rather than chunk by chunk (see clock.py).
+
+    Returns:
+        (null_columns, original_shape, day_fraction)
+    """
+    seen = None
+    rows = 0
+    largest = np.nan
+    for chunk in schema.iter_run_chunks(input_path, chunksize, run):
+        has_value = chunk.notna().any()
+        seen = has_value if seen is None else seen | has_value
+        rows += len(chunk)
+        if schema.CLOCK in chunk.columns:
+            largest = np.fmax(largest, clock.largest_number(chunk[schema.CLOCK]))
+    day_fraction = bool(largest < 1.0)
+    if seen is None:
+        columns = list(schema.resolve_columns(storage.read_columns(input_path), run).values())
+        return columns, (0, len(columns)), day_fraction
+    return seen.index[~seen].tolist(), (rows, len(seen)), day_fraction
+
+
+def preprocess_file_chunked(input_path, output_path, chunksize=DEFAULT_CHUNK_ROWS, run=None, run_id=1, compact=False):
+    """
+    Preprocess one run in fixed-size chunks, writing the output as it goes.
+
+    Two passes over the schema columns of the input: the first finds the all-null
+    columns across the whole file, the second drops them and the empty rows chunk by
+    chunk, adds the run columns and appends each chunk to output_path. Peak memory is
+    bounded by the chunk size.
+
+    Returns:
+        (original_shape, null_columns, final_shape, unparseable clock values)
+    """
+    null_columns, original_shape, day_fraction = find_null_columns_chunked(input_path, chunksize, run)
+    unparseable = 0
+    with storage.ChunkWriter(output_path) as writer:
+        for chunk in schema.iter_run_chunks(input_path, chunksize, run, compact):
+            chunk = chunk.drop(columns=null_columns).dropna(how='all')
+            chunk, bad = add_run_columns(chunk, run_id, day_fraction)
+            unparseable += bad
+            writer.append(memory.compact_frame(chunk) if compact else chunk)
+    final_shape = (writer.rows, len(writer.columns or []))
+    return original_shape, null_columns, final_shape, unparseable
+
+
+def _preprocess_file_one(task):
+    """Worker: stream one run from input_path to output_path."""
+    key, input_path, output_path, chunksize, run_id, compact = task
+    return (key, output_path) + preprocess_file_chunked(input_path, output_path, chunksize, key, run_id, compact)
+
+
+def preprocess_runs_chunked(raw_paths, output_folder=PROCESSED_FOLDER, fmt=storage.DEFAULT_FORMAT,
+                            chunksize=DEFAULT_CHUNK_ROWS, workers=1, compact=False):
+    """
+    Streaming counterpart of preprocess_runs for runs larger than memory.
+
+    Args:
+        raw_paths: dict mapping run name to its raw artifact path
+        output_folder: Folder for the <run>_processed.<fmt> outputs
+        fmt: Output artifact format
+        chunksize: Rows per chunk
+        workers: Number of processes (one run per worker)
+        compact: Write compact dtypes (see preprocess_runs)
+
+    Returns:
+        dict mapping run name to its processed artifact path
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    ids = run_ids(raw_paths)
+    tasks = [
+        (key, path, storage.artifact_path(output_folder, f"{key}_processed", fmt), chunksize, ids[key], compact)
+        for key, path in raw_paths.items()
+    ]
+    processed = {}
+    for key, output_path, original_shape, null_columns, final_shape, unparseable in parallel.map_ordered(
+        _preprocess_file_one, tasks, workers
+    ):
+        processed[key] = output_path
+        instrument.record_rows(rows_in=original_shape[0], rows_out=final_shape[0])
+        instrument.record_dropped(original_shape[0] - final_shape[0], "all-NaN rows")
+
+        print(f"Streamed {key} in chunks of {chunksize} rows")
+        print(f"  Shape after schema read: {original_shape}")
+        if null_columns:
+            print(f"  Deleted {len(null_columns)} completely empty columns: {null_columns}")
+        if unparseable:
+            print(f"  {unparseable} clock values could not be parsed and were set to NaN")
+        print(f"  Final shape: {final_shape}")
+        print(f"Saved {os.path.basename(output_path)}")
+
+    print(f"\nProcessed {len(processed)} dataframes")
+    return processed
+
+
+def save_processed(dataframes, output_folder=PROCESSED_FOLDER, fmt=storage.DEFAULT_FORMAT):
+    """Save processed dataframes as <run>_processed.<fmt>."""
+    os.makedirs(output_folder, exist_ok=True)
+    print("\nSaving processed dataframes...")
+
+    for name, df in dataframes.items():
+        output_path = storage.artifact_path(output_folder, f"{name}_processed", fmt)
+        storage.write_frame(df, output_path)
+        print(f"Saved {os.path.basename(output_path)}")
 
-    dataframes[key] = df
 
-    print(f"Loaded {filename}")
-    print(f"  Original shape: {original_shape}")
-    if null_columns:
-        print(f"  Deleted {len(null_columns)} completely empty columns: {null_columns}")
-    print(f"  Final shape: {df.shape}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read the schema columns of the raw runs and remove empty columns and rows")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help=f"Stream each run in chunks of N rows (e.g. {DEFAULT_CHUNK_ROWS}) instead of loading it whole",
+    )
+    args = parser.parse_args(argv)
 
-print(f"\nProcessed {len(dataframes)} dataframes")
+    if args.chunksize:
+        preprocess_runs_chunked(raw_run_paths(), chunksize=args.chunksize)
+    else:
+        save_processed(preprocess_runs(raw_run_paths()))
 
-# Save processed dataframes to processed folder
-output_folder = os.path.join(os.path.dirname(__file__), "processed")
-os.makedirs(output_folder, exist_ok=True)
-print("\nSaving processed dataframes...")
 
-for name, df in dataframes.items():
-    output_path = os.path.join(output_folder, f"{name}_processed.csv")
-    df.to_csv(output_path, index=False)
-    print(f"Saved {name}_processed.csv")
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,23 @@
+import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
-import matplotlib.pyplot as plt
+
+from pre_processing import apply_drift_correction, storage
+from pre_processing.drift_model import DriftModel
 
 # Paths
 ALIGNED_FOLDER = os.path.join(os.path.dirname(__file__), "aligned")
 CORRECTED_FOLDER = os.path.join(os.path.dirname(__file__), "corrected")
-os.makedirs(CORRECTED_FOLDER, exist_ok=True)
 
-INPUT_FILE = os.path.join(ALIGNED_FOLDER, "merged_by_distance.csv")
 OUTPUT_FILE = os.path.join(CORRECTED_FOLDER, "drift_corrected.csv")
 PLOT_FILE = os.path.join(CORRECTED_FOLDER, "drift_function.png")
 
+# Weld pairs drawn at most; longer series are decimated (see lttb_indices)
+PLOT_MAX_POINTS = 2000
+
 
 def build_drift_function(df):
     """
@@ -24,32 +29,17 @@ def build_drift_function(df):
         df: DataFrame with columns 'r_2007_weld_aligned__distance' and 'r_2015_weld_aligned__distance'
     
     Returns:
-        drift_function: A callable function Δ(x) that interpolates drift at any distance x
+        drift_function: A DriftModel; calling it interpolates drift at any distance x
         x_points: Array of x-coordinates (2007 distances)
         delta_values: Array of drift values at each point
     """
-    x_2007 = df['r_2007_weld_aligned__distance'].values
-    x_2015 = df['r_2015_weld_aligned__distance'].values
-    
-    # Calculate drift: Δ(x) = x_2015 - x_2007
-    delta_values = x_2015 - x_2007
-    
-    # Sort by 2007 distances to ensure monotonic x-axis
-    sort_idx = np.argsort(x_2007)
-    x_points = x_2007[sort_idx]
-    delta_sorted = delta_values[sort_idx]
-    
-    # Build piecewise-linear interpolation
-    # Using linear interpolation between weld points
-    drift_function = interp1d(
-        x_points, 
-        delta_sorted, 
-        kind='linear', 
-        fill_value='extrapolate',
-        assume_sorted=True
+    drift_function = DriftModel.from_pairs(
+        df['r_2007_weld_aligned__distance'].values,
+        df['r_2015_weld_aligned__distance'].values,
+        'r_2007_weld_aligned',
+        'r_2015_weld_aligned',
     )
-    
-    return drift_function, x_points, delta_sorted
+    return drift_function, drift_function.knots, drift_function.delta
 
 
 def coordinate_transform(x_2007, drift_function):
@@ -70,34 +60,102 @@ def coordinate_transform(x_2007, drift_function):
     return x_corrected
 
 
-def plot_drift_function(x_points, delta_values, output_path):
-    """Plot the drift function for visualization."""
-    plt.figure(figsize=(12, 6))
-    
+def lttb_indices(x, y, n_out):
+    """
+    Indices kept by Largest-Triangle-Three-Buckets decimation, plus the minimum and maximum of y.
+
+    The first and last points are always kept. The points between them are split into
+    n_out - 2 buckets, and each bucket keeps the point forming the largest triangle with
+    the point kept from the previous bucket and the mean of the next bucket, so peaks
+    and steps survive where plain striding would skip them.
+
+    Args:
+        x: Sorted x values
+        y: y values
+        n_out: Number of points to keep (before adding the extremes)
+
+    Returns:
+        Sorted array of indices into x and y
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Mean of every bucket, and of the last point as the bucket after the last one
+    starts = np.append(edges[:-1], n - 1)
+    counts = np.diff(np.append(starts, n))
+    mean_x = np.add.reduceat(x, starts) / counts
+    mean_y = np.add.reduceat(y, starts) / counts
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        bx, by = x[start:stop], y[start:stop]
+        area = np.abs((x[a] - mean_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return np.union1d(keep, [np.argmin(y), np.argmax(y)])
+
+
+def plot_drift_function(x_points, delta_values, output_path, max_points=PLOT_MAX_POINTS):
+    """
+    Plot the drift function for visualization.
+
+    Draws with matplotlib's object-oriented Figure API on the non-interactive Agg canvas,
+    so it needs no display and is safe to run in a background thread. Series longer than
+    max_points are decimated with lttb_indices; since Δ(x) is linear between its knots,
+    the same points draw both the observations and the function.
+
+    Returns:
+        output_path
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    keep = lttb_indices(x_points, delta_values, max_points)
+    x_shown, delta_shown = x_points[keep], delta_values[keep]
+    label = 'Weld pair observations'
+    if len(keep) < len(x_points):
+        label += f' ({len(keep)} of {len(x_points)} shown)'
+
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
     # Plot scatter of weld points
-    plt.scatter(x_points, delta_values, color='red', s=50, label='Weld pair observations', zorder=3)
-    
-    # Plot fitted line
-    x_continuous = np.linspace(x_points.min(), x_points.max(), 1000)
-    drift_func_temp = interp1d(x_points, delta_values, kind='linear', assume_sorted=True)
-    delta_continuous = drift_func_temp(x_continuous)
-    plt.plot(x_continuous, delta_continuous, 'b-', linewidth=2, label='Piecewise-linear drift Δ(x)')
-    
-    plt.xlabel('Distance 2007 (ft)', fontsize=12)
-    plt.ylabel('Drift Δ(x) = x_2015 - x_2007 (ft)', fontsize=12)
-    plt.title('Piecewise-Linear Drift Function', fontsize=14, fontweight='bold')
-    plt.grid(True, alpha=0.3)
-    plt.legend(fontsize=11)
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150)
-    print(f"Saved drift function plot to {output_path}")
-    plt.close()
-
-
-def main():
+    ax.scatter(x_shown, delta_shown, color='red', s=50 if len(keep) < 200 else 8, label=label, zorder=3)
+
+    # Plot the piecewise-linear line through the knots
+    ax.plot(x_shown, delta_shown, 'b-', linewidth=2, label='Piecewise-linear drift Δ(x)')
+
+    ax.set_xlabel('Distance 2007 (ft)', fontsize=12)
+    ax.set_ylabel('Drift Δ(x) = x_2015 - x_2007 (ft)', fontsize=12)
+    ax.set_title('Piecewise-Linear Drift Function', fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+    ax.legend(fontsize=11)
+    fig.tight_layout()
+    # The temporary file has no image extension, so the format comes from output_path
+    with storage.atomic_path(output_path) as temp:
+        fig.savefig(temp, dpi=150, format=os.path.splitext(output_path)[1][1:] or "png")
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build Δ(x) from the aligned welds and correct the 2007 distances")
+    parser.add_argument("--no-plot", action="store_true", help="Skip the drift function plot (batch runs)")
+    parser.add_argument(
+        "--max-plot-points",
+        type=int,
+        default=PLOT_MAX_POINTS,
+        help="Decimate the plotted weld pairs to about this many points",
+    )
+    args = parser.parse_args(argv)
+
     # Load merged data
-    print(f"Loading data from {INPUT_FILE}")
-    df = pd.read_csv(INPUT_FILE)
+    df = apply_drift_correction.load_aligned(ALIGNED_FOLDER)
     
     # Build drift function
     print("Building piecewise-linear drift function Δ(x)...")
@@ -108,24 +166,26 @@ def main():
     x_2007 = df['r_2007_weld_aligned__distance'].values
     x_corrected = coordinate_transform(x_2007, drift_func)
     
-    # Create output dataframe
-    result_df = df.copy()
-    result_df['x_2007_original'] = x_2007
-    result_df['drift_delta'] = drift_func(x_2007)
-    result_df['x_2007_corrected'] = x_corrected
+    # Create output dataframe (assign adds the columns without copying the merged table)
+    result_df = df.assign(x_2007_original=x_2007, drift_delta=drift_func(x_2007), x_2007_corrected=x_corrected)
     
     # Reorder columns for clarity
     cols = ['id', 'x_2007_original', 'drift_delta', 'x_2007_corrected', 
             'r_2015_weld_aligned__distance', 'thickness__avg', 'thickness__delta',
             'jlength__avg', 'jlength__delta']
-    result_df = result_df[cols]
+    result_df = result_df[[col for col in cols if col in result_df.columns]]
     
     # Save corrected data
-    result_df.to_csv(OUTPUT_FILE, index=False)
+    os.makedirs(CORRECTED_FOLDER, exist_ok=True)
+    storage.write_frame(result_df, OUTPUT_FILE)
     print(f"Saved drift-corrected data to {OUTPUT_FILE}")
     
-    # Plot drift function
-    plot_drift_function(x_points, delta_values, PLOT_FILE)
+    # Plot drift function in the background; the corrected data is already saved
+    plot = None
+    if not args.no_plot:
+        plotter = ThreadPoolExecutor(max_workers=1)
+        plot = plotter.submit(plot_drift_function, x_points, delta_values, PLOT_FILE, args.max_plot_points)
+        plotter.shutdown(wait=False)
     
     # Print summary statistics
     print("\n" + "="*70)
@@ -144,6 +204,9 @@ def main():
     print("\nSample corrected data (first 5 rows):")
     print(result_df.head())
 
+    if plot is not None:
+        print(f"\nSaved drift function plot to {plot.result()}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+"""
+Piecewise-linear drift model between two inspection runs.
+
+The drift Δ(x) = x_target - x_source is known at the matched welds (the knots) and
+interpolated linearly between them; beyond the first and last knot it continues the
+end segments (linear extrapolation). A model is built once from weld pairs, saved as a
+small .npz (two float64 arrays plus the run names, no pickle) and evaluated on any
+number of distances in one vectorized call:
+
+    model = DriftModel.from_pairs(x_2007, x_2015, "r_2007", "r_2015")
+    model.save(model_path("aligned"))
+    corrected = DriftModel.load(model_path("aligned")).transform(anomaly_distances)
+
+Models compose (2007 -> 2015 then 2015 -> 2022 gives 2007 -> 2022) and invert
+(2015 -> 2007) exactly, without going back to the weld pairs.
+
+align.py saves the model under aligned/models/, out of the way of the frame artifacts
+that storage.list_artifacts and `cli.py report` list, and the correct stage loads it
+from there.
+"""
+import os
+
+import numpy as np
+
+from pre_processing import storage
+
+MODEL_STEM = "drift_model"
+MODEL_FOLDER = "models"
+
+
+def model_path(aligned_folder):
+    """Path of the drift model saved with the aligned table in `aligned_folder`."""
+    return os.path.join(aligned_folder, MODEL_FOLDER, f"{MODEL_STEM}.npz")
+
+
+class DriftModel:
+    """Δ(x) sampled at sorted knots in source-run distance."""
+
+    def __init__(self, knots, delta, source=None, target=None):
+        knots = np.asarray(knots, dtype="float64")
+        delta = np.asarray(delta, dtype="float64")
+        if knots.shape != delta.shape or knots.ndim != 1 or len(knots) == 0:
+            raise ValueError("DriftModel needs matching one-dimensional knots and deltas")
+        if np.any(np.diff(knots) <= 0):
+            raise ValueError("DriftModel knots must be strictly increasing")
+        self.knots = knots
+        self.delta = delta
+        self.source = source
+        self.target = target
+
+    @classmethod
+    def from_pairs(cls, x_source, x_target, source=None, target=None):
+        """
+        Build the model from matched weld distances.
+
+        Pairs with a missing distance are skipped; welds at the same source distance are
+        merged into one knot with their mean drift.
+        """
+        x = np.asarray(x_source, dtype="float64")
+        y = np.asarray(x_target, dtype="float64")
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if not valid.any():
+            raise ValueError("No valid weld pairs to build a drift model from")
+
+        knots, inverse = np.unique(x[valid], return_inverse=True)
+        delta = np.bincount(inverse, weights=y[valid] - x[valid]) / np.bincount(inverse)
+        return cls(knots, delta, source, target)
+
+    @classmethod
+    def from_aligned(cls, df):
+        """
+        Build the model from the table written by align.align_runs, using its first two
+        <run>__distance columns (the reference run and the drift run).
+        """
+        columns = [col for col in df.columns if col.endswith("__distance")]
+        if len(columns) < 2:
+            raise ValueError("Aligned table has fewer than two <run>__distance columns")
+        source, target = columns[:2]
+        return cls.from_pairs(
+            df[source].to_numpy(dtype="float64", na_value=np.nan),
+            df[target].to_numpy(dtype="float64", na_value=np.nan),
+            source[: -len("__distance")],
+            target[: -len("__distance")],
+        )
+
+    def __len__(self):
+        return len(self.knots)
+
+    def __repr__(self):
+        return f"DriftModel({self.source} -> {self.target}, {len(self)} knots)"
+
+    def __call__(self, x):
+        """Δ(x) for every x, linear between knots and extrapolated from the end segments."""
+        x = np.asarray(x, dtype="float64")
+        if len(self.knots) == 1:
+            return np.full(x.shape, self.delta[0])
+
+        i = np.clip(np.searchsorted(self.knots, x, side="right") - 1, 0, len(self.knots) - 2)
+        x0 = self.knots[i]
+        d0 = self.delta[i]
+        slope = (self.delta[i + 1] - d0) / (self.knots[i + 1] - x0)
+        return d0 + slope * (x - x0)
+
+    def transform(self, x):
+        """Apply T(x) = x - Δ(x)."""
+        x = np.asarray(x, dtype="float64")
+        return x - self(x)
+
+    def forward(self, x):
+        """Map source-run distances to target-run distances: x + Δ(x)."""
+        x = np.asarray(x, dtype="float64")
+        return x + self(x)
+
+    def inverse(self):
+        """
+        Model from the target run back to the source run.
+
+        Exact as long as forward() is increasing (the drift never reverses the order of
+        welds); raises ValueError otherwise.
+        """
+        mapped = self.knots + self.delta
+        if np.any(np.diff(mapped) <= 0):
+            raise ValueError("Drift model is not invertible: it reverses the order of welds")
+        return DriftModel(mapped, -self.delta, self.target, self.source)
+
+    def compose(self, other):
+        """
+        Model from this model's source run to other's target run (this, then other).
+
+        The result is exact, end extrapolation included: its knots are this model's
+        knots plus other's knots mapped back into this model's source coordinates.
+        Raises ValueError when this model is not invertible (see inverse()).
+        """
+        knots = np.union1d(self.knots, self.inverse().forward(other.knots))
+        mapped = self.forward(knots)
+        return DriftModel(knots, other.forward(mapped) - knots, self.source, other.target)
+
+    def save(self, path):
+        """Write the model to a .npz file (atomically, see storage.atomic_path)."""
+        with storage.atomic_path(path) as temp, open(temp, "wb") as f:
+            np.savez(
+                f,
+                knots=self.knots,
+                delta=self.delta,
+                source=np.array(self.source or ""),
+                target=np.array(self.target or ""),
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Read a model written by save()."""
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz["knots"], npz["delta"], str(npz["source"]) or None, str(npz["target"]) or None)
@@ -1,62 +1,149 @@
-import pandas as pd
 import os
 
+import numpy as np
+import pandas as pd
+
+from pre_processing import instrument, parallel, schema, storage
+
 # Get the processed folder path
-processed_folder = os.path.join(os.path.dirname(__file__), "processed")
-aligned_folder = os.path.join(os.path.dirname(__file__), "extracted")
-os.makedirs(aligned_folder, exist_ok=True)
-
-# Define files and their corresponding column names
-files_to_process = [
-    {
-        "file": "r_2007_processed.csv",
-        "event_col": "event",
-        "log_dist_col": "log dist. [ft]",
-        "clock_col": "o'clock"
-    },
-    {
-        "file": "r_2015_processed.csv",
-        "event_col": "Event Description",
-        "log_dist_col": "Log Dist. [ft]",
-        "clock_col": "O'clock"
-    },
-    {
-        "file": "r_2022_processed.csv",
-        "event_col": "Event Description",
-        "log_dist_col": "ILI Wheel Count \n[ft.]",
-        "clock_col": "O'clock\n[hh:mm]"
-    },
-]
-
-for file_info in files_to_process:
-    filename = file_info["file"]
-    event_col = file_info["event_col"]
-    log_dist_col = file_info["log_dist_col"]
-    clock_col = file_info["clock_col"]
-    
-    file_path = os.path.join(processed_folder, filename)
-    df = pd.read_csv(file_path)
-    
-    # Extract rows where event column contains "Weld"
+PROCESSED_FOLDER = os.path.join(os.path.dirname(__file__), "processed")
+EXTRACTED_FOLDER = os.path.join(os.path.dirname(__file__), "extracted")
+
+# Feature-class taxonomy: each event description is assigned to the first class with a
+# case-insensitive substring match; descriptions that match nothing fall into OTHER_CLASS.
+FEATURE_CLASSES = {
+    "weld": ["weld"],
+    "metal_loss": ["metal loss", "corrosion", "gouge"],
+    "dent": ["dent"],
+    "valve": ["valve"],
+    "tee": ["tee"],
+}
+OTHER_CLASS = "other"
+
+def classify_events(events, classes=FEATURE_CLASSES):
+    """
+    Classify event descriptions into feature classes in one vectorized pass.
+
+    The column is converted to a categorical once and only its distinct values are
+    matched against the taxonomy; every row then picks up its class through the codes.
+
+    Args:
+        events: Series of event descriptions
+        classes: dict mapping class name to the substrings that identify it
+
+    Returns:
+        Categorical Series of class names (categories in taxonomy order, then OTHER_CLASS)
+    """
+    events = events.astype("category")
+    descriptions = events.cat.categories.astype(str).str.lower()
+    labels = list(classes) + [OTHER_CLASS]
+
+    category_class = np.full(len(descriptions), len(classes), dtype="int8")
+    for i, patterns in reversed(list(enumerate(classes.values()))):
+        matched = np.zeros(len(descriptions), dtype=bool)
+        for pattern in patterns:
+            matched |= descriptions.str.contains(pattern.lower(), regex=False)
+        category_class[matched] = i
+
+    # Missing descriptions (code -1) are OTHER_CLASS
+    codes = np.append(category_class, len(classes))[events.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, labels), index=events.index)
+
+
+def extract_features(df, event_col=schema.EVENT, classes=FEATURE_CLASSES):
+    """
+    Partition the rows of a processed run by feature class.
+
+    Args:
+        df: Processed run DataFrame
+        event_col: Name of its event description column
+        classes: Feature-class taxonomy (see FEATURE_CLASSES)
+
+    Returns:
+        dict mapping class name to its rows, each with all-NaN columns dropped and a
+        1-based id column; classes without rows are left out
+    """
+    df = df.assign(**{event_col: df[event_col].astype("category")})
+    feature_class = classify_events(df[event_col], classes)
+
+    features = {}
+    for label in feature_class.cat.categories:
+        rows = df[(feature_class == label).to_numpy()]
+        if rows.empty:
+            continue
+        rows = rows.dropna(axis=1, how="all")
+        if event_col in rows.columns:
+            rows[event_col] = rows[event_col].cat.remove_unused_categories()
+        # Add 1-based sequential id column at the start
+        rows.insert(0, "id", range(1, len(rows) + 1))
+        features[label] = rows
+    return features
+
+
+def _extract_one(item):
+    """Worker: partition one run by feature class. Returns (features, total_rows, error)."""
+    df, event_col, classes = item
+    if isinstance(df, str):
+        df = storage.read_frame(df)
     try:
-        weld_rows = df[df[event_col].astype(str).str.contains('Weld', case=False, na=False)].copy()
+        return extract_features(df, event_col, classes), len(df), None
     except Exception as e:
-        print(f"Error processing {filename}: {e}")
-        continue
-    
-    # Delete columns that have all NaN values
-    weld_rows = weld_rows.dropna(axis=1, how='all')
-    # Add 1-based sequential id column at the start
-    weld_rows.insert(0, "id", range(1, len(weld_rows) + 1))
-
-    print(f"Total rows in {filename}: {len(df)}")
-    print(f"Weld rows: {len(weld_rows)}")
-    print(f"Columns: {list(weld_rows.columns)}")
-    print(f"First few weld rows:")
-    print(weld_rows.head())
-    
-    # Save weld rows to extracted folder
-    output_filename = filename.replace("_processed.csv", "_weld_aligned.csv")
-    output_path = os.path.join(aligned_folder, output_filename)
-    weld_rows.to_csv(output_path, index=False)
-    print(f"Saved weld rows to {output_filename}\n")
\ No newline at end of file
+        return None, len(df), str(e)
+
+
+def extract_runs(processed, workers=1):
+    """
+    Extract the feature classes of processed runs.
+
+    Args:
+        processed: dict mapping run name (e.g. 'r_2007') to its processed DataFrame
+            or artifact path (loaded by the worker that extracts it)
+        workers: Number of processes; each run is extracted independently and the
+            output keeps the order of processed
+
+    Returns:
+        dict mapping output stem (e.g. 'r_2007_weld_aligned', 'r_2007_metal_loss_aligned')
+        to the rows of that run and class
+    """
+    tasks = [(df, schema.EVENT, FEATURE_CLASSES) for df in processed.values()]
+    results = parallel.map_ordered(_extract_one, tasks, workers)
+
+    extracted = {}
+    for run, (features, total_rows, error) in zip(processed, results):
+        filename = f"{run}_processed"
+        instrument.record_rows(rows_in=total_rows)
+        if error is not None:
+            print(f"Error processing {filename}: {error}")
+            instrument.record_dropped(total_rows, f"{run}: extraction failed")
+            continue
+
+        print(f"{filename}: {total_rows} rows, per feature class { {label: len(rows) for label, rows in features.items()} }")
+
+        for label, rows in features.items():
+            extracted[f"{run}_{label}_aligned"] = rows
+    return extracted
+
+
+def save_extracted(extracted, output_folder=EXTRACTED_FOLDER, fmt=storage.DEFAULT_FORMAT):
+    """Save each run/class partition as <stem>.<fmt> in the extracted folder."""
+    os.makedirs(output_folder, exist_ok=True)
+    for stem, rows in extracted.items():
+        output_path = storage.artifact_path(output_folder, stem, fmt)
+        storage.write_frame(rows, output_path)
+        print(f"Saved {len(rows)} rows to {os.path.basename(output_path)}")
+
+
+def load_processed(processed_folder=PROCESSED_FOLDER):
+    """Load every processed run from disk, keyed by run name in sorted order."""
+    return {
+        stem[: -len("_processed")]: storage.read_frame(file_path)
+        for stem, file_path in storage.list_artifacts(processed_folder, "*_processed").items()
+    }
+
+
+def main():
+    save_extracted(extract_runs(load_processed()))
+
+
+if __name__ == "__main__":
+    main()
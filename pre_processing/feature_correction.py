@@ -0,0 +1,168 @@
+"""
+Weld-anchored distance correction for every feature (welds, metal loss, dents, ...).
+
+Features sit inside joints, so they are placed relative to the welds around them rather
+than by interpolating a global drift. For each run, the matched welds from the aligned
+table give pairs (run distance, reference distance). Every feature is assigned to the
+matched weld upstream of it with searchsorted; its offset from that weld (the tool's
+distance-to-upstream-weld column when it refers to the same weld) is scaled by the
+ratio of the reference and run joint lengths:
+
+    corrected = ref_weld[i] + offset * (ref_weld[i+1] - ref_weld[i]) / (run_weld[i+1] - run_weld[i])
+
+Features before the first or after the last matched weld use the end joints. The
+reference run maps onto itself. Everything is batched NumPy, one pass per partition.
+"""
+import os
+
+import numpy as np
+
+from pre_processing import align, apply_drift_correction, instrument, schema, storage
+
+FEATURES_FOLDER = os.path.join(os.path.dirname(__file__), "features")
+OUTPUT_SUFFIX = "_corrected"
+
+# A feature's own upstream weld (distance minus distance-to-upstream-weld) is taken to
+# be the matched weld when they are within this many feet
+ANCHOR_SLACK = 0.5
+
+
+def weld_pairs(aligned, run_col, reference_col):
+    """
+    Matched weld distances of one run and the reference from the aligned table.
+
+    Pairs where the run weld is missing, repeated or out of order are dropped, so both
+    arrays are increasing.
+
+    Returns:
+        (run_welds, ref_welds, weld_ids): float64 arrays and the aligned ids
+    """
+    run = aligned[run_col].to_numpy(dtype="float64", na_value=np.nan)
+    ref = aligned[reference_col].to_numpy(dtype="float64", na_value=np.nan)
+    ids = aligned["id"].to_numpy()
+
+    valid = ~(np.isnan(run) | np.isnan(ref))
+    run, ref, ids = run[valid], ref[valid], ids[valid]
+    order = np.argsort(ref, kind="stable")
+    run, ref, ids = run[order], ref[order], ids[order]
+
+    # A run weld matched to several reference welds, or crossing its neighbours, is not an anchor
+    previous = np.maximum.accumulate(np.concatenate([[-np.inf], run[:-1]]))
+    keep = run > previous
+    return run[keep], ref[keep], ids[keep]
+
+
+def correct_distances(distance, upstream, run_welds, ref_welds, slack=ANCHOR_SLACK):
+    """
+    Map run distances into reference coordinates between matched welds.
+
+    Args:
+        distance: Feature distances in the run
+        upstream: Distance from each feature to its upstream weld, or None
+        run_welds, ref_welds: Matched weld distances from weld_pairs()
+        slack: See ANCHOR_SLACK
+
+    Returns:
+        (corrected distances, index of the upstream matched weld)
+    """
+    distance = np.asarray(distance, dtype="float64")
+    if upstream is None:
+        upstream = np.full(distance.shape, np.nan)
+    upstream = np.asarray(upstream, dtype="float64")
+    has_upstream = ~np.isnan(upstream)
+    anchor = np.where(has_upstream, distance - upstream, distance)
+
+    # Upstream matched weld, and the joint whose length ratio applies (the end joints
+    # beyond the first and last weld)
+    key = np.where(has_upstream, anchor + slack, anchor)
+    i = np.clip(np.searchsorted(run_welds, key, side="right") - 1, 0, len(run_welds) - 1)
+    if len(run_welds) == 1:
+        ratio = 1.0
+    else:
+        j = np.minimum(i, len(run_welds) - 2)
+        ratio = (ref_welds[j + 1] - ref_welds[j]) / (run_welds[j + 1] - run_welds[j])
+
+    offset = distance - run_welds[i]
+    own_weld = has_upstream & (np.abs(anchor - run_welds[i]) <= slack)
+    offset = np.where(own_weld, upstream, offset)
+    return ref_welds[i] + offset * ratio, i
+
+
+def _run_of(stem, runs):
+    """Run name (e.g. 'r_2015') an extracted stem belongs to, or None."""
+    return next((run for run in runs if stem.startswith(f"{run}_")), None)
+
+
+def correct_features(aligned, extracted):
+    """
+    Place every extracted feature of every aligned run in reference-run coordinates.
+
+    Args:
+        aligned: Table produced by align.align_runs (its first <run>__distance column is
+            the reference run)
+        extracted: dict mapping extracted stem (e.g. 'r_2015_metal_loss_aligned') to its rows
+
+    Returns:
+        dict mapping '<run>_<class>_corrected' to the rows with two added columns:
+        weld_id (aligned id of the upstream matched weld) and distance_corrected
+    """
+    distance_cols = [col for col in aligned.columns if col.endswith("__distance")]
+    if not distance_cols:
+        raise ValueError("Aligned table has no <run>__distance columns")
+    reference_col = distance_cols[0]
+    suffix = "_weld_aligned__distance"
+    runs = {col[: -len(suffix)]: col for col in distance_cols if col.endswith(suffix)}
+
+    corrected = {}
+    pairs = {}
+    for stem, df in extracted.items():
+        run = _run_of(stem, runs)
+        if run is None:
+            print(f"Skipping {stem}: its run is not in the aligned table")
+            instrument.record_dropped(len(df), f"{stem}: its run is not in the aligned table")
+            continue
+        distance_col = schema.find_column(df.columns, schema.DISTANCE)
+        if distance_col is None:
+            print(f"Skipping {stem}: no distance column")
+            instrument.record_dropped(len(df), f"{stem}: no distance column")
+            continue
+        if run not in pairs:
+            pairs[run] = weld_pairs(aligned, runs[run], reference_col)
+        run_welds, ref_welds, weld_ids = pairs[run]
+        if len(run_welds) == 0:
+            print(f"Skipping {stem}: no matched welds for {run}")
+            instrument.record_dropped(len(df), f"{stem}: no matched welds for {run}")
+            continue
+
+        upstream_col = schema.find_column(df.columns, schema.UPSTREAM)
+        distance, joint = correct_distances(
+            df[distance_col].to_numpy(dtype="float64", na_value=np.nan),
+            None if upstream_col is None else df[upstream_col].to_numpy(dtype="float64", na_value=np.nan),
+            run_welds,
+            ref_welds,
+        )
+        out_stem = stem[: -len("_aligned")] if stem.endswith("_aligned") else stem
+        corrected[f"{out_stem}{OUTPUT_SUFFIX}"] = df.assign(weld_id=weld_ids[joint], distance_corrected=distance)
+        print(f"Corrected {len(df)} rows of {stem} against {len(run_welds)} matched welds")
+    return corrected
+
+
+def load_features(extracted_folder=align.EXTRACTED_FOLDER):
+    """Load every extracted partition (all runs and feature classes)."""
+    return {stem: storage.read_frame(path) for stem, path in storage.list_artifacts(extracted_folder).items()}
+
+
+def save_features(corrected, output_folder=FEATURES_FOLDER, fmt=storage.DEFAULT_FORMAT):
+    os.makedirs(output_folder, exist_ok=True)
+    for stem, df in corrected.items():
+        storage.write_frame(df, storage.artifact_path(output_folder, stem, fmt))
+    print(f"Saved {len(corrected)} corrected feature tables to {output_folder}")
+
+
+def main():
+    aligned = apply_drift_correction.load_aligned()
+    save_features(correct_features(aligned, load_features()))
+
+
+if __name__ == "__main__":
+    main()
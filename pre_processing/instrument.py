@@ -0,0 +1,217 @@
+"""
+Per-stage instrumentation behind the pipeline's JSON run report.
+
+A StageMeter wraps one stage and fills a plain dict with:
+
+- wall and CPU time (CPU includes worker processes that finished during the stage)
+- rows in and out, and the rows the stage dropped with the reason; stages call
+  record_dropped where they drop rows (e.g. welds left unmatched by merge_asof) and
+  record_rows when their values are paths rather than frames, and record_detail for
+  anything else worth keeping (e.g. the iterations of an iterative alignment)
+- peak RSS of this process during the stage (on Linux the high-water mark is reset at
+  the start of every stage; elsewhere it is the process peak so far) and the largest
+  worker process so far
+- bytes read and written through storage.py, worker processes included
+- deep memory of the frames received and produced (see memory.py)
+
+With a profile path the stage also runs under cProfile and the stats are dumped to
+that file (view them with `python -m pstats <file>`). build_report and write_report
+collect the records of a run into one JSON report.
+"""
+import cProfile
+import datetime
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from pre_processing import memory, storage
+
+# (record, explicit row counts) of the stages being measured, innermost last
+_active = []
+
+
+def record_dropped(rows, reason):
+    """Count rows the running stage dropped, under `reason`; a no-op outside a StageMeter."""
+    if _active and rows:
+        dropped = _active[-1][0]["dropped"]
+        dropped[reason] = dropped.get(reason, 0) + int(rows)
+
+
+def record_detail(key, value):
+    """Attach a JSON-serializable detail (e.g. per-iteration match counts) to the running stage's record."""
+    if _active:
+        _active[-1][0].setdefault("details", {})[key] = value
+
+
+def record_rows(rows_in=None, rows_out=None):
+    """Add row counts the stage knows but its values do not show (runs passed as artifact paths)."""
+    if not _active:
+        return
+    counted = _active[-1][1]
+    for key, rows in (("rows_in", rows_in), ("rows_out", rows_out)):
+        if rows is not None:
+            counted[key] = counted.get(key, 0) + int(rows)
+
+
+def frame_rows(value):
+    """Rows of the DataFrames in a stage value (a frame, or a dict/tuple of them); paths count 0."""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(frame_rows(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(frame_rows(v) for v in value)
+    return 0
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _reset_peak_rss():
+    """Reset this process's RSS high-water mark (Linux only). Returns whether it worked."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """High-water RSS of this process: VmHWM on Linux, ru_maxrss elsewhere."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def workers_peak_rss_bytes():
+    """Largest RSS reached by any finished worker process so far."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMeter:
+    """
+    Measure one stage: `with StageMeter(name) as meter`, then meter.input(value) once
+    the input is loaded and meter.output(value) with the result. The measurements are
+    in meter.record once the block exits.
+    """
+
+    def __init__(self, name, profile_path=None):
+        self.record = {
+            "name": name,
+            "cached": False,
+            "rows_in": None,
+            "rows_out": None,
+            "rows_dropped": 0,
+            "dropped": {},
+            "frame_bytes_in": None,
+            "frame_bytes_out": None,
+        }
+        self.profile_path = profile_path
+        self._counted = {}
+        self._profiler = None
+
+    def __enter__(self):
+        _active.append((self.record, self._counted))
+        self._peak_scope = "stage" if _reset_peak_rss() else "process"
+        self._io = dict(storage.IO_BYTES)
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_seconds()
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def input(self, value):
+        self.record["rows_in"] = frame_rows(value)
+        self.record["frame_bytes_in"] = memory.frame_bytes(value)
+
+    def output(self, value):
+        self.record["rows_out"] = frame_rows(value)
+        self.record["frame_bytes_out"] = memory.frame_bytes(value)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(os.path.dirname(os.path.abspath(self.profile_path)), exist_ok=True)
+            self._profiler.dump_stats(self.profile_path)
+            self.record["profile"] = self.profile_path
+        record = self.record
+        record["wall_seconds"] = time.perf_counter() - self._wall
+        record["cpu_seconds"] = _cpu_seconds() - self._cpu
+        for key, rows in self._counted.items():
+            record[key] = rows
+        record["rows_dropped"] = sum(record["dropped"].values())
+        record["peak_rss_bytes"] = peak_rss_bytes()
+        record["peak_rss_scope"] = self._peak_scope
+        record["workers_peak_rss_bytes"] = workers_peak_rss_bytes()
+        record["bytes_read"] = storage.IO_BYTES["read"] - self._io["read"]
+        record["bytes_written"] = storage.IO_BYTES["written"] - self._io["written"]
+        _active.remove((self.record, self._counted))
+
+
+def format_record(record):
+    """One-line summary of a stage record."""
+    if record["cached"]:
+        rows = f"; {record['rows_out']} rows from the cache"
+    else:
+        rows = f"; {record['rows_in']} rows in, {record['rows_out']} out"
+        if record["rows_dropped"]:
+            rows += f", {record['rows_dropped']} dropped"
+    return (
+        f"{record['name']}: {record['wall_seconds']:.2f} s wall, {record['cpu_seconds']:.2f} s CPU{rows}; "
+        f"peak RSS {memory.format_bytes(record['peak_rss_bytes'])}; "
+        f"read {memory.format_bytes(record['bytes_read'])}, wrote {memory.format_bytes(record['bytes_written'])}"
+    )
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def build_report(records, settings, wall_seconds):
+    """
+    Run report: environment, settings and the record of every stage that ran.
+
+    Args:
+        records: StageMeter records, in stage order
+        settings: JSON-serializable settings of the run (format, workers, ...)
+        wall_seconds: Wall time of the whole run
+    """
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": settings,
+        "wall_seconds": wall_seconds,
+        "rows_dropped": sum(record["rows_dropped"] for record in records),
+        "stages": records,
+    }
+
+
+def write_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    storage.write_json(report, path)
@@ -0,0 +1,83 @@
+"""
+Frame memory accounting and the opt-in compact representation.
+
+frame_bytes measures what a stage holds in memory (deep, so text is counted at its real
+size). compact_frame shrinks a frame column by column:
+
+- text columns with few distinct values become categoricals
+- float64 measurements become float32; distances along the line keep float64, since a
+  float32 only resolves about 0.06 ft at 1,000,000 ft
+- integer columns (ids, run_id) use the smallest integer type that holds their values
+
+Columns that are already compact are shared with the input, not copied.
+"""
+import numpy as np
+import pandas as pd
+
+# Text columns whose distinct values are at most this fraction of their values become categoricals
+CATEGORY_RATIO = 0.5
+
+# Float columns whose name contains this keep float64
+FLOAT64_KEYWORD = "distance"
+
+
+def frame_bytes(value):
+    """Deep memory of the DataFrames in a stage value (a frame, or a dict/tuple of them); paths count 0."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, dict):
+        return sum(frame_bytes(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(frame_bytes(v) for v in value)
+    return 0
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _compact_column(name, series):
+    """Compact version of one column, or None when it is already as small as it gets."""
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "iu" and dtype.itemsize > 1:
+        smaller = pd.to_numeric(series, downcast="integer" if dtype.kind == "i" else "unsigned")
+        return smaller if smaller.dtype != dtype else None
+    if isinstance(dtype, np.dtype) and dtype == np.float64:
+        if FLOAT64_KEYWORD in str(name).lower():
+            return None
+        return series.astype("float32")
+    if pd.api.types.is_string_dtype(dtype) or dtype == object:
+        count = series.count()
+        if count and series.nunique() <= CATEGORY_RATIO * count:
+            return series.astype("category")
+    return None
+
+
+def compact_frame(df):
+    """Return df with every column in its compact dtype (see the module docstring)."""
+    changes = {}
+    for i, name in enumerate(df.columns):
+        compacted = _compact_column(name, df.iloc[:, i])
+        if compacted is not None:
+            changes[i] = compacted
+    if not changes:
+        return df
+    # Shallow copy: unchanged columns keep sharing their data with df
+    df = df.copy(deep=False)
+    for i, compacted in changes.items():
+        df.isetitem(i, compacted)
+    return df
+
+
+def compact(value):
+    """compact_frame applied to a stage value (a frame, or a dict/tuple of them); anything else is returned as is."""
+    if isinstance(value, pd.DataFrame):
+        return compact_frame(value)
+    if isinstance(value, dict):
+        return {key: compact(v) for key, v in value.items()}
+    if isinstance(value, tuple):
+        return tuple(compact(v) for v in value)
+    return value
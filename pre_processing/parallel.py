@@ -0,0 +1,59 @@
+"""
+Process-pool helper for per-run work that is independent until alignment.
+"""
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pre_processing import storage
+
+# Context of the calls in this worker process (see map_ordered)
+_context = None
+
+
+def resolve_workers(workers):
+    """Return the worker count to use; None or 0 means one per CPU."""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _call_counting_io(func, item):
+    """Worker: func(item) plus the artifact bytes it read and wrote (see storage.IO_BYTES)."""
+    before = dict(storage.IO_BYTES)
+    result = func(item)
+    return result, {key: storage.IO_BYTES[key] - before[key] for key in before}
+
+
+def _set_context(context):
+    global _context
+    _context = context
+
+
+def _call_with_context(func, item):
+    return func(_context, item)
+
+
+def map_ordered(func, items, workers=1, context=None):
+    """
+    Apply `func` to every item, in a process pool when workers > 1.
+
+    Results are returned in the order of `items` regardless of which worker
+    finishes first. `func` and the items must be picklable (module-level functions).
+    Bytes read and written by the workers are added to this process's storage.IO_BYTES.
+    With a `context` (e.g. large arrays every call reads) each call is
+    func(context, item), and the context is sent to every worker process once
+    instead of with every item.
+    """
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items))
+    if workers <= 1:
+        return [func(item) if context is None else func(context, item) for item in items]
+    if context is not None:
+        func = functools.partial(_call_with_context, func)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_context, initargs=(context,)) as executor:
+        results = []
+        for result, io_bytes in executor.map(functools.partial(_call_counting_io, func), items):
+            storage.count_io(**io_bytes)
+            results.append(result)
+        return results
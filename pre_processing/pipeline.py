@@ -0,0 +1,570 @@
+"""
+In-process pipeline engine: preprocess -> extract -> align -> correct -> features -> growth.
+
+Stages run as functions in one interpreter and hand their DataFrames to the next
+stage through a shared state dict. Nothing is written to disk unless the stage is
+listed in `write`; a stage whose input is not in memory loads it from disk instead.
+
+Each stage output is cached under <output_folder>/.cache keyed by a fingerprint of
+its input, parameters and code (see cache.py), so unchanged stages are skipped on
+re-runs. Pass `force` to recompute specific stages regardless of the cache.
+
+Every stage prints the memory of the frames it received and produced. With
+compact=True each stage output is shrunk (categoricals, float32 measurements, smallest
+integer types; see memory.py) before it is cached and handed on.
+
+Every stage is measured (time, rows in/out/dropped, peak RSS, bytes read and written;
+see instrument.py) and the measurements are collected into a run report, written as
+JSON when `report` is set. Stages listed in `profile` also run under cProfile.
+
+Every artifact is written atomically (see storage.atomic_path), and a stage that saves
+its outputs records a completion marker under <output_folder>/.checkpoints (see
+checkpoint.py). With resume=True the run skips the stages that are still complete and
+restarts from the first one that is not, loading its input from the artifacts on disk.
+"""
+import datetime
+import os
+import time
+
+from model import growth
+from pre_processing import (
+    align,
+    apply_drift_correction,
+    cache,
+    checkpoint,
+    clock,
+    coarse_align,
+    data_preprocessing,
+    drift_model,
+    extract,
+    feature_correction,
+    instrument,
+    memory,
+    schema,
+    storage,
+)
+
+PIPELINE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(PIPELINE_FOLDER, "..", "data")
+
+
+def stage_context(
+    output_folder=PIPELINE_FOLDER,
+    data_folder=DATA_FOLDER,
+    fmt=storage.DEFAULT_FORMAT,
+    workers=1,
+    chunksize=None,
+    compact=False,
+    iterative=False,
+    matching=align.MATCH_METHOD,
+):
+    """
+    Return the input/output folders and settings shared by every stage, plus the set of
+    stages that ran without saving their outputs ("unsaved", filled in by run_pipeline).
+    """
+    return {
+        "data": data_folder,
+        "processed": os.path.join(output_folder, "processed"),
+        "extracted": os.path.join(output_folder, "extracted"),
+        "aligned": os.path.join(output_folder, "aligned"),
+        "features": os.path.join(output_folder, "features"),
+        "growth": os.path.join(output_folder, "growth"),
+        "cache": os.path.join(output_folder, ".cache"),
+        "checkpoints": os.path.join(output_folder, ".checkpoints"),
+        "reports": os.path.join(output_folder, "reports"),
+        "format": fmt,
+        "workers": workers,
+        "chunksize": chunksize,
+        "compact": compact,
+        "iterative": iterative,
+        "matching": matching,
+        "unsaved": set(),
+    }
+
+
+def _raw_files(ctx):
+    return storage.list_artifacts(ctx["data"], "r_*").values()
+
+
+def _processed_files(ctx):
+    return storage.list_artifacts(ctx["processed"], "*_processed").values()
+
+
+def _extracted_files(ctx):
+    return storage.list_artifacts(ctx["extracted"], align.WELD_ARTIFACTS).values()
+
+
+def _aligned_files(ctx):
+    path = storage.find_artifact(ctx["aligned"], apply_drift_correction.INPUT_STEM)
+    return [path] if path else []
+
+
+def _existing(paths):
+    return [path for path in paths if path and os.path.exists(path)]
+
+
+def _run_preprocess(raw, ctx):
+    if ctx["chunksize"]:
+        if any(not isinstance(value, str) for value in raw.values()):
+            raise ValueError("Streaming preprocessing reads raw runs from disk; do not pass raw_runs")
+        return data_preprocessing.preprocess_runs_chunked(
+            raw, ctx["processed"], ctx["format"], ctx["chunksize"], ctx["workers"], ctx["compact"]
+        )
+    return data_preprocessing.preprocess_runs(raw, ctx["workers"], ctx["compact"])
+
+
+def _save_preprocess(value, ctx):
+    if all(isinstance(path, str) for path in value.values()):
+        # Streamed output is already on disk; copy it over only when it came from the cache
+        os.makedirs(ctx["processed"], exist_ok=True)
+        for key, path in value.items():
+            target = storage.artifact_path(ctx["processed"], f"{key}_processed", ctx["format"])
+            if os.path.abspath(path) != os.path.abspath(target):
+                storage.copy_artifact(path, target, ctx["chunksize"] or data_preprocessing.DEFAULT_CHUNK_ROWS)
+        return
+    data_preprocessing.save_processed(value, ctx["processed"], ctx["format"])
+
+
+def _save_extract(value, ctx):
+    extract.save_extracted(value, ctx["extracted"], ctx["format"])
+
+
+def _run_align(extracted, ctx):
+    welds = align.select_welds(extracted)
+    if not welds:
+        raise RuntimeError("No extracted weld frames to align")
+    # Only the weld partitions are aligned; the other classes pass through untouched
+    instrument.record_rows(rows_in=instrument.frame_rows(welds))
+    return align.align_runs(
+        welds,
+        align.REFERENCE_RUN,
+        align.MERGE_TOLERANCE,
+        align.COARSE_ALIGN,
+        ctx["iterative"],
+        ctx["workers"],
+        ctx["matching"],
+    )
+
+
+def _save_align(value, ctx):
+    align.save_aligned(value, ctx["aligned"], ctx["format"])
+
+
+def _align_outputs(ctx):
+    return _existing([
+        storage.artifact_path(ctx["aligned"], apply_drift_correction.INPUT_STEM, ctx["format"]),
+        drift_model.model_path(ctx["aligned"]),
+    ])
+
+
+def _correct_files(ctx):
+    return [*_aligned_files(ctx), *_existing([drift_model.model_path(ctx["aligned"])])]
+
+
+def _run_correct(aligned, ctx):
+    # The saved model belongs to the aligned table on disk; an alignment that ran in
+    # memory without saving has its model rebuilt from the aligned table instead
+    model = None if "align" in ctx["unsaved"] else apply_drift_correction.load_model(ctx["aligned"])
+    return apply_drift_correction.apply_correction(aligned, double=not ctx["iterative"], model=model)
+
+
+def _save_correct(value, ctx):
+    if value is None:
+        return
+    apply_drift_correction.save_corrected(value, ctx["aligned"], ctx["format"])
+
+
+def _correct_outputs(ctx):
+    return _existing([storage.artifact_path(ctx["aligned"], apply_drift_correction.OUTPUT_STEM, ctx["format"])])
+
+
+def _feature_files(ctx):
+    return [*_aligned_files(ctx), *storage.list_artifacts(ctx["extracted"]).values()]
+
+
+def _run_features(value, ctx):
+    aligned, extracted = value
+    # The aligned table is the weld lookup; the rows corrected are the extracted ones
+    instrument.record_rows(rows_in=instrument.frame_rows(extracted))
+    return feature_correction.correct_features(aligned, extracted)
+
+
+def _save_features(value, ctx):
+    feature_correction.save_features(value, ctx["features"], ctx["format"])
+
+
+def _growth_files(ctx):
+    return storage.list_artifacts(ctx["features"], f"*_{growth.FEATURE_CLASS}{feature_correction.OUTPUT_SUFFIX}").values()
+
+
+def _save_growth(value, ctx):
+    growth.save_growth(value, ctx["growth"], ctx["format"])
+
+
+def _growth_outputs(ctx):
+    stems = (growth.FEATURE_STEM, growth.JOINT_STEM)
+    return _existing([storage.artifact_path(ctx["growth"], stem, ctx["format"]) for stem in stems])
+
+
+# Each stage reads state[input] and produces state[output] = run(state[input], ctx).
+# A stage with several inputs names a tuple of state keys and receives (and loads) a
+# tuple of values. input_files lists the artifacts it would load from disk and
+# output_files those save() wrote; params (of the stage context) and modules feed the
+# cache fingerprint.
+STAGES = [
+    {
+        "name": "preprocess",
+        "description": "Preprocess raw data (schema columns, remove NaN columns/rows)",
+        "input": "raw",
+        "output": "processed",
+        "input_files": _raw_files,
+        "load": lambda ctx: data_preprocessing.raw_run_paths(ctx["data"]),
+        "run": _run_preprocess,
+        "save": _save_preprocess,
+        "output_files": _processed_files,
+        "params": lambda ctx: {"columns": schema.COLUMNS, "run_formats": schema.RUN_FORMATS, "aliases": schema.ALIASES},
+        "modules": [data_preprocessing, schema, clock, memory, storage],
+    },
+    {
+        "name": "extract",
+        "description": "Extract feature classes (welds, metal loss, ...) from r_2007, r_2015, r_2022",
+        "input": "processed",
+        "output": "extracted",
+        "input_files": _processed_files,
+        "load": lambda ctx: extract.load_processed(ctx["processed"]),
+        "run": lambda processed, ctx: extract.extract_runs(processed, ctx["workers"]),
+        "save": _save_extract,
+        "output_files": lambda ctx: storage.list_artifacts(ctx["extracted"]).values(),
+        "params": lambda ctx: {"feature_classes": extract.FEATURE_CLASSES},
+        "modules": [extract, schema],
+    },
+    {
+        "name": "align",
+        "description": "Merge and align welds by distance with drift correction",
+        "input": "extracted",
+        "output": "aligned",
+        "input_files": _extracted_files,
+        "load": lambda ctx: align.load_extracted(ctx["extracted"]),
+        "run": _run_align,
+        "save": _save_align,
+        "output_files": _align_outputs,
+        "params": lambda ctx: {
+            "tolerance": align.MERGE_TOLERANCE,
+            "reference": align.REFERENCE_RUN,
+            "coarse": align.COARSE_ALIGN,
+            "coarse_window": coarse_align.WINDOW_JOINTS,
+            "coarse_search": coarse_align.SEARCH_JOINTS,
+            "coarse_min_score": coarse_align.MIN_SCORE,
+            "iterative": ctx["iterative"],
+            "matching": ctx["matching"],
+            **(
+                {"joint_weight": align.JOINT_WEIGHT, "joint_scale": align.JOINT_SCALE, "max_block": align.MAX_BLOCK}
+                if ctx["matching"] == "assignment"
+                else {}
+            ),
+            **(
+                {
+                    "smooth_welds": align.SMOOTH_WELDS,
+                    "residual_sigmas": align.RESIDUAL_SIGMAS,
+                    "min_tolerance": align.MIN_TOLERANCE,
+                    "max_iterations": align.MAX_ITERATIONS,
+                }
+                if ctx["iterative"]
+                else {}
+            ),
+        },
+        "modules": [align, coarse_align, drift_model, schema],
+    },
+    {
+        "name": "correct",
+        "description": "Apply drift correction to distance columns",
+        "input": "aligned",
+        "output": "corrected",
+        "input_files": _correct_files,
+        "load": lambda ctx: apply_drift_correction.load_aligned(ctx["aligned"]),
+        "run": _run_correct,
+        "save": _save_correct,
+        "output_files": _correct_outputs,
+        "params": lambda ctx: {"double": not ctx["iterative"]},
+        "modules": [apply_drift_correction, drift_model],
+    },
+    {
+        "name": "features",
+        "description": "Place every feature between its matched welds in reference coordinates",
+        "input": ("aligned", "extracted"),
+        "output": "features",
+        "input_files": _feature_files,
+        "load": lambda ctx: (
+            apply_drift_correction.load_aligned(ctx["aligned"]),
+            feature_correction.load_features(ctx["extracted"]),
+        ),
+        "run": _run_features,
+        "save": _save_features,
+        "output_files": lambda ctx: storage.list_artifacts(ctx["features"]).values(),
+        "params": lambda ctx: {"anchor_slack": feature_correction.ANCHOR_SLACK},
+        "modules": [feature_correction, schema],
+    },
+    {
+        "name": "growth",
+        "description": "Match metal loss across runs and compute growth rates and time to critical depth",
+        "input": "features",
+        "output": "growth",
+        "input_files": _growth_files,
+        "load": lambda ctx: growth.load_features(ctx["features"]),
+        "run": lambda features, ctx: growth.compute_growth(features),
+        "save": _save_growth,
+        "output_files": _growth_outputs,
+        "params": lambda ctx: {
+            "feature_class": growth.FEATURE_CLASS,
+            "tolerance": growth.MATCH_TOLERANCE,
+            "clock_tolerance": growth.CLOCK_TOLERANCE,
+            "critical_depth": growth.CRITICAL_DEPTH,
+        },
+        "modules": [growth, schema],
+    },
+]
+
+STAGE_NAMES = [stage["name"] for stage in STAGES]
+
+
+def _check_stage_names(names):
+    unknown = set(names) - set(STAGE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown pipeline stage(s): {sorted(unknown)}")
+
+
+def _input_keys(stage):
+    keys = stage["input"]
+    return keys if isinstance(keys, tuple) else (keys,)
+
+
+def _input_fingerprint(stage, state, fingerprints, ctx):
+    keys = _input_keys(stage)
+    if all(key in fingerprints or key in state for key in keys):
+        parts = [fingerprints[key] if key in fingerprints else cache.hash_frames(state[key]) for key in keys]
+        return parts[0] if len(parts) == 1 else "+".join(parts)
+    return cache.hash_files(stage["input_files"](ctx))
+
+
+def _stage_input(stage, state, ctx):
+    """Value passed to a stage's run(), loading its inputs from disk if they are not in memory."""
+    keys = _input_keys(stage)
+    values = {key: state[key] for key in keys if key in state}
+    if len(values) < len(keys):
+        # Loaded inputs stay out of the state: a load may read only the columns its
+        # stage needs (align reads the weld partitions), which a later stage must not reuse
+        loaded = stage["load"](ctx)
+        for key, value in zip(keys, loaded if isinstance(stage["input"], tuple) else (loaded,)):
+            values.setdefault(key, value)
+    if isinstance(stage["input"], tuple):
+        return tuple(values[key] for key in keys)
+    return values[stage["input"]]
+
+
+def _stage_params(stage, ctx):
+    params = stage["params"](ctx)
+    # Compact outputs differ in dtype, so they are cached separately
+    if ctx["compact"]:
+        params = {**params, "compact": True}
+    return params
+
+
+def _checkpoint_fingerprint(stage, ctx):
+    """Fingerprint of a stage's completion marker: its input files' sizes and times, params, format and code."""
+    return cache.stage_fingerprint(
+        stage["name"],
+        checkpoint.files_signature(stage["input_files"](ctx)),
+        {**_stage_params(stage, ctx), "format": ctx["format"]},
+        cache.code_version(stage["modules"]),
+    )
+
+
+def _print_memory(record, uncompacted=None):
+    if record["cached"]:
+        print(f"Frame memory: {memory.format_bytes(record['frame_bytes_out'])} out")
+        return
+    before, after = record["frame_bytes_in"], record["frame_bytes_out"]
+    if uncompacted is None:
+        print(f"Frame memory: {memory.format_bytes(before)} in, {memory.format_bytes(after)} out")
+    else:
+        print(
+            f"Frame memory: {memory.format_bytes(before)} in, {memory.format_bytes(uncompacted)} out, "
+            f"{memory.format_bytes(after)} after compacting"
+        )
+
+
+def _report_settings(ctx, stages, use_cache, resume):
+    return {
+        "stages": list(stages or STAGE_NAMES),
+        "format": ctx["format"],
+        "workers": ctx["workers"],
+        "chunksize": ctx["chunksize"],
+        "compact": ctx["compact"],
+        "iterative": ctx["iterative"],
+        "matching": ctx["matching"],
+        "use_cache": use_cache,
+        "resume": resume,
+        "data_folder": os.path.abspath(ctx["data"]),
+    }
+
+
+def invalidate_stage(name, output_folder=PIPELINE_FOLDER):
+    """Force the next run of stage `name` to recompute instead of using its cache or resuming past it."""
+    _check_stage_names([name])
+    ctx = stage_context(output_folder)
+    cache.invalidate(ctx["cache"], name)
+    checkpoint.clear(ctx["checkpoints"], name)
+
+
+def run_pipeline(
+    raw_runs=None,
+    stages=None,
+    write=(),
+    output_folder=PIPELINE_FOLDER,
+    data_folder=DATA_FOLDER,
+    fmt=storage.DEFAULT_FORMAT,
+    use_cache=True,
+    force=(),
+    input_fingerprints=None,
+    workers=1,
+    chunksize=None,
+    compact=False,
+    iterative=False,
+    matching=align.MATCH_METHOD,
+    resume=False,
+    report=None,
+    profile=(),
+):
+    """
+    Run pipeline stages in order inside the current process.
+
+    Args:
+        raw_runs: Optional dict of raw run DataFrames (e.g. from data.load_data);
+            when omitted the preprocess stage reads the r_* files in data_folder,
+            each inside the worker that preprocesses it
+        stages: Stage names to run (default: all, in pipeline order)
+        write: Stage names whose outputs are saved to disk, or True for every stage
+        output_folder: Folder that holds processed/, extracted/, aligned/, features/ and growth/
+        data_folder: Folder with the raw r_* run files
+        fmt: Artifact format for written outputs ('npz' or 'csv', see storage.py)
+        use_cache: Reuse cached stage outputs whose fingerprint is unchanged
+        force: Stage names to recompute even when their cache is valid
+        input_fingerprints: Optional precomputed fingerprints of inputs keyed by
+            state name (e.g. {'raw': ...}), used instead of hashing the inputs
+        workers: Process count for per-run stages (preprocess, extract) and for the
+            coarse offsets and weld matching of long runs in align; 0 or None means one
+            per CPU. Results are identical to a serial run.
+        chunksize: When set, preprocess streams each run in chunks of this many rows
+            and writes processed/ as it goes; later stages load the runs from there
+        compact: Keep every stage output in compact dtypes (see memory.py); distances
+            stay float64, other measurements become float32
+        iterative: Align iteratively (fit drift, transform, re-match with a shrinking
+            tolerance until the matched set is stable; see align._refine_match) and
+            apply the drift correction once instead of twice
+        matching: How align pairs welds: 'nearest' (merge_asof) or 'assignment'
+            (one-to-one, see align._assign)
+        resume: Skip the stages whose completion marker is still valid (see
+            checkpoint.py) and start from the first stage that is not complete; stages
+            in `force` are never skipped
+        report: Path of the JSON run report, or True for
+            <output_folder>/reports/pipeline_<time>.json; None writes no report
+        profile: Stage names to run under cProfile, or True for every stage; the stats
+            are saved next to the report as <report>.<stage>.prof
+
+    Returns:
+        The state dict with the in-memory output of every stage that ran, plus the run
+        report under "report" (see instrument.build_report; the stages skipped by
+        resume are listed under its "resumed" key)
+    """
+    _check_stage_names(stages or ())
+    _check_stage_names(() if write is True else write)
+    _check_stage_names(force)
+    _check_stage_names(() if profile is True else profile)
+    if fmt not in storage.FORMATS:
+        raise ValueError(f"Unknown artifact format '{fmt}', expected one of {storage.FORMATS}")
+    if matching not in align.MATCH_METHODS:
+        raise ValueError(f"Unknown match method '{matching}', expected one of {align.MATCH_METHODS}")
+
+    ctx = stage_context(output_folder, data_folder, fmt, workers, chunksize, compact, iterative, matching)
+    state = {}
+    if raw_runs is not None:
+        state["raw"] = raw_runs
+    fingerprints = dict(input_fingerprints or {})
+
+    if report is True:
+        report = os.path.join(ctx["reports"], f"pipeline_{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    report_stem = os.path.splitext(report)[0] if report else os.path.join(ctx["reports"], "pipeline")
+    records = []
+    resumed = []
+    start = time.perf_counter()
+
+    for stage in STAGES:
+        name = stage["name"]
+        if stages is not None and name not in stages:
+            continue
+
+        print(f"\n{'='*70}")
+        print(f"STEP: {stage['description']}")
+        print(f"{'='*70}")
+
+        # Resuming skips complete stages only until the first stage that has to run
+        if resume and not records and name not in force:
+            if checkpoint.is_complete(ctx["checkpoints"], name, _checkpoint_fingerprint(stage, ctx)):
+                marker = checkpoint.read_marker(ctx["checkpoints"], name)
+                print(f"Completed at {marker['completed']}; inputs, settings and outputs unchanged, skipping {name}")
+                resumed.append(name)
+                continue
+
+        profile_path = f"{report_stem}.{name}.prof" if profile is True or name in profile else None
+        uncompacted = None
+        with instrument.StageMeter(name, profile_path) as meter:
+            fingerprint = cache.stage_fingerprint(
+                name,
+                _input_fingerprint(stage, state, fingerprints, ctx),
+                _stage_params(stage, ctx),
+                cache.code_version(stage["modules"]),
+            )
+
+            if use_cache and name not in force and cache.is_cached(ctx["cache"], name, fingerprint):
+                print(f"Inputs, parameters and code unchanged; using cached {name} output")
+                meter.record["cached"] = True
+                value = cache.load_cached(ctx["cache"], name)
+            else:
+                value = _stage_input(stage, state, ctx)
+                meter.input(value)
+                value = stage["run"](value, ctx)
+                if ctx["compact"]:
+                    uncompacted = memory.frame_bytes(value)
+                    value = memory.compact(value)
+                if use_cache:
+                    cache.store_cached(ctx["cache"], name, fingerprint, value)
+            meter.output(value)
+            state[stage["output"]] = value
+            fingerprints[stage["output"]] = fingerprint
+
+            if write is True or name in write:
+                # No marker while the outputs are being replaced, so an interrupted save resumes here
+                checkpoint.clear(ctx["checkpoints"], name)
+                stage["save"](value, ctx)
+                checkpoint.mark_complete(
+                    ctx["checkpoints"], name, _checkpoint_fingerprint(stage, ctx), stage["output_files"](ctx)
+                )
+            else:
+                ctx["unsaved"].add(name)
+
+        records.append(meter.record)
+        _print_memory(meter.record, uncompacted)
+        print(instrument.format_record(meter.record))
+        if profile_path:
+            print(f"Saved {name} profile to {profile_path} (view with: python -m pstats {profile_path})")
+
+        print(f"\n{stage['description']} completed successfully")
+
+    state["report"] = instrument.build_report(
+        records, _report_settings(ctx, stages, use_cache, resume), time.perf_counter() - start
+    )
+    state["report"]["resumed"] = resumed
+    if report:
+        instrument.write_report(state["report"], report)
+        print(f"\nSaved run report to {report}")
+    return state
@@ -1,44 +1,110 @@
 #!/usr/bin/env python3
 """
 Complete pipeline runner: extract welds -> merge/align -> apply drift correction
+
+All stages run in this process; see pre_processing/pipeline.py.
+Usage (from the repository root): python -m pre_processing.run_pipeline
 """
-import subprocess
+import argparse
 import sys
-import os
 
-def run_step(script_name, description):
-    """Run a pipeline step and report results."""
-    print(f"\n{'='*70}")
-    print(f"STEP: {description}")
-    print(f"Script: {script_name}")
-    print(f"{'='*70}")
-    
-    result = subprocess.run(
-        [sys.executable, script_name],
-        cwd=os.path.dirname(__file__),
-        capture_output=False
-    )
-    
-    if result.returncode != 0:
-        print(f"\nERROR in {script_name}")
-        return False
-    
-    print(f"\n{description} completed successfully")
-    return True
+from pre_processing import align, storage
+from pre_processing.pipeline import DATA_FOLDER, PIPELINE_FOLDER, STAGE_NAMES, run_pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the preprocessing and alignment pipeline")
+    parser.add_argument(
+        "--format",
+        choices=storage.FORMATS,
+        default=storage.DEFAULT_FORMAT,
+        help="Artifact format for stage outputs (csv is kept as an export option)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Recompute every stage and skip the stage cache")
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        choices=STAGE_NAMES,
+        metavar="STAGE",
+        help=f"Recompute this stage even if its cache is valid (repeatable; one of {', '.join(STAGE_NAMES)})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Preprocess and extract runs, and split long alignments, across N processes (0 = one per CPU)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream preprocessing in chunks of N rows for runs larger than memory",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Keep stage outputs in compact dtypes (categoricals, float32 measurements, small ints)",
+    )
+    parser.add_argument(
+        "--iterative",
+        action="store_true",
+        help="Re-match welds with a shrinking tolerance until stable, and correct the drift once",
+    )
+    parser.add_argument(
+        "--matching",
+        choices=align.MATCH_METHODS,
+        default=align.MATCH_METHOD,
+        help="Pair welds by nearest distance (merge_asof) or one-to-one by assignment",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the stages completed by an earlier run and restart from the first incomplete one",
+    )
+    parser.add_argument("--data-folder", default=DATA_FOLDER, help="Folder with the raw r_* run files")
+    parser.add_argument(
+        "--output-folder",
+        default=PIPELINE_FOLDER,
+        help="Folder for processed/, extracted/, aligned/, features/ and growth/",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        metavar="PATH",
+        help="JSON run report path (default: <output folder>/reports/pipeline_<time>.json)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        choices=STAGE_NAMES,
+        metavar="STAGE",
+        help="Run this stage under cProfile and save its stats next to the report (repeatable)",
+    )
+    args = parser.parse_args(argv)
 
-def main():
-    steps = [
-        ("data_preprocessing.py", "Preprocess raw data (remove NaN columns/rows)"),
-        ("extract.py", "Extract weld events from r_2007, r_2015, r_2022"),
-        ("align.py", "Merge and align welds by distance with drift correction"),
-        ("apply_drift_correction.py", "Apply drift correction to distance columns"),
-        ("normalize_names.py", "Normalize columns across runs"),
-    ]
-    
-    for script, description in steps:
-        if not run_step(script, description):
-            print(f"\n  Pipeline stopped at: {description}")
-            return 1
+    try:
+        run_pipeline(
+            write=True,
+            output_folder=args.output_folder,
+            data_folder=args.data_folder,
+            fmt=args.format,
+            use_cache=not args.no_cache,
+            force=args.force,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            compact=args.compact,
+            iterative=args.iterative,
+            matching=args.matching,
+            resume=args.resume,
+            report=args.report or True,
+            profile=args.profile,
+        )
+    except Exception as e:
+        print(f"\nERROR: {e}")
+        print("\n  Pipeline stopped")
+        return 1
     return 0
 
 if __name__ == "__main__":
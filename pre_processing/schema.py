@@ -0,0 +1,186 @@
+"""
+Column schema shared by every inspection run.
+
+Each vendor export names the same quantity differently ("log dist. [ft]", "Log Dist. [ft]",
+"ILI Wheel Count \\n[ft.]"). COLUMNS declares every canonical column once with its dtype,
+and RUN_FORMATS lists the header each run format uses for it. Headers are matched on
+their lower-case letters and digits only, so line breaks, spacing and punctuation in the
+exports do not matter. A run without a declared format is matched against the headers
+of every format plus ALIASES.
+
+read_run loads only the schema columns of an artifact, already cast and renamed, in the
+first read; every stage after preprocessing works with the canonical names.
+"""
+from pre_processing import storage
+
+# Canonical column names used throughout the pipeline
+EVENT = "type"
+DISTANCE = "distance [ft]"
+JOINT_LENGTH = "jlength [ft]"
+THICKNESS = "thickness [in]"
+HEIGHT = "height [ft]"
+CLOCK = "clock"
+UPSTREAM = "upstream [ft]"
+DOWNSTREAM = "downstream [ft]"
+DEPTH = "depth [%]"
+LENGTH = "length [in]"
+WIDTH = "width [in]"
+SURFACE = "I/E"
+
+# Canonical column -> dtype after the first read, in output column order. Event types,
+# clock positions and internal/external flags repeat a handful of values, so they are
+# read as categoricals.
+COLUMNS = {
+    EVENT: "category",
+    DISTANCE: "float64",
+    JOINT_LENGTH: "float64",
+    THICKNESS: "float64",
+    HEIGHT: "float64",
+    CLOCK: "category",
+    UPSTREAM: "float64",
+    DOWNSTREAM: "float64",
+    DEPTH: "float64",
+    LENGTH: "float64",
+    WIDTH: "float64",
+    SURFACE: "category",
+}
+
+# dtypes in compact mode (see memory.py): measurements as float32; distances keep float64
+COMPACT_COLUMNS = {
+    **COLUMNS,
+    JOINT_LENGTH: "float32",
+    THICKNESS: "float32",
+    HEIGHT: "float32",
+    UPSTREAM: "float32",
+    DOWNSTREAM: "float32",
+    DEPTH: "float32",
+    LENGTH: "float32",
+    WIDTH: "float32",
+}
+
+# Run format -> {canonical column: header in that vendor's export}
+RUN_FORMATS = {
+    "r_2007": {
+        EVENT: "event",
+        DISTANCE: "log dist. [ft]",
+        JOINT_LENGTH: "J. len [ft]",
+        THICKNESS: "t",
+        CLOCK: "o'clock",
+        UPSTREAM: "to u/s w. [ft]",
+        DOWNSTREAM: "to d/s w. [ft]",
+        DEPTH: "depth [%]",
+        LENGTH: "length [in]",
+        WIDTH: "width [in]",
+        SURFACE: "internal",
+    },
+    "r_2015": {
+        EVENT: "Event Description",
+        DISTANCE: "Log Dist. [ft]",
+        JOINT_LENGTH: "J. len [ft]",
+        THICKNESS: "Wt [in]",
+        CLOCK: "O'clock",
+        UPSTREAM: "to u/s w. [ft]",
+        DOWNSTREAM: "to d/s w. [ft]",
+        DEPTH: "Depth [%]",
+        LENGTH: "Length [in]",
+        WIDTH: "Width [in]",
+        SURFACE: "ID/OD",
+    },
+    "r_2022": {
+        EVENT: "Event Description",
+        DISTANCE: "ILI Wheel Count [ft.]",
+        JOINT_LENGTH: "J. len [ft]",
+        THICKNESS: "WT [in]",
+        CLOCK: "O'clock [hh:mm]",
+        UPSTREAM: "Distance to U/S GW [ft]",
+        DOWNSTREAM: "Distance to D/S GW [ft]",
+        DEPTH: "Metal Loss Depth [%]",
+        LENGTH: "Length [in]",
+        WIDTH: "Width [in]",
+        SURFACE: "ID/OD",
+    },
+}
+
+# Other headers seen for a canonical column, tried after the run formats
+ALIASES = {
+    DISTANCE: ["distance", "log distance"],
+    JOINT_LENGTH: ["J.len [ft]", "joint length", "J. length"],
+    THICKNESS: ["t [in]", "thickness"],
+    HEIGHT: ["height", "elevation"],
+}
+
+
+def normalize_name(name):
+    """Lower-case letters and digits of a header ("ILI Wheel Count \\n[ft.]" -> "iliwheelcountft")."""
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+def _candidates(canonical, run=None):
+    """Headers that may hold `canonical`: the run's own format first, then every other name."""
+    names = []
+    if run in RUN_FORMATS and canonical in RUN_FORMATS[run]:
+        names.append(RUN_FORMATS[run][canonical])
+    names.extend(fmt[canonical] for fmt in RUN_FORMATS.values() if canonical in fmt)
+    names.extend(ALIASES.get(canonical, []))
+    names.append(canonical)
+    return names
+
+
+def find_column(columns, canonical, run=None):
+    """Header in `columns` that holds the canonical column, or None."""
+    by_name = {}
+    for col in columns:
+        by_name.setdefault(normalize_name(col), col)
+    for name in _candidates(canonical, run):
+        col = by_name.get(normalize_name(name))
+        if col is not None:
+            return col
+    return None
+
+
+def resolve_columns(columns, run=None):
+    """
+    Match the headers of a run against the schema.
+
+    Args:
+        columns: Headers as stored in the artifact
+        run: Run format name (e.g. 'r_2015'); None or an unknown run tries every format
+
+    Returns:
+        dict mapping source header to canonical name, in COLUMNS order; headers that are
+        not in the schema are left out
+    """
+    mapping = {}
+    for canonical in COLUMNS:
+        col = find_column([c for c in columns if c not in mapping], canonical, run)
+        if col is not None:
+            mapping[col] = canonical
+    return mapping
+
+
+def _dtypes(mapping, compact=False):
+    columns = COMPACT_COLUMNS if compact else COLUMNS
+    return {col: columns[canonical] for col, canonical in mapping.items()}
+
+
+def apply_schema(df, run=None, compact=False):
+    """Select, cast and rename the schema columns of a DataFrame already in memory."""
+    mapping = resolve_columns(df.columns, run)
+    return storage.cast_frame(df[list(mapping)], _dtypes(mapping, compact)).rename(columns=mapping)
+
+
+def read_run(path, run=None, compact=False):
+    """
+    Read only the schema columns of a run artifact, with their final dtypes and names.
+    compact=True reads measurements as float32 (COMPACT_COLUMNS).
+    """
+    mapping = resolve_columns(storage.read_columns(path), run)
+    df = storage.read_frame(path, columns=list(mapping), dtypes=_dtypes(mapping, compact))
+    return df[list(mapping)].rename(columns=mapping)
+
+
+def iter_run_chunks(path, chunksize, run=None, compact=False):
+    """Chunked counterpart of read_run (see storage.iter_chunks)."""
+    mapping = resolve_columns(storage.read_columns(path), run)
+    for chunk in storage.iter_chunks(path, chunksize, columns=list(mapping), dtypes=_dtypes(mapping, compact)):
+        yield chunk[list(mapping)].rename(columns=mapping)
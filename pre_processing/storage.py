@@ -0,0 +1,524 @@
+"""
+Typed columnar storage for pipeline artifacts.
+
+An artifact is one uncompressed .npz file holding one array per column plus a JSON
+header with the column order and dtypes. Text columns are dictionary-encoded (integer
+codes plus the unique values), so nothing is pickled and nothing is re-parsed on read.
+Readers can load a subset of columns without touching the rest of the file.
+
+CSV is still supported for export and for reading older outputs; both formats go
+through write_frame/read_frame, which dispatch on the file extension. iter_chunks and
+ChunkWriter read and write either format in fixed-size row chunks for data that does
+not fit in memory.
+
+Every write goes to a hidden temporary file next to its target (.<name>.<random>.tmp,
+which no artifact glob matches), is flushed to disk and then renamed over the target,
+so an artifact is either complete or absent; a reader never sees half a file, even
+when the writer is killed partway through.
+
+IO_BYTES counts the bytes this process read and wrote through these functions; the
+stage report (instrument.py) takes its bytes read/written from it.
+"""
+import contextlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("npz", "csv")
+DEFAULT_FORMAT = "npz"
+
+_HEADER_KEY = "__header__"
+_TEMP_SUFFIX = ".tmp"
+
+# Bytes read from and written to artifacts by this process (see instrument.py)
+IO_BYTES = {"read": 0, "written": 0}
+
+
+def count_io(read=0, written=0):
+    """Add to IO_BYTES (parallel.py adds the counts of its worker processes)."""
+    IO_BYTES["read"] += int(read)
+    IO_BYTES["written"] += int(written)
+
+
+def _temp_path(path):
+    """Unique hidden path next to `path`; the writer creates it, so it gets the usual permissions."""
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, f".{name}.{os.getpid()}-{os.urandom(4).hex()}{_TEMP_SUFFIX}")
+
+
+def _commit(temp, path):
+    """Flush a finished temporary file to disk and rename it over `path`."""
+    with open(temp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path to write instead of `path`; it replaces `path` when the
+    block finishes and is removed, leaving `path` untouched, when the block raises.
+    """
+    temp = _temp_path(path)
+    try:
+        yield temp
+        _commit(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+
+
+def write_json(value, path):
+    """Write a JSON file atomically (see atomic_path)."""
+    with atomic_path(path) as temp, open(temp, "w") as f:
+        json.dump(value, f, indent=2)
+
+
+def _npz_member_bytes(path, keys):
+    """Stored size of the header and the members of the column keys in an .npz."""
+    with zipfile.ZipFile(path) as zf:
+        return sum(
+            info.compress_size
+            for info in zf.infolist()
+            if info.filename.split(".")[0] in keys or info.filename.startswith(_HEADER_KEY)
+        )
+
+
+def artifact_path(folder, stem, fmt=DEFAULT_FORMAT):
+    """Return the path of artifact `stem` in `folder` for the given format."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown artifact format '{fmt}', expected one of {FORMATS}")
+    return os.path.join(folder, f"{stem}.{fmt}")
+
+
+def find_artifact(folder, stem):
+    """Return the newest existing artifact for `stem` in any format, or None."""
+    paths = [artifact_path(folder, stem, fmt) for fmt in FORMATS]
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        return None
+    return max(paths, key=os.path.getmtime)
+
+
+def list_artifacts(folder, pattern="*"):
+    """
+    Find artifacts matching a glob pattern (without extension).
+
+    Returns:
+        dict mapping stem to path, sorted by stem; when a stem exists in several
+        formats the newest file wins
+    """
+    stems = set()
+    for fmt in FORMATS:
+        for path in glob(os.path.join(folder, f"{pattern}.{fmt}")):
+            stems.add(os.path.splitext(os.path.basename(path))[0])
+    return {stem: find_artifact(folder, stem) for stem in sorted(stems)}
+
+
+def _encode_column(key, series):
+    """Return ({array name: array}, column header) for one column."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories
+        arrays, cat_header = _encode_column(f"{key}.categories", pd.Series(categories))
+        arrays[f"{key}.codes"] = series.cat.codes.to_numpy()
+        return arrays, {
+            "kind": "category",
+            "ordered": bool(dtype.ordered),
+            "categories": cat_header,
+        }
+
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return {key: series.to_numpy()}, {"kind": "numpy", "dtype": dtype.str}
+
+    if hasattr(dtype, "numpy_dtype") and not pd.api.types.is_string_dtype(dtype):
+        # Nullable Int64/Float32/boolean: values plus a validity mask
+        mask = series.isna().to_numpy()
+        numpy_dtype = dtype.numpy_dtype
+        values = series.to_numpy(dtype=numpy_dtype, na_value=numpy_dtype.type(0))
+        return {key: values, f"{key}.mask": mask}, {"kind": "masked", "dtype": str(dtype)}
+
+    # Text and other objects: dictionary-encode as codes + unique strings
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = np.asarray([str(v) for v in uniques], dtype=str)
+    return (
+        {f"{key}.codes": codes.astype(np.int32), f"{key}.values": uniques},
+        {"kind": "text", "dtype": str(dtype)},
+    )
+
+
+def _decode_column(npz, key, header):
+    kind = header["kind"]
+    if kind == "numpy":
+        return npz[key]
+    if kind == "masked":
+        values = pd.array(npz[key], dtype=header["dtype"])
+        values[npz[f"{key}.mask"]] = pd.NA
+        return values
+    if kind == "category":
+        categories = _decode_column(npz, f"{key}.categories", header["categories"])
+        return pd.Categorical.from_codes(
+            npz[f"{key}.codes"], categories=categories, ordered=header["ordered"]
+        )
+    if kind == "text":
+        codes = npz[f"{key}.codes"]
+        uniques = npz[f"{key}.values"].astype(object)
+        values = uniques.take(codes, mode="clip") if len(uniques) else np.full(len(codes), None, dtype=object)
+        values[codes < 0] = None
+        if header["dtype"] == "object":
+            return pd.Series(values, dtype=object)
+        return pd.array(values, dtype=header["dtype"])
+    raise ValueError(f"Unknown column kind '{kind}'")
+
+
+def _write_npz(df, path):
+    arrays = {}
+    columns = []
+    for i, name in enumerate(df.columns):
+        column_arrays, header = _encode_column(f"c{i}", df.iloc[:, i])
+        arrays.update(column_arrays)
+        header["name"] = name
+        header["key"] = f"c{i}"
+        columns.append(header)
+    header = {"version": 1, "rows": len(df), "columns": columns}
+    arrays[_HEADER_KEY] = np.array(json.dumps(header))
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _read_npz_header(npz):
+    return json.loads(str(npz[_HEADER_KEY]))
+
+
+def read_columns(path):
+    """Return the column names stored in an artifact without loading its data."""
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as npz:
+            return [c["name"] for c in _read_npz_header(npz)["columns"]]
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _is_numeric(dtype):
+    return pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype))
+
+
+def cast_column(values, dtype):
+    """Cast a column to `dtype`; for numeric dtypes, values that are not numbers become NaN."""
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if _is_numeric(dtype):
+        return pd.to_numeric(values, errors="coerce").astype(dtype)
+    return values.astype(dtype)
+
+
+def cast_frame(df, dtypes):
+    """Return df with the columns named in `dtypes` cast (see cast_column)."""
+    return df.assign(**{col: cast_column(df[col], dtype) for col, dtype in dtypes.items() if col in df})
+
+
+def _read_csv(path, dtypes, **kwargs):
+    """pd.read_csv with text/categorical dtypes applied by the parser; numeric ones are coerced after."""
+    dtypes = dtypes or {}
+    parser_dtypes = {col: dtype for col, dtype in dtypes.items() if not _is_numeric(dtype)}
+    numeric = {col: dtype for col, dtype in dtypes.items() if _is_numeric(dtype)}
+    result = pd.read_csv(path, dtype=parser_dtypes or None, **kwargs)
+    if "chunksize" in kwargs:
+        return (cast_frame(chunk, numeric) for chunk in result)
+    return cast_frame(result, numeric)
+
+
+def _decode_columns(npz, stored, index, dtypes):
+    data = {}
+    for c in stored:
+        values = _decode_column(npz, c["key"], c)
+        if isinstance(values, pd.Series):
+            # Take the values, not the labels, so chunks starting past row 0 line up; the
+            # dtype is given so object text is not inferred as str
+            values = pd.Series(values.array, index=index, dtype=values.dtype)
+        if dtypes and c["name"] in dtypes:
+            values = cast_column(pd.Series(values, index=index), dtypes[c["name"]])
+        data[c["name"]] = values
+    return pd.DataFrame(data, index=index)
+
+
+def write_frame(df, path):
+    """Write a DataFrame to `path` atomically; the extension (.npz or .csv) picks the format."""
+    if not path.endswith((".npz", ".csv")):
+        raise ValueError(f"Unsupported artifact extension: {path}")
+    with atomic_path(path) as temp:
+        if path.endswith(".npz"):
+            _write_npz(df, temp)
+        else:
+            df.to_csv(temp, index=False)
+    count_io(written=os.path.getsize(path))
+
+
+def read_frame(path, columns=None, dtypes=None):
+    """
+    Read an artifact written by write_frame.
+
+    Args:
+        path: .npz or .csv file
+        columns: Optional list of column names to load; other columns are skipped
+        dtypes: Optional dict of column name to dtype, applied while reading (see cast_column)
+
+    Returns:
+        DataFrame with a fresh RangeIndex and the stored dtypes (CSV is type-inferred)
+        unless `dtypes` says otherwise
+    """
+    if path.endswith(".csv"):
+        count_io(read=os.path.getsize(path))
+        return _read_csv(path, dtypes, usecols=columns)
+    if not path.endswith(".npz"):
+        raise ValueError(f"Unsupported artifact extension: {path}")
+
+    with np.load(path, allow_pickle=False) as npz:
+        header = _read_npz_header(npz)
+        stored = header["columns"]
+        if columns is not None:
+            by_name = {c["name"]: c for c in stored}
+            missing = [c for c in columns if c not in by_name]
+            if missing:
+                raise KeyError(f"Columns not found in {path}: {missing}")
+            wanted = set(columns)
+            stored = [c for c in stored if c["name"] in wanted]
+        count_io(read=_npz_member_bytes(path, {c["key"] for c in stored}))
+        return _decode_columns(npz, stored, pd.RangeIndex(header["rows"]), dtypes)
+
+
+def copy_artifact(src, dst, chunksize=100_000):
+    """Copy an artifact, converting between formats chunk by chunk when the extensions differ."""
+    if os.path.splitext(src)[1] == os.path.splitext(dst)[1]:
+        with atomic_path(dst) as temp:
+            shutil.copyfile(src, temp)
+        size = os.path.getsize(dst)
+        count_io(read=size, written=size)
+        return
+    with ChunkWriter(dst) as writer:
+        for chunk in iter_chunks(src, chunksize):
+            writer.append(chunk)
+
+
+def _memmap_npz_member(path, name):
+    """Memory-map one array stored (uncompressed) in an .npz archive."""
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path, allow_pickle=False) as npz:
+            return npz[name]
+
+    with open(path, "rb") as f:
+        # Skip the zip local file header to reach the .npy payload
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def iter_chunks(path, chunksize, columns=None, dtypes=None):
+    """
+    Yield an artifact as DataFrames of at most `chunksize` rows.
+
+    CSV files are parsed chunk by chunk; .npz columns are memory-mapped, so only the
+    rows of the current chunk (plus the dictionary of each text column) are decoded.
+    Row labels continue across chunks, as with pd.read_csv(chunksize=...). `dtypes` is
+    applied to every chunk as in read_frame.
+    """
+    if path.endswith(".csv"):
+        count_io(read=os.path.getsize(path))
+        yield from _read_csv(path, dtypes, chunksize=chunksize, usecols=columns)
+        return
+    if not path.endswith(".npz"):
+        raise ValueError(f"Unsupported artifact extension: {path}")
+
+    with np.load(path, allow_pickle=False) as npz:
+        header = _read_npz_header(npz)
+        member_names = [name[:-4] for name in npz.zip.namelist()]
+    stored = header["columns"]
+    if columns is not None:
+        wanted = set(columns)
+        stored = [c for c in stored if c["name"] in wanted]
+    count_io(read=_npz_member_bytes(path, {c["key"] for c in stored}))
+
+    # Per-row arrays are sliced per chunk; dictionaries/categories are small and loaded once
+    per_row = {}
+    static = {}
+    for c in stored:
+        key = c["key"]
+        for name in member_names:
+            if name in (key, f"{key}.codes", f"{key}.mask"):
+                per_row[name] = _memmap_npz_member(path, name)
+            elif name.startswith(f"{key}."):
+                static[name] = _memmap_npz_member(path, name)
+
+    rows = header["rows"]
+    for start in range(0, rows, chunksize):
+        stop = min(start + chunksize, rows)
+        arrays = dict(static)
+        arrays.update({name: np.asarray(values[start:stop]) for name, values in per_row.items()})
+        yield _decode_columns(arrays, stored, pd.RangeIndex(start, stop), dtypes)
+
+
+class ChunkWriter:
+    """
+    Append DataFrame chunks to an artifact without holding the whole frame in memory.
+
+    CSV chunks are appended as they arrive. For .npz each column is spilled to a
+    temporary file and the archive is assembled in close(); text columns share one
+    dictionary across chunks, and numeric columns are widened to a common dtype.
+    Every chunk must have the same columns as the first one. Either format is written
+    to a temporary file that only replaces `path` in close(), so an interrupted writer
+    leaves no partial artifact.
+    """
+
+    def __init__(self, path):
+        if not path.endswith((".csv", ".npz")):
+            raise ValueError(f"Unsupported artifact extension: {path}")
+        self.path = path
+        self.columns = None
+        self.rows = 0
+        self._spill_dir = None
+        self._spills = []
+        self._temp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cleanup()
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            self._temp = _temp_path(self.path)
+            if self.path.endswith(".npz"):
+                self._spill_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(self.path)))
+                self._spills = [
+                    {"file": open(os.path.join(self._spill_dir, f"c{i}"), "wb"), "chunks": [], "uniques": {}, "text_dtype": None}
+                    for i in range(len(self.columns))
+                ]
+        elif list(df.columns) != self.columns:
+            raise ValueError(f"Chunk columns {list(df.columns)} do not match {self.columns}")
+
+        if self.path.endswith(".csv"):
+            df.to_csv(self._temp, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        else:
+            for i, spill in enumerate(self._spills):
+                self._spill_column(spill, df.iloc[:, i])
+        self.rows += len(df)
+
+    def _spill_column(self, spill, series):
+        dtype = series.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+            values = np.ascontiguousarray(series.to_numpy())
+            spill["chunks"].append(("numeric", values.dtype, len(values)))
+        else:
+            values = self._text_codes(spill, series)
+            spill["chunks"].append(("text", values.dtype, len(values)))
+            if spill["text_dtype"] is None:
+                spill["text_dtype"] = str(dtype)
+        values.tofile(spill["file"])
+
+    @staticmethod
+    def _text_codes(spill, series):
+        """Dictionary-encode a chunk against the column's shared dictionary."""
+        local_codes, local_uniques = pd.factorize(series, use_na_sentinel=True)
+        uniques = spill["uniques"]
+        mapping = np.array([uniques.setdefault(str(v), len(uniques)) for v in local_uniques], dtype=np.int32)
+        codes = np.full(len(local_codes), -1, dtype=np.int32)
+        valid = local_codes >= 0
+        codes[valid] = mapping[local_codes[valid]]
+        return codes
+
+    def _read_spill_chunks(self, i):
+        spill = self._spills[i]
+        with open(os.path.join(self._spill_dir, f"c{i}"), "rb") as f:
+            for kind, dtype, length in spill["chunks"]:
+                yield kind, np.fromfile(f, dtype=dtype, count=length)
+
+    @staticmethod
+    def _write_member(zf, name, dtype, length, chunks):
+        with zf.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array_header_1_0(
+                f, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (length,)}
+            )
+            for values in chunks:
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def close(self):
+        """Finish the artifact. A CSV that never received a chunk is left unwritten."""
+        if self.columns is None:
+            if self.path.endswith(".npz"):
+                write_frame(pd.DataFrame(), self.path)
+            return
+        try:
+            if self.path.endswith(".npz"):
+                self._assemble_npz()
+            _commit(self._temp, self.path)
+            self._temp = None
+        finally:
+            self._cleanup()
+        count_io(written=os.path.getsize(self.path))
+
+    def _assemble_npz(self):
+        for spill in self._spills:
+            spill["file"].close()
+
+        columns = []
+        with zipfile.ZipFile(self._temp, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for i, (name, spill) in enumerate(zip(self.columns, self._spills)):
+                key = f"c{i}"
+                kinds = {kind for kind, _, _ in spill["chunks"]}
+                if kinds == {"numeric"}:
+                    dtype = np.result_type(*[chunk_dtype for _, chunk_dtype, _ in spill["chunks"]])
+                    chunks = (values for _, values in self._read_spill_chunks(i))
+                    self._write_member(zf, key, dtype, self.rows, chunks)
+                    columns.append({"kind": "numpy", "dtype": dtype.str, "name": name, "key": key})
+                    continue
+
+                # Any text chunk makes the whole column text; numeric chunks (e.g. a chunk
+                # where a text column was entirely empty) are encoded into the dictionary
+                def text_chunks(i=i, spill=spill):
+                    for kind, values in self._read_spill_chunks(i):
+                        yield values if kind == "text" else self._text_codes(spill, pd.Series(values))
+
+                self._write_member(zf, f"{key}.codes", np.dtype(np.int32), self.rows, text_chunks())
+                uniques = np.asarray(list(spill["uniques"]), dtype=str)
+                with zf.open(f"{key}.values.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, uniques, allow_pickle=False)
+                columns.append({"kind": "text", "dtype": spill["text_dtype"], "name": name, "key": key})
+
+            header = {"version": 1, "rows": self.rows, "columns": columns}
+            with zf.open(f"{_HEADER_KEY}.npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, np.array(json.dumps(header)), allow_pickle=False)
+
+    def _cleanup(self):
+        for spill in self._spills:
+            spill["file"].close()
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        if self._temp is not None:
+            with contextlib.suppress(OSError):
+                os.remove(self._temp)
+            self._temp = None
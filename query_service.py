@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Local query service over the pipeline outputs.
+
+The aligned weld table and the corrected feature tables are loaded once into per-run
+indexes sorted by corrected distance, so each lookup is a searchsorted over arrays in
+memory rather than a re-read of an artifact:
+
+    GET /runs                                   Runs, row counts and when the outputs were loaded
+    GET /features?run=R&start=X&end=Y           Features of run R with X <= corrected distance <= Y
+                  [&class=metal_loss][&limit=N]
+    GET /welds/nearest?x=X[&run=R]              Reference weld nearest to X, or run R's matched weld
+    GET /welds/N                                Matched history of aligned weld id N: its distance,
+                                                thickness and joint length in every run, the
+                                                comparison columns and every feature in the joint
+
+Corrected coordinates are those of feature_correction: the reference run's distances.
+Responses are JSON; missing values are null.
+
+The service polls the artifact modification times and, once a new set of outputs has
+stopped changing for one poll interval, builds a new index in a worker thread and swaps
+it in. Requests keep being answered from the old index until then, and an output that
+fails to load (e.g. still being written) leaves the old index in place.
+
+Usage: python query_service.py [--output-folder DIR] [--host HOST] [--port PORT] [--poll SECONDS]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from pre_processing import apply_drift_correction, feature_correction, storage
+
+PIPELINE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pre_processing")
+ALIGNED_STEM = apply_drift_correction.INPUT_STEM
+WELD_SUFFIX = "_weld_aligned"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+POLL_SECONDS = 2.0
+
+# Requests larger than this (request line and headers) are rejected
+MAX_REQUEST_BYTES = 16 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+class QueryError(Exception):
+    """A request the index cannot answer; carries the HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def output_signature(output_folder):
+    """(path, mtime, size) of every artifact the index is built from; changes when the pipeline writes."""
+    paths = list(storage.list_artifacts(os.path.join(output_folder, "aligned"), ALIGNED_STEM).values())
+    paths += storage.list_artifacts(os.path.join(output_folder, "features"), f"*{feature_correction.OUTPUT_SUFFIX}").values()
+    signature = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _records(df):
+    """JSON-ready rows of a frame (NaN becomes None, NumPy scalars become Python ones)."""
+    return json.loads(df.to_json(orient="records"))
+
+
+def _row(df, i):
+    """Row i of a frame as a dict of Python values, read per column so dtypes are not mixed."""
+    return {col: _value(df[col].iat[i]) for col in df.columns}
+
+
+def _value(x):
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return None
+    return x.item() if isinstance(x, np.generic) else x
+
+
+class OutputIndex:
+    """
+    In-memory indexes over one set of pipeline outputs.
+
+    Per run: all feature classes in one frame sorted by distance_corrected, plus the
+    order of its rows by weld_id. For the aligned table: the reference weld distances
+    sorted, and the rows by aligned id.
+    """
+
+    def __init__(self, aligned, features, signature=()):
+        """
+        Args:
+            aligned: Aligned weld table (merged_by_distance)
+            features: dict mapping '<run>_<class>_corrected' to the corrected feature rows
+            signature: output_signature() of the artifacts these came from
+        """
+        self.signature = signature
+        self.loaded_at = datetime.datetime.now().isoformat(timespec="seconds")
+
+        distance_cols = [col for col in aligned.columns if col.endswith("__distance")]
+        if not distance_cols:
+            raise ValueError("Aligned table has no <run>__distance columns")
+        self.reference_col = distance_cols[0]
+        prefixes = [col[: -len("__distance")] for col in distance_cols if col.endswith(f"{WELD_SUFFIX}__distance")]
+        self.runs = [prefix[: -len(WELD_SUFFIX)] for prefix in prefixes]
+
+        self.aligned = aligned.sort_values("id", kind="stable").reset_index(drop=True)
+        self._ids = self.aligned["id"].to_numpy()
+        reference = self.aligned[self.reference_col].to_numpy(dtype="float64", na_value=np.nan)
+        order = np.argsort(reference, kind="stable")
+        order = order[~np.isnan(reference[order])]
+        self._weld_order = order
+        self._weld_distance = reference[order]
+
+        classes = {run: [] for run in self.runs}
+        for stem, df in features.items():
+            run = feature_correction._run_of(stem, self.runs)
+            if run is None:
+                continue
+            name = stem[len(run) + 1:]
+            if name.endswith(feature_correction.OUTPUT_SUFFIX):
+                name = name[: -len(feature_correction.OUTPUT_SUFFIX)]
+            classes[run].append(df.assign(**{"class": name}))
+
+        self.features = {}
+        self._distance = {}
+        self._by_weld = {}
+        for run, frames in classes.items():
+            if not frames:
+                continue
+            df = pd.concat(frames, ignore_index=True)
+            distance = df["distance_corrected"].to_numpy(dtype="float64", na_value=np.nan)
+            # NaN distances sort last, past every searchsorted bound
+            df = df.iloc[np.argsort(distance, kind="stable")].reset_index(drop=True)
+            self.features[run] = df
+            self._distance[run] = df["distance_corrected"].to_numpy(dtype="float64", na_value=np.nan)
+            weld_id = df["weld_id"].to_numpy(dtype="float64", na_value=np.nan)
+            weld_order = np.argsort(weld_id, kind="stable")
+            self._by_weld[run] = (weld_id[weld_order], weld_order)
+
+    @classmethod
+    def load(cls, output_folder=PIPELINE_FOLDER):
+        """
+        Read the aligned table and every corrected feature table of an output folder.
+
+        Raises:
+            FileNotFoundError: When the aligned table has not been written yet
+        """
+        signature = output_signature(output_folder)
+        aligned_path = storage.find_artifact(os.path.join(output_folder, "aligned"), ALIGNED_STEM)
+        if aligned_path is None:
+            raise FileNotFoundError(f"No {ALIGNED_STEM} artifact in {os.path.join(output_folder, 'aligned')}")
+        features_folder = os.path.join(output_folder, "features")
+        features = {
+            stem: storage.read_frame(path)
+            for stem, path in storage.list_artifacts(features_folder, f"*{feature_correction.OUTPUT_SUFFIX}").items()
+        }
+        return cls(storage.read_frame(aligned_path), features, signature)
+
+    def _run(self, run):
+        if run not in self.runs:
+            raise QueryError(f"Unknown run {run!r}; runs are {self.runs}", 404)
+        return run
+
+    def summary(self):
+        return {
+            "loaded_at": self.loaded_at,
+            "reference": self.reference_col[: -len(f"{WELD_SUFFIX}__distance")],
+            "welds": len(self.aligned),
+            "runs": {
+                run: {
+                    "features": len(self.features.get(run, ())),
+                    "classes": sorted(self.features[run]["class"].unique()) if run in self.features else [],
+                }
+                for run in self.runs
+            },
+        }
+
+    def features_between(self, run, start, end, feature_class=None, limit=None):
+        """
+        Features of `run` with start <= distance_corrected <= end, in distance order.
+
+        Returns:
+            The matching rows (a slice of the run's sorted frame)
+        """
+        run = self._run(run)
+        if run not in self.features:
+            return pd.DataFrame()
+        distance = self._distance[run]
+        lo = np.searchsorted(distance, start, side="left")
+        hi = np.searchsorted(distance, end, side="right")
+        rows = self.features[run].iloc[lo:hi]
+        if feature_class is not None:
+            rows = rows[rows["class"] == feature_class]
+        if limit is not None:
+            rows = rows.iloc[:limit]
+        return rows
+
+    def nearest_weld(self, x, run=None):
+        """
+        Weld nearest to corrected distance x: a reference weld from the aligned table,
+        or with `run` the nearest of that run's welds.
+
+        Returns:
+            dict with the weld's fields and its offset (x minus its distance), or None
+        """
+        if run is None:
+            distance, rows, frame = self._weld_distance, self._weld_order, self.aligned
+        else:
+            welds = self.features_between(run, -np.inf, np.inf, feature_class="weld")
+            distance = welds["distance_corrected"].to_numpy(dtype="float64", na_value=np.nan) if len(welds) else np.empty(0)
+            rows, frame = np.arange(len(welds)), welds
+        if len(distance) == 0:
+            return None
+        i = np.searchsorted(distance, x)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(distance)]
+        j = min(candidates, key=lambda k: abs(distance[k] - x))
+        weld = _row(frame, rows[j])
+        weld["offset"] = float(x - distance[j])
+        return weld
+
+    def weld_history(self, weld_id):
+        """
+        Everything known about aligned weld `weld_id` across runs.
+
+        Returns:
+            dict with per-run matched attributes (matched is False where the run has no
+            weld at this position), the comparison columns and each run's features in
+            the joint downstream of the weld
+
+        Raises:
+            QueryError: When no aligned weld has this id
+        """
+        i = np.searchsorted(self._ids, weld_id)
+        if i >= len(self._ids) or self._ids[i] != weld_id:
+            raise QueryError(f"No aligned weld with id {weld_id}", 404)
+        row = _row(self.aligned, i)
+
+        runs = {run: {} for run in self.runs}
+        comparison = {}
+        for col, value in row.items():
+            prefix, sep, key = col.partition("__")
+            if not sep:
+                continue
+            if prefix.endswith(WELD_SUFFIX) and prefix[: -len(WELD_SUFFIX)] in runs:
+                runs[prefix[: -len(WELD_SUFFIX)]][key] = value
+            else:
+                comparison[col] = value
+
+        for run, fields in runs.items():
+            fields["matched"] = fields.get("distance") is not None
+            fields["features"] = []
+            if run in self._by_weld:
+                weld_ids, order = self._by_weld[run]
+                lo, hi = np.searchsorted(weld_ids, [weld_id, weld_id + 1])
+                joint = self.features[run].iloc[np.sort(order[lo:hi])]
+                fields["features"] = _records(joint[joint["class"] != "weld"])
+
+        return {
+            "id": row["id"],
+            "distance_corrected": row.get("distance_corrected"),
+            "runs": runs,
+            "comparison": comparison,
+        }
+
+
+def _float(params, name, required=True):
+    """A finite number from the query parameters, or None when optional and absent."""
+    if name not in params:
+        if required:
+            raise QueryError(f"Missing query parameter {name!r}")
+        return None
+    try:
+        value = float(params[name])
+    except ValueError:
+        value = np.nan
+    if not np.isfinite(value):
+        raise QueryError(f"Query parameter {name!r} must be a finite number, got {params[name]!r}")
+    return value
+
+
+def _count(params, name):
+    """A non-negative integer from the query parameters, or None when absent."""
+    if name not in params:
+        return None
+    try:
+        value = int(params[name])
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise QueryError(f"Query parameter {name!r} must be a non-negative integer, got {params[name]!r}")
+    return value
+
+
+def answer(index, path, params):
+    """
+    Route one GET request to the index.
+
+    Args:
+        index: OutputIndex, or None while nothing is loaded
+        path: Request path (e.g. '/features')
+        params: dict of query parameters (last value wins)
+
+    Returns:
+        (HTTP status, JSON-serializable body)
+    """
+    try:
+        if path == "/health":
+            return 200, {"status": "ok", "loaded": index is not None}
+        if index is None:
+            raise QueryError("No pipeline outputs loaded yet", 503)
+        if path == "/runs":
+            return 200, index.summary()
+        if path == "/features":
+            if "run" not in params:
+                raise QueryError("Missing query parameter 'run'")
+            rows = index.features_between(
+                params["run"],
+                _float(params, "start"),
+                _float(params, "end"),
+                params.get("class"),
+                _count(params, "limit"),
+            )
+            return 200, {"run": params["run"], "count": len(rows), "features": _records(rows)}
+        if path == "/welds/nearest":
+            weld = index.nearest_weld(_float(params, "x"), params.get("run"))
+            if weld is None:
+                raise QueryError("No welds to search", 404)
+            return 200, weld
+        if path.startswith("/welds/"):
+            try:
+                weld_id = int(path[len("/welds/"):])
+            except ValueError:
+                raise QueryError(f"Weld id must be an integer, got {path[len('/welds/'):]!r}")
+            return 200, index.weld_history(weld_id)
+        raise QueryError(f"Unknown path {path!r}", 404)
+    except QueryError as e:
+        return e.status, {"error": str(e)}
+
+
+class QueryService:
+    """Serve an OutputIndex over HTTP and swap in a new one when the outputs change."""
+
+    def __init__(self, output_folder=PIPELINE_FOLDER, poll_seconds=POLL_SECONDS):
+        self.output_folder = output_folder
+        self.poll_seconds = poll_seconds
+        self.index = None
+
+    async def reload(self, signature=None):
+        """Build a new index off the event loop; keep the old one if loading fails."""
+        start = time.perf_counter()
+        try:
+            index = await asyncio.to_thread(OutputIndex.load, self.output_folder)
+        except Exception as e:
+            print(f"Could not load outputs from {self.output_folder}: {type(e).__name__}: {e}")
+            return False
+        if signature is not None and index.signature != signature:
+            # Written to again while loading; the watcher picks it up on its next pass
+            print("Outputs changed while loading; will reload")
+        self.index = index
+        rows = sum(len(df) for df in index.features.values())
+        print(
+            f"Loaded {len(index.aligned)} welds and {rows} features of {len(index.runs)} run(s) "
+            f"in {time.perf_counter() - start:.2f} s"
+        )
+        return True
+
+    async def watch(self):
+        """Reload once the output signature has changed and then held still for one poll."""
+        previous = None
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            signature = await asyncio.to_thread(output_signature, self.output_folder)
+            loaded = self.index.signature if self.index is not None else None
+            if signature and signature != loaded and signature == previous:
+                print("Pipeline outputs changed; reloading")
+                await self.reload(signature)
+            previous = signature
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        method, target = (head.split(b"\r\n", 1)[0].decode("latin1").split(" ") + ["", ""])[:2]
+        if method != "GET":
+            status, body = 405, {"error": "Only GET is supported"}
+        else:
+            url = urlsplit(target)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status, body = answer(self.index, url.path.rstrip("/") or "/", params)
+
+        payload = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin1") + payload
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        await self.reload()
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        print(f"Serving {self.output_folder} on http://{host}:{port}/ (polling every {self.poll_seconds:g} s)")
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.watch())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve lookups over the aligned and corrected pipeline outputs")
+    parser.add_argument("--output-folder", default=PIPELINE_FOLDER, help="Folder holding aligned/ and features/")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between checks for new outputs")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(QueryService(args.output_folder, args.poll).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
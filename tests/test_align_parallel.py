@@ -0,0 +1,55 @@
+"""Alignment split across worker processes (align._segments, align._merge)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pre_processing import align, schema
+
+
+def _weld_frames(n=6000, seed=0):
+    """A reference line and two later runs with slip, noise, a start offset and missing welds."""
+    rng = np.random.default_rng(seed)
+    jlength = rng.normal(40.0, 1.5, n)
+    distance = np.concatenate([[0.0], np.cumsum(jlength[:-1])])
+    frames = {"r_2007_weld_aligned": pd.DataFrame({schema.DISTANCE: distance, schema.JOINT_LENGTH: jlength})}
+    for year, shift in ((2015, 150.0), (2022, -80.0)):
+        keep = rng.random(n) > 0.01
+        slip = 1.0 + rng.normal(0.0, 2e-4)
+        frames[f"r_{year}_weld_aligned"] = pd.DataFrame({
+            schema.DISTANCE: distance[keep] * slip + shift + rng.normal(0.0, 0.3, keep.sum()),
+            schema.JOINT_LENGTH: jlength[keep] + rng.normal(0.0, 0.1, keep.sum()),
+            schema.HEIGHT: rng.normal(0.0, 0.5, keep.sum()),
+        })
+    return frames
+
+
+def test_segments_cut_only_where_no_pair_can_cross(monkeypatch):
+    monkeypatch.setattr(align, "SEGMENT_WELDS", 100)
+    rng = np.random.default_rng(1)
+    ref_key = np.sort(rng.uniform(0.0, 40000.0, 1000))
+    run_key = np.sort(ref_key + rng.normal(0.0, 3.0, 1000))
+
+    segments = align._segments(ref_key, run_key, 20.0)
+
+    assert len(segments) > 5
+    assert segments[0][0] == segments[0][2] == 0
+    assert (segments[-1][1], segments[-1][3]) == (len(ref_key), len(run_key))
+    for (_, ref_stop, _, run_stop), (ref_start, _, run_start, _) in zip(segments, segments[1:]):
+        assert (ref_stop, run_stop) == (ref_start, run_start)
+        before = max(ref_key[:ref_stop].max(initial=-np.inf), run_key[:run_stop].max(initial=-np.inf))
+        after = min(ref_key[ref_start:].min(initial=np.inf), run_key[run_start:].min(initial=np.inf))
+        assert after - before > 20.0
+
+
+@pytest.mark.parametrize(
+    "method, iterative", [("nearest", False), ("assignment", False), ("nearest", True), ("assignment", True)]
+)
+def test_parallel_alignment_matches_serial(monkeypatch, method, iterative):
+    monkeypatch.setattr(align, "SEGMENT_WELDS", 500)
+    frames = _weld_frames()
+
+    serial = align.align_runs(frames, iterative=iterative, method=method, workers=1)
+    split = align.align_runs(frames, iterative=iterative, method=method, workers=4)
+
+    pd.testing.assert_frame_equal(split, serial, check_exact=True)
+    assert serial["r_2015_weld_aligned__distance"].notna().mean() > 0.95
@@ -0,0 +1,100 @@
+"""One-to-one weld matching by banded assignment (align._assign)."""
+import itertools
+
+import numpy as np
+import pytest
+
+from pre_processing import align
+
+
+def _cost(ref_key, run_key, ref_jlength, run_jlength, matched, tolerance):
+    """Total cost of a pairing as _assign scores it: pairs plus every unmatched weld."""
+    total = 0.0
+    unmatched_cost = 1.0 + align.JOINT_WEIGHT
+    for i, j in enumerate(matched):
+        if j < 0:
+            total += unmatched_cost
+            continue
+        joint = np.nan_to_num(min(abs(ref_jlength[i] - run_jlength[j]) / align.JOINT_SCALE, 1.0))
+        total += abs(ref_key[i] - run_key[j]) / tolerance + align.JOINT_WEIGHT * joint
+    return total + unmatched_cost * (len(run_key) - int((matched >= 0).sum()))
+
+
+def _brute_force(ref_key, run_key, ref_jlength, run_jlength, tolerance):
+    """Lowest cost over every one-to-one pairing within tolerance."""
+    choices = [-1, *range(len(run_key))]
+    best = np.inf
+    for matched in itertools.product(choices, repeat=len(ref_key)):
+        paired = [j for j in matched if j >= 0]
+        if len(paired) != len(set(paired)):
+            continue
+        if any(j >= 0 and abs(ref_key[i] - run_key[j]) > tolerance for i, j in enumerate(matched)):
+            continue
+        best = min(best, _cost(ref_key, run_key, ref_jlength, run_jlength, np.array(matched), tolerance))
+    return best
+
+
+def _line(rng, n, spacing=40.0):
+    """Sorted weld keys about `spacing` ft apart, with joint lengths."""
+    key = np.cumsum(rng.normal(spacing, 2.0, n))
+    return key, np.diff(key, append=key[-1] + spacing)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_assign_is_optimal_on_small_blocks(seed):
+    rng = np.random.default_rng(seed)
+    tolerance = 3.0
+    ref_key = np.sort(rng.uniform(0, 8, rng.integers(1, 5)))
+    run_key = np.sort(rng.uniform(0, 8, rng.integers(1, 5)))
+    ref_jlength = rng.uniform(38, 42, len(ref_key))
+    run_jlength = rng.uniform(38, 42, len(run_key))
+
+    matched = align._assign(ref_key, run_key, ref_jlength, run_jlength, tolerance)
+
+    assert _cost(ref_key, run_key, ref_jlength, run_jlength, matched, tolerance) == pytest.approx(
+        _brute_force(ref_key, run_key, ref_jlength, run_jlength, tolerance)
+    )
+
+
+def test_assign_is_one_to_one_within_tolerance():
+    rng = np.random.default_rng(1)
+    tolerance = 3.0
+    ref_key, ref_jlength = _line(rng, 5000)
+    # Drop and add welds, and make the run's keys noisy enough that neighbours compete
+    keep = rng.random(len(ref_key)) > 0.02
+    run_key = np.sort(np.concatenate([ref_key[keep] + rng.normal(0, 1.5, keep.sum()), rng.uniform(0, ref_key[-1], 50)]))
+    run_jlength = np.diff(run_key, append=run_key[-1] + 40.0)
+
+    matched = align._assign(ref_key, run_key, ref_jlength, run_jlength, tolerance)
+
+    paired = matched[matched >= 0]
+    assert len(paired) == len(np.unique(paired))
+    assert np.all(np.abs(ref_key[matched >= 0] - run_key[paired]) <= tolerance)
+    assert len(paired) > 0.95 * keep.sum()
+
+
+def test_assign_unaffected_by_block_cap_on_separated_welds():
+    rng = np.random.default_rng(2)
+    ref_key, ref_jlength = _line(rng, 3000)
+    run_key = ref_key + rng.normal(0, 0.5, len(ref_key))
+    run_jlength = ref_jlength + rng.normal(0, 0.2, len(ref_key))
+
+    results = [align._assign(ref_key, run_key, ref_jlength, run_jlength, 3.0, cap) for cap in (2, 4, 64, 10**6)]
+
+    for matched in results[1:]:
+        np.testing.assert_array_equal(matched, results[0])
+
+
+def test_blocks_respect_the_cap():
+    rng = np.random.default_rng(3)
+    # Dense clusters wider than the cap, separated by gaps wider than the tolerance
+    positions = np.sort(np.concatenate([c + rng.uniform(0, 20, 150) for c in (0.0, 100.0, 200.0)]))
+    max_block = 16
+
+    small, large = align._blocks(positions, 3.0, max_block)
+
+    bounds = sorted([tuple(b) for b in small] + large)
+    assert all(hi - lo <= max_block for lo, hi in bounds)
+    # The blocks cover every position exactly once, in order
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(positions)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
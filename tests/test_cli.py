@@ -0,0 +1,45 @@
+"""Command-line parsing (cli.py)."""
+import subprocess
+import sys
+
+import pytest
+
+import cli
+from pre_processing import align, memory, storage
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["run", "--format", "nzp"],
+        ["align", "--matching", "nearst"],
+        ["ingest", "book.xlsx", "--format", "parquet"],
+        ["batch", "fleet.json", "--output-root", "out", "--format", "xlsx"],
+    ],
+)
+def test_unknown_format_or_matching_fails_at_parse_time(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.build_parser().parse_args(argv)
+
+    assert exit_info.value.code == 2
+    assert "invalid choice" in capsys.readouterr().err
+
+
+def test_choices_come_from_the_pipeline_modules():
+    assert list(cli.FORMATS) == list(storage.FORMATS)
+    assert list(cli.MATCH_METHODS) == list(align.MATCH_METHODS)
+    args = cli.build_parser().parse_args(["run", "--format", "csv", "--matching", "assignment"])
+    assert (args.format, args.matching) == ("csv", "assignment")
+
+
+def test_building_the_parser_does_not_import_numpy():
+    code = "import sys, cli; cli.build_parser().parse_args(['report']); print('numpy' in sys.modules)"
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=cli.ROOT)
+
+    assert result.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize("n", [0, 512, 1023, 1024, 1536, 5 * 1024**2, 3 * 1024**3, 7 * 1024**4])
+def test_format_bytes_matches_memory(n):
+    assert cli._format_bytes(n) == memory.format_bytes(n)
@@ -0,0 +1,109 @@
+"""Clock-position parsing (clock.py)."""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data import synthetic
+from pre_processing import clock, data_preprocessing, schema, storage
+
+
+@pytest.mark.parametrize(
+    "value, degrees",
+    [
+        ("2:25", 72.5),
+        ("12:05", 2.5),
+        (" 3:00 ", 90.0),
+        ("02:25:00", 72.5),
+        ("14:30:30", 75.25),
+        ("1900-01-01 06:00:00", 180.0),
+        (datetime.time(2, 25), 72.5),
+        (datetime.time(9, 0, 30), 270.25),
+        (pd.Timedelta(hours=4, minutes=30), 135.0),
+        ("3", 90.0),
+    ],
+)
+def test_clock_forms(value, degrees):
+    angles, unparseable = clock.parse_clock(pd.Series([value]))
+
+    np.testing.assert_allclose(angles, [degrees])
+    assert unparseable == 0
+
+
+@pytest.mark.parametrize(
+    "values, degrees",
+    [
+        # Every number below 1: Excel fractions of a day
+        ([0.5, 0.25, 0.1], [0.0, 180.0, 72.0]),
+        (["0.5", "0.25"], [0.0, 180.0]),
+        # Any number of 1 or more: the column is hours, so 0.5 is half past twelve
+        ([0.5, 3.0, 11.5], [15.0, 90.0, 345.0]),
+        (["0.5", "3", "2:00"], [15.0, 90.0, 60.0]),
+    ],
+)
+def test_numbers_are_day_fractions_only_when_all_below_one(values, degrees):
+    angles, unparseable = clock.parse_clock(pd.Series(values))
+
+    np.testing.assert_allclose(angles, degrees)
+    assert unparseable == 0
+
+
+def test_day_fraction_can_be_decided_for_the_whole_column():
+    chunk = pd.Series([0.5, 0.25])
+
+    hours, _ = clock.parse_clock(chunk, day_fraction=False)
+    fractions, _ = clock.parse_clock(chunk, day_fraction=True)
+
+    np.testing.assert_allclose(hours, [15.0, 7.5])
+    np.testing.assert_allclose(fractions, [0.0, 180.0])
+    assert clock.largest_number(pd.Series(["2:00", "0.5", None])) == 0.5
+    assert np.isnan(clock.largest_number(pd.Series(["2:00", None])))
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [None, np.nan],
+        [np.nan, np.nan],
+        ["", "  "],
+        [pd.NaT, pd.NaT],
+        pd.Series([None, None], dtype="category"),
+    ],
+)
+def test_missing_values_are_nan_and_not_counted(values):
+    angles, unparseable = clock.parse_clock(pd.Series(values))
+
+    assert np.isnan(angles).all()
+    assert unparseable == 0
+
+
+def test_unparseable_values_are_counted():
+    angles, unparseable = clock.parse_clock(pd.Series(["2:25", "north", "25:00", None]))
+
+    np.testing.assert_allclose(angles[:1], [72.5])
+    assert np.isnan(angles[1:]).all()
+    assert unparseable == 2
+
+
+def test_radians():
+    angles, _ = clock.parse_clock(pd.Series(["3:00", "6:00"]), unit="rad")
+
+    np.testing.assert_allclose(angles, [np.pi / 2, np.pi])
+
+
+def test_streaming_decides_day_fractions_for_the_whole_column(tmp_path):
+    run = synthetic.generate_runs(40, years=(2007,), seed=2)["r_2007"]
+    clock_col = schema.find_column(run.columns, schema.CLOCK, "r_2007")
+    # Hours, but the first rows are all below 1 and would read as day fractions on their own
+    hours = np.where(np.arange(len(run)) < 10, 0.5, 3.0)
+    run[clock_col] = hours
+    path = str(tmp_path / "r_2007.csv")
+    storage.write_frame(run, path)
+
+    data_preprocessing.preprocess_file_chunked(path, str(tmp_path / "out.csv"), chunksize=5, run="r_2007")
+    whole = data_preprocessing.preprocess_runs({"r_2007": run})["r_2007"]
+    streamed = storage.read_frame(str(tmp_path / "out.csv"))
+
+    np.testing.assert_allclose(streamed[data_preprocessing.CLOCK_ANGLE_COLUMN], hours * 30.0)
+    np.testing.assert_allclose(whole[data_preprocessing.CLOCK_ANGLE_COLUMN], hours * 30.0)
@@ -0,0 +1,66 @@
+"""Coarse run-to-run offsets from joint-length signatures (coarse_align.py)."""
+import numpy as np
+
+from pre_processing import coarse_align
+
+
+def _line(rng, n):
+    """Weld distances and joint lengths of a line: ~40 ft joints with a few short pups."""
+    jlength = rng.normal(40.0, 1.5, n)
+    pups = rng.random(n) < 0.03
+    jlength[pups] = rng.uniform(5.0, 20.0, pups.sum())
+    distance = np.concatenate([[0.0], np.cumsum(jlength[:-1])])
+    return distance, jlength
+
+
+def test_cross_correlate_matches_direct_sum():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=30), rng.normal(size=45)
+
+    lags, scores, overlap = coarse_align.cross_correlate(a, b)
+
+    for lag, score, count in zip(lags, scores, overlap):
+        j = np.arange(max(0, -lag), min(len(a), len(b) - lag))
+        assert count == len(j)
+        np.testing.assert_allclose(score, np.mean(a[j] * b[j + lag]))
+
+
+def test_constant_offset_is_recovered():
+    rng = np.random.default_rng(1)
+    distance, jlength = _line(rng, 3000)
+    shift = 1234.5
+    # The run starts 40 joints in and measures with a little noise
+    run_distance = distance[40:] + shift + rng.normal(0, 0.1, len(distance) - 40)
+    run_jlength = jlength[40:] + rng.normal(0, 0.1, len(distance) - 40)
+
+    knots, offsets, score = coarse_align.estimate_offsets(distance, jlength, run_distance, run_jlength)
+
+    assert score > coarse_align.MIN_SCORE
+    np.testing.assert_allclose(coarse_align.offset_at(run_distance, knots, offsets), shift, atol=0.5)
+
+
+def test_slip_and_missing_weld_are_followed():
+    rng = np.random.default_rng(2)
+    distance, jlength = _line(rng, 4000)
+    # The odometer slips 25 ft halfway along, and the run misses one weld near the start
+    offset = np.where(np.arange(len(distance)) < 2000, -300.0, -275.0)
+    keep = np.ones(len(distance), dtype=bool)
+    keep[500] = False
+    run_distance = (distance + offset)[keep]
+    run_jlength = np.diff(run_distance, append=run_distance[-1] + 40.0)
+
+    knots, offsets, _ = coarse_align.estimate_offsets(distance, jlength, run_distance, run_jlength)
+    estimated = coarse_align.offset_at(run_distance, knots, offsets)
+
+    truth = offset[keep]
+    # Away from the slip itself, every weld gets its own stretch's offset
+    away = np.abs(np.flatnonzero(keep) - 2000) > coarse_align.WINDOW_JOINTS
+    np.testing.assert_allclose(estimated[away], truth[away], atol=1.0)
+
+
+def test_uncorrelated_runs_give_no_offset():
+    rng = np.random.default_rng(3)
+    distance, _ = _line(rng, 500)
+    flat = np.full(len(distance), 40.0)
+
+    assert coarse_align.estimate_offsets(distance, flat, distance, flat) is None
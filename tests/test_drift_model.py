@@ -0,0 +1,70 @@
+"""Piecewise-linear drift models (drift_model.py)."""
+import numpy as np
+import pytest
+
+from pre_processing.drift_model import DriftModel
+
+
+def _model(seed, n=12, source=None, target=None):
+    """Increasing forward map: knots ~100 ft apart, drift within a few feet."""
+    rng = np.random.default_rng(seed)
+    knots = np.cumsum(rng.uniform(80.0, 120.0, n))
+    return DriftModel(knots, rng.normal(0.0, 3.0, n), source, target)
+
+
+def _distances(*models):
+    """Distances spread over every model's knots and 500 ft past either end."""
+    low = min(model.knots[0] for model in models) - 500.0
+    high = max(model.knots[-1] for model in models) + 500.0
+    return np.linspace(low, high, 2001)
+
+
+def test_call_is_linear_between_and_beyond_knots():
+    model = DriftModel([0.0, 100.0, 300.0], [1.0, 3.0, -1.0])
+
+    np.testing.assert_allclose(model([0.0, 50.0, 100.0, 200.0, 300.0]), [1.0, 2.0, 3.0, 1.0, -1.0])
+    # End segments continue: slope 0.02 before the first knot, -0.02 after the last
+    np.testing.assert_allclose(model([-100.0, 400.0]), [-1.0, -3.0])
+
+
+def test_inverse_undoes_forward():
+    model = _model(0)
+    x = _distances(model)
+
+    np.testing.assert_allclose(model.inverse().forward(model.forward(x)), x, atol=1e-9)
+
+
+def test_inverse_of_order_reversing_model_raises():
+    with pytest.raises(ValueError, match="not invertible"):
+        DriftModel([0.0, 10.0], [0.0, -20.0]).inverse()
+
+
+def test_compose_matches_applying_both_models():
+    a = _model(1, source="r_2007", target="r_2015")
+    b = _model(2, n=20, source="r_2015", target="r_2022")
+    x = _distances(a, b)
+
+    composed = a.compose(b)
+
+    np.testing.assert_allclose(composed.forward(x), b.forward(a.forward(x)), atol=1e-9)
+    np.testing.assert_allclose(composed(x), b.forward(a.forward(x)) - x, atol=1e-9)
+    assert (composed.source, composed.target) == ("r_2007", "r_2022")
+
+
+def test_compose_with_inverse_is_identity():
+    model = _model(3)
+    x = _distances(model)
+
+    np.testing.assert_allclose(model.compose(model.inverse())(x), 0.0, atol=1e-9)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    model = _model(4, source="r_2007", target="r_2015")
+    path = tmp_path / "drift_model.npz"
+    model.save(path)
+
+    loaded = DriftModel.load(path)
+
+    np.testing.assert_array_equal(loaded.knots, model.knots)
+    np.testing.assert_array_equal(loaded.delta, model.delta)
+    assert (loaded.source, loaded.target) == ("r_2007", "r_2015")
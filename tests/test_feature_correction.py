@@ -0,0 +1,77 @@
+"""Weld-anchored distance correction (feature_correction.py), on hand-built welds."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pre_processing import feature_correction, schema
+
+# Matched welds: the first joint is 40 ft in the run and 20 ft in the reference (ratio
+# 0.5), the second 60 ft in both (ratio 1)
+RUN_WELDS = np.array([100.0, 140.0, 200.0])
+REF_WELDS = np.array([110.0, 130.0, 190.0])
+
+
+@pytest.mark.parametrize(
+    "distance, upstream, corrected, weld",
+    [
+        (100.0, None, 110.0, 0),  # a matched weld maps onto its reference weld
+        (120.0, None, 120.0, 0),  # 20 ft into the first joint, scaled by 0.5
+        (150.0, None, 140.0, 1),
+        (90.0, None, 105.0, 0),  # before the first weld: the first joint's ratio
+        (230.0, None, 220.0, 2),  # after the last weld: the last joint's ratio
+        (160.3, 20.0, 150.0, 1),  # own upstream weld is the matched one (within slack)
+        (149.8, 10.0, 140.0, 1),  # ... also when it lies just before the matched weld
+        (180.0, 10.0, 170.0, 1),  # upstream weld at 170 is not matched: offset from 140
+        (180.0, np.nan, 170.0, 1),  # missing upstream distance
+    ],
+)
+def test_correct_distances(distance, upstream, corrected, weld):
+    result, index = feature_correction.correct_distances(
+        [distance], None if upstream is None else [upstream], RUN_WELDS, REF_WELDS
+    )
+
+    np.testing.assert_allclose(result, [corrected])
+    assert index.tolist() == [weld]
+
+
+def test_single_weld_shifts_without_scaling():
+    result, index = feature_correction.correct_distances([50.0, 150.0], None, np.array([100.0]), np.array([90.0]))
+
+    np.testing.assert_allclose(result, [40.0, 140.0])
+    assert index.tolist() == [0, 0]
+
+
+def test_weld_pairs_drop_missing_and_repeated_welds():
+    aligned = pd.DataFrame({
+        "id": [1, 2, 3, 4, 5],
+        "r_a__distance": [0.0, 40.0, 80.0, 120.0, 160.0],
+        "r_b__distance": [1.0, np.nan, 82.0, 82.0, 163.0],
+    })
+
+    run, ref, ids = feature_correction.weld_pairs(aligned, "r_b__distance", "r_a__distance")
+
+    np.testing.assert_array_equal(run, [1.0, 82.0, 163.0])
+    np.testing.assert_array_equal(ref, [0.0, 80.0, 160.0])
+    assert ids.tolist() == [1, 3, 5]
+
+
+def test_correct_features_places_rows_between_matched_welds():
+    aligned = pd.DataFrame({
+        "id": [1, 2, 3],
+        "r_2007_weld_aligned__distance": REF_WELDS,
+        "r_2015_weld_aligned__distance": RUN_WELDS,
+    })
+    extracted = {
+        "r_2007_metal_loss_aligned": pd.DataFrame({schema.DISTANCE: [120.0], schema.UPSTREAM: [10.0]}),
+        "r_2015_metal_loss_aligned": pd.DataFrame({schema.DISTANCE: [120.0, 160.3], schema.UPSTREAM: [20.0, 20.0]}),
+        "r_2030_metal_loss_aligned": pd.DataFrame({schema.DISTANCE: [1.0]}),
+    }
+
+    corrected = feature_correction.correct_features(aligned, extracted)
+
+    assert sorted(corrected) == ["r_2007_metal_loss_corrected", "r_2015_metal_loss_corrected"]
+    # The reference run maps onto itself
+    np.testing.assert_allclose(corrected["r_2007_metal_loss_corrected"]["distance_corrected"], [120.0])
+    run = corrected["r_2015_metal_loss_corrected"]
+    np.testing.assert_allclose(run["distance_corrected"], [120.0, 150.0])
+    assert run["weld_id"].tolist() == [1, 2]
@@ -0,0 +1,112 @@
+"""Metal-loss matching and growth between runs (model/growth.py)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import growth
+from pre_processing import pipeline, schema
+
+
+def _features(weld_id, distance, clock, depth):
+    n = len(weld_id)
+    return pd.DataFrame({
+        "weld_id": weld_id,
+        "distance_corrected": distance,
+        "clock [deg]": clock,
+        schema.DEPTH: depth,
+        schema.LENGTH: np.full(n, 2.0),
+        schema.WIDTH: np.full(n, 1.0),
+    })
+
+
+# 2015 and 2022 inspections; every 2022 row notes what it should match in 2015
+EARLIER = _features(
+    weld_id=[1, 1, 2, 1, 1, 3],
+    distance=[10.0, 20.0, 5.0, 40.0, 60.5, 80.0],
+    clock=[90.0, 90.0, 90.0, 180.0, 0.0, 350.0],
+    depth=[20.0, 30.0, 10.0, 40.0, 50.0, 82.0],
+)
+LATER = _features(
+    weld_id=[1, 1, 3, 1, 1, 1, 3],
+    distance=[10.5, 20.2, 5.0, 39.5, 41.5, 60.0, 80.0],
+    clock=[100.0, 270.0, 90.0, 180.0, 180.0, np.nan, 10.0],
+    depth=[34.0, 31.0, 12.0, 47.0, 45.0, 43.0, 85.0],
+)
+EXPECTED = [
+    0,  # same joint, 0.5 ft and 10 degrees away
+    -1,  # 180 degrees around the pipe
+    -1,  # the 2015 feature at 5 ft is in another joint
+    3,  # the closer of two 2022 features keeps the 2015 one
+    -1,
+    4,  # no clock in 2022: matched on distance alone
+    5,  # 350 and 10 degrees are 20 degrees apart
+]
+
+
+def test_match_features():
+    matched = growth.match_features(EARLIER, LATER)
+
+    assert matched.tolist() == EXPECTED
+
+
+def test_match_features_tolerances():
+    assert growth.match_features(EARLIER, LATER, tolerance=0.2).tolist() == [-1, -1, -1, -1, -1, -1, 5]
+    assert growth.match_features(EARLIER, LATER, clock_tolerance=5.0)[[0, 6]].tolist() == [-1, -1]
+
+
+def test_compute_growth():
+    tables = growth.compute_growth({
+        "r_2022_metal_loss_corrected": LATER,
+        "r_2015_metal_loss_corrected": EARLIER,
+        "r_2015_dent_corrected": EARLIER.iloc[:1],
+    })
+
+    rows = tables[growth.FEATURE_STEM]
+    np.testing.assert_allclose(rows["r_2015__depth"], [20.0, np.nan, np.nan, 40.0, np.nan, 50.0, 82.0])
+    np.testing.assert_allclose(rows["r_2022__depth"], LATER[schema.DEPTH])
+    assert rows["matched_runs"].tolist() == [2, 1, 1, 2, 1, 2, 2]
+    # 14, 7, -7 and 3 % over the 7 years between the runs; unmatched features have no rate
+    np.testing.assert_allclose(
+        rows["depth_rate [%/yr]"], [2.0, np.nan, np.nan, 1.0, np.nan, -1.0, 3.0 / 7.0]
+    )
+    np.testing.assert_allclose(rows["length_rate [in/yr]"], [0.0, np.nan, np.nan, 0.0, np.nan, 0.0, 0.0])
+    # (80 - 34) / 2 and (80 - 47) / 1 years; not growing; already past 80 %
+    np.testing.assert_allclose(rows["years_to_critical"], [23.0, np.nan, np.nan, 33.0, np.nan, np.inf, 0.0])
+
+    joints = tables[growth.JOINT_STEM].set_index("weld_id")
+    assert joints["features"].to_dict() == {1: 5, 3: 2}
+    assert joints.loc[1, f"max {schema.DEPTH}"] == 47.0
+    assert joints.loc[1, "max depth_rate [%/yr]"] == 2.0
+    assert joints.loc[1, "min_years_to_critical"] == 23.0
+
+
+def test_compute_growth_needs_two_runs():
+    with pytest.raises(ValueError, match="at least two runs"):
+        growth.compute_growth({"r_2022_metal_loss_corrected": LATER})
+
+
+def test_span_rates_use_the_longest_measured_span():
+    values = np.array([
+        [10.0, np.nan, 20.0],
+        [np.nan, 10.0, 12.0],
+        [10.0, 13.0, np.nan],
+        [5.0, np.nan, np.nan],
+        [np.nan, np.nan, np.nan],
+    ])
+
+    rates = growth.span_rates(values, np.array([2007.0, 2015.0, 2022.0]))
+
+    np.testing.assert_allclose(rates, [10.0 / 15.0, 2.0 / 7.0, 3.0 / 8.0, np.nan, np.nan])
+
+
+def test_years_to_critical():
+    depth = np.array([40.0, 40.0, 40.0, 80.0, 90.0, np.nan, 40.0])
+    rate = np.array([4.0, 0.0, -1.0, 2.0, 0.0, 1.0, np.nan])
+
+    years = growth.years_to_critical(depth, rate, critical=80.0)
+
+    np.testing.assert_allclose(years, [10.0, np.inf, np.inf, 0.0, 0.0, np.nan, np.nan])
+
+
+def test_growth_folder_is_the_pipeline_stage_folder():
+    assert growth.GROWTH_FOLDER == pipeline.stage_context()["growth"]
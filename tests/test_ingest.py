@@ -0,0 +1,50 @@
+"""Cached workbook conversion (full_pipeline.ingest_cached)."""
+import os
+import shutil
+
+import openpyxl
+import pytest
+
+from full_pipeline import ingest_cached
+from pre_processing import storage
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "ili.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active.title = "Summary"
+    wb.active.append(["Run", "Year"])
+    wb.active.append(["r_2007", 2007])
+    sheet = wb.create_sheet("2007")
+    sheet.append(["Log Dist. [ft]", "Event Description"])
+    for distance in (0.0, 40.0, 80.0):
+        sheet.append([distance, "Girth Weld"])
+    wb.save(path)
+    return path
+
+
+def test_cache_hit_skips_conversion(workbook, tmp_path, capsys):
+    data_folder, cache_folder = str(tmp_path / "data"), str(tmp_path / ".cache")
+    first = ingest_cached(workbook, data_folder, cache_folder, "csv")
+    run = storage.artifact_path(data_folder, "r_2007", "csv")
+    written = os.stat(run).st_mtime_ns
+
+    assert ingest_cached(workbook, data_folder, cache_folder, "csv") == first
+    assert os.stat(run).st_mtime_ns == written
+    assert "Workbook unchanged; using raw data" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("remove", ["folder", "run"])
+def test_deleted_artifacts_are_converted_again(workbook, tmp_path, capsys, remove):
+    data_folder, cache_folder = str(tmp_path / "data"), str(tmp_path / ".cache")
+    first = ingest_cached(workbook, data_folder, cache_folder, "csv")
+    if remove == "folder":
+        shutil.rmtree(data_folder)
+    else:
+        os.remove(storage.artifact_path(data_folder, "r_2007", "csv"))
+
+    assert ingest_cached(workbook, data_folder, cache_folder, "csv") == first
+    assert "missing from" in capsys.readouterr().out
+    assert storage.read_frame(storage.artifact_path(data_folder, "r_2007", "csv")).shape == (3, 2)
+    assert os.path.exists(storage.artifact_path(data_folder, "summary", "csv"))
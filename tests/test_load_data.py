@@ -0,0 +1,71 @@
+"""Streaming workbook sheets into frames (data/load_data.py)."""
+import datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Font
+
+from data import load_data
+
+HEADER = ["Log Dist. [ft]", "Event Description", "Depth [%]", "Comments", "Date", None, "Depth [%]"]
+
+
+def _rows():
+    """Rows whose columns change type along the sheet, so chunks infer them differently."""
+    rows = []
+    for i in range(40):
+        rows.append([
+            float(i) * 40.5,
+            "Girth Weld" if i % 3 else "Metal Loss",
+            None if i % 4 else i,  # integers with blanks
+            "check" if i >= 30 else None,  # blank in the first chunks only
+            datetime.datetime(2007, 1, 1) + datetime.timedelta(days=i) if i < 10 else None,
+            None,
+            i,
+        ])
+    rows[12] = [None] * len(HEADER)  # an empty row inside the data is kept
+    return rows
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = str(tmp_path / "ili.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "2007"
+    ws.append(HEADER)
+    for row in _rows():
+        ws.append(row)
+    # Styled empty cells make the sheet report trailing rows without values
+    for row in range(ws.max_row + 1, ws.max_row + 4):
+        ws.cell(row=row, column=1).font = Font(bold=True)
+    wb.save(path)
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    yield wb["2007"]
+    wb.close()
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 13, 40, 1000])
+def test_chunked_sheet_matches_one_conversion(sheet, chunk_rows):
+    expected = pd.DataFrame.from_records(_rows(), columns=load_data._header_names(HEADER))
+
+    df = load_data._sheet_to_frame(sheet, chunk_rows)
+
+    pd.testing.assert_frame_equal(df, expected)
+    assert list(df.columns)[-2:] == ["Unnamed: 5", "Depth [%].1"]
+
+
+def test_header_only_sheet(tmp_path):
+    path = str(tmp_path / "empty.xlsx")
+    wb = openpyxl.Workbook()
+    wb.active.append(["a", "b"])
+    wb.save(path)
+
+    wb = openpyxl.load_workbook(path, read_only=True)
+    df = load_data._sheet_to_frame(wb.active, 5)
+    wb.close()
+
+    assert list(df.columns) == ["a", "b"]
+    assert len(df) == 0
@@ -0,0 +1,80 @@
+"""Iterative weld matching (align._refine_match) against a known injected drift."""
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data import synthetic
+from pre_processing import align, pipeline, schema
+
+TOLERANCE = 5.0
+
+
+def _drift(x, length):
+    """Injected drift (ft): 1.5 periods of an 8 ft sine, well beyond the tolerance."""
+    return 8.0 * np.sin(3.0 * np.pi * x / length)
+
+
+@pytest.fixture(scope="module")
+def line():
+    """
+    Reference welds of a synthetic run and the same welds measured again through the
+    injected drift, with noise and 2% missed welds. Run weld j is reference weld truth[j].
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = pipeline.run_pipeline(
+            raw_runs=synthetic.generate_runs(4000, seed=5), stages=["preprocess", "extract"], use_cache=False
+        )
+    welds = next(iter(align.select_welds(state["extracted"]).values()))
+    ref = align._prepare(welds, "r_a")
+    x = ref["distance_ft"].to_numpy()
+
+    rng = np.random.default_rng(0)
+    truth = np.flatnonzero(rng.random(len(x)) > 0.02)
+    measured = x[truth] + _drift(x[truth], x[-1]) + rng.normal(0.0, 0.2, len(truth))
+    run = align._prepare(pd.DataFrame({schema.DISTANCE: measured}), "r_b")
+    run["_row"] = np.arange(len(run))
+    return ref, run, truth
+
+
+def _score(matched, ref, run, truth):
+    """Share of reference welds correctly matched, and the 95th percentile error of the matched pairs."""
+    rows = matched["_row"].to_numpy()
+    valid = ~np.isnan(rows)
+    rows = rows[valid].astype("int64")
+    x = ref["distance_ft"].to_numpy()[valid]
+    correct = (truth[rows] == np.flatnonzero(valid)).sum() / len(truth)
+    error = np.abs(run["r_b__distance"].to_numpy()[rows] - x - _drift(x, ref["distance_ft"].iloc[-1]))
+    return correct, np.percentile(error, 95)
+
+
+def test_refined_match_beats_nearest(line):
+    ref, run, truth = line
+
+    nearest = align._merge(ref, run, TOLERANCE)
+    refined, iterations = align._refine_match(ref, run, "r_b", TOLERANCE)
+
+    nearest_correct, nearest_error = _score(nearest, ref, run, truth)
+    refined_correct, refined_error = _score(refined, ref, run, truth)
+    # Plain matching only finds the welds where the drift is within the tolerance
+    assert nearest_correct < 0.6
+    assert refined_correct == 1.0
+    assert refined_error < nearest_error
+    assert refined["_row"].notna().sum() > nearest["_row"].notna().sum()
+
+    # Converged before the cap, the matched count growing as the fitted drift spreads
+    assert 1 < len(iterations) < align.MAX_ITERATIONS
+    matched = [record["matched"] for record in iterations]
+    assert matched == sorted(matched)
+    assert all(record["next_tolerance"] <= record["tolerance"] for record in iterations)
+
+
+def test_refinement_stops_at_the_iteration_cap(line, monkeypatch):
+    ref, run, _ = line
+    monkeypatch.setattr(align, "MAX_ITERATIONS", 2)
+
+    _, iterations = align._refine_match(ref, run, "r_b", TOLERANCE)
+
+    assert [record["iteration"] for record in iterations] == [1, 2]
@@ -0,0 +1,88 @@
+"""Completion markers (checkpoint.py) and resuming a stopped run (pipeline.run_pipeline)."""
+import os
+
+import pytest
+
+from data import synthetic
+from pre_processing import checkpoint, pipeline
+
+
+def test_marker_tracks_fingerprint_and_outputs(tmp_path):
+    output = tmp_path / "out.csv"
+    output.write_text("a\n1\n")
+    folder = str(tmp_path / "checkpoints")
+
+    assert not checkpoint.is_complete(folder, "align", "abc")
+    checkpoint.mark_complete(folder, "align", "abc", [str(output)])
+    assert checkpoint.is_complete(folder, "align", "abc")
+    assert not checkpoint.is_complete(folder, "align", "def")
+
+    output.write_text("a\n2\n3\n")
+    assert not checkpoint.is_complete(folder, "align", "abc")
+
+
+def test_missing_output_or_cleared_marker_is_incomplete(tmp_path):
+    output = tmp_path / "out.csv"
+    output.write_text("a\n1\n")
+    folder = str(tmp_path / "checkpoints")
+
+    checkpoint.mark_complete(folder, "align", "abc", [str(output)])
+    output.unlink()
+    assert not checkpoint.is_complete(folder, "align", "abc")
+
+    checkpoint.clear(folder, "align")
+    assert checkpoint.read_marker(folder, "align") is None
+
+
+def test_unreadable_marker_is_incomplete(tmp_path):
+    folder = tmp_path / "checkpoints"
+    folder.mkdir()
+    (folder / "align.json").write_text("{not json")
+
+    assert checkpoint.read_marker(str(folder), "align") is None
+    assert not checkpoint.is_complete(str(folder), "align", "abc")
+
+
+@pytest.fixture
+def line(tmp_path):
+    """Synthetic raw runs in <tmp>/data and an empty pipeline output folder."""
+    data_folder = str(tmp_path / "data")
+    synthetic.write_runs(synthetic.generate_runs(300, seed=3), data_folder)
+    return data_folder, str(tmp_path / "pipeline")
+
+
+def _run(line, **kwargs):
+    data_folder, output_folder = line
+    return pipeline.run_pipeline(
+        write=True, data_folder=data_folder, output_folder=output_folder, use_cache=False, **kwargs
+    )
+
+
+def test_resume_restarts_from_the_failed_stage(line, monkeypatch):
+    correct = next(stage for stage in pipeline.STAGES if stage["name"] == "correct")
+
+    def fail(value, ctx):
+        raise RuntimeError("stopped")
+
+    monkeypatch.setitem(correct, "run", fail)
+    with pytest.raises(RuntimeError, match="stopped"):
+        _run(line)
+    monkeypatch.undo()
+
+    state = _run(line, resume=True)
+    assert state["report"]["resumed"] == ["preprocess", "extract", "align"]
+    assert [record["name"] for record in state["report"]["stages"]] == ["correct", "features", "growth"]
+
+    state = _run(line, resume=True)
+    assert state["report"]["resumed"] == pipeline.STAGE_NAMES
+
+
+def test_touched_output_reruns_from_its_stage(line):
+    _run(line)
+    ctx = pipeline.stage_context(line[1], line[0])
+    aligned = next(iter(pipeline._aligned_files(ctx)))
+    info = os.stat(aligned)
+    os.utime(aligned, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+
+    state = _run(line, resume=True)
+    assert state["report"]["resumed"] == ["preprocess", "extract"]
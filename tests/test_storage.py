@@ -0,0 +1,105 @@
+"""Typed columnar artifacts (storage.py)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pre_processing import storage
+
+
+def _mixed_frame(n=1000):
+    rng = np.random.default_rng(0)
+    distance = rng.uniform(0, 1e5, n)
+    distance[::7] = np.nan
+    label = pd.Series(rng.choice(["Girth Weld", "Metal Loss", "Dent"], n), dtype=object)
+    label[::11] = None
+    return pd.DataFrame({
+        "id": np.arange(n, dtype="int64"),
+        "distance": distance,
+        "depth": rng.uniform(0, 80, n).astype("float32"),
+        "small": rng.integers(0, 100, n).astype("int8"),
+        "flag": rng.random(n) > 0.5,
+        "label": label,
+        "kind": pd.Categorical(rng.choice(["weld", "metal_loss"], n)),
+        "count": pd.array(np.where(rng.random(n) > 0.2, rng.integers(0, 9, n), None), dtype="Int64"),
+        "seen": pd.to_datetime("2015-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+    })
+
+
+def test_npz_round_trip_keeps_dtypes_nan_and_text(tmp_path):
+    df = _mixed_frame()
+    path = storage.artifact_path(tmp_path, "mixed", "npz")
+
+    storage.write_frame(df, path)
+
+    pd.testing.assert_frame_equal(storage.read_frame(path), df)
+    assert storage.read_columns(path) == list(df.columns)
+
+
+def test_npz_reads_a_subset_of_columns(tmp_path):
+    df = _mixed_frame()
+    path = storage.artifact_path(tmp_path, "mixed", "npz")
+    storage.write_frame(df, path)
+
+    subset = storage.read_frame(path, columns=["label", "distance"])
+
+    pd.testing.assert_frame_equal(subset, df[["distance", "label"]])
+    with pytest.raises(KeyError):
+        storage.read_frame(path, columns=["missing"])
+
+
+def test_csv_round_trip_keeps_values(tmp_path):
+    df = _mixed_frame()[["id", "distance", "label"]]
+    path = storage.artifact_path(tmp_path, "mixed", "csv")
+
+    storage.write_frame(df, path)
+    back = storage.read_frame(path, dtypes={"label": "object"})
+
+    np.testing.assert_array_equal(back["id"], df["id"])
+    np.testing.assert_allclose(back["distance"], df["distance"])
+    assert back["label"].isna().equals(df["label"].isna())
+
+
+@pytest.mark.parametrize("fmt", storage.FORMATS)
+def test_chunks_match_the_whole_frame(tmp_path, fmt):
+    df = _mixed_frame()[["id", "distance", "depth", "label"]]
+    path = storage.artifact_path(tmp_path, "chunked", fmt)
+    storage.write_frame(df, path)
+
+    chunks = list(storage.iter_chunks(path, 128))
+
+    assert [len(chunk) for chunk in chunks[:-1]] == [128] * (len(chunks) - 1)
+    assert chunks[1].index[0] == 128
+    whole = pd.concat(chunks)
+    if fmt == "npz":
+        pd.testing.assert_frame_equal(whole, df)
+    else:
+        np.testing.assert_allclose(whole["distance"], df["distance"])
+
+
+def test_chunk_writer_shares_text_dictionary_across_chunks(tmp_path):
+    df = _mixed_frame()[["id", "distance", "label"]]
+    # A chunk whose text column is entirely empty comes in as floats
+    empty = pd.DataFrame({"id": np.arange(3), "distance": np.ones(3), "label": np.full(3, np.nan)})
+    path = storage.artifact_path(tmp_path, "written", "npz")
+
+    with storage.ChunkWriter(path) as writer:
+        for start in range(0, len(df), 300):
+            writer.append(df.iloc[start:start + 300])
+        writer.append(empty)
+
+    expected = pd.concat([df, empty.astype({"label": object}).replace({np.nan: None})], ignore_index=True)
+    back = storage.read_frame(path)
+    assert len(back) == len(expected)
+    assert back["label"].tolist() == expected["label"].tolist()
+    np.testing.assert_allclose(back["distance"], expected["distance"])
+
+
+def test_failed_write_leaves_no_artifact(tmp_path):
+    path = storage.artifact_path(tmp_path, "broken", "npz")
+
+    with pytest.raises(RuntimeError):
+        with storage.ChunkWriter(path) as writer:
+            writer.append(_mixed_frame(10))
+            raise RuntimeError("interrupted")
+
+    assert list(tmp_path.iterdir()) == []